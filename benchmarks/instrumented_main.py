@@ -0,0 +1,40 @@
+"""
+Run mavedb_lookup.py's main command, recording the latency of every API request.
+
+The latencies, in seconds, are written as a JSON list to the file named by the BENCHMARK_LATENCY_FILE environment
+variable when the command exits.
+"""
+
+import atexit
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import api_client  # noqa: E402
+import mavedb_lookup  # noqa: E402
+
+latencies: list[float] = []
+untimed_request = api_client.ApiClient.request
+
+
+def timed_request(self, method, url, **kwargs):
+    start = time.perf_counter()
+    try:
+        return untimed_request(self, method, url, **kwargs)
+    finally:
+        latencies.append(time.perf_counter() - start)
+
+
+def write_latencies():
+    with open(os.environ["BENCHMARK_LATENCY_FILE"], mode="w") as latency_file:
+        json.dump(latencies, latency_file)
+
+
+api_client.ApiClient.request = timed_request
+atexit.register(write_latencies)
+
+if __name__ == "__main__":
+    mavedb_lookup.main()
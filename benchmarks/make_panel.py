@@ -0,0 +1,65 @@
+"""
+Generate synthetic input panels of HGVS strings for benchmarking.
+"""
+
+import csv
+import random
+from typing import Iterator
+
+import click
+
+CHROMOSOME_ACCESSIONS = [
+    "NC_000001.11",
+    "NC_000002.12",
+    "NC_000007.14",
+    "NC_000011.10",
+    "NC_000013.11",
+    "NC_000017.11",
+    "NC_000023.11",
+]
+
+BASES = "ACGT"
+
+
+def generate_panel(
+    rows: int, duplicate_rate: float = 0.05, protein_rate: float = 0.1, seed: int = 0
+) -> Iterator[str]:
+    """
+    Generate a panel of HGVS strings: mostly genomic substitutions, some protein variants, and some repeats of
+    earlier rows. The same arguments always produce the same panel.
+    """
+    rng = random.Random(seed)
+    generated: list[str] = []
+    for _ in range(rows):
+        if generated and rng.random() < duplicate_rate:
+            hgvs = rng.choice(generated)
+        elif rng.random() < protein_rate:
+            hgvs = f"NP_{rng.randrange(1000):06d}.1:p.Ala{rng.randrange(1, 1700)}Thr"
+        else:
+            ref = rng.choice(BASES)
+            alt = rng.choice(BASES.replace(ref, ""))
+            hgvs = (
+                f"{rng.choice(CHROMOSOME_ACCESSIONS)}:g.{rng.randrange(1, 150000000)}{ref}>{alt}"
+            )
+        generated.append(hgvs)
+        yield hgvs
+
+
+def write_panel(path: str, rows: int, seed: int = 0):
+    with open(path, mode="w", newline="") as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(["hgvs"])
+        for hgvs in generate_panel(rows, seed=seed):
+            writer.writerow([hgvs])
+
+
+@click.command()
+@click.argument("output_csv")
+@click.option("--rows", type=click.IntRange(min=1), default=1000)
+@click.option("--seed", type=int, default=0)
+def main(output_csv: str, rows: int, seed: int):
+    write_panel(output_csv, rows, seed)
+
+
+if __name__ == "__main__":
+    main()
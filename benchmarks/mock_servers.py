@@ -0,0 +1,434 @@
+"""
+Local stand-ins for the ClinGen Allele Registry and MaveDB APIs, for benchmarking.
+
+Responses are generated deterministically from the request, so every run with the same configuration sees the same
+data. Latency, error rates and payload sizes are configurable.
+"""
+
+import csv
+import io
+import json
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, unquote, urlparse
+
+import click
+
+
+@dataclass
+class MockConfig:
+    # Time taken to answer each request, in seconds, plus a random jitter of up to latency_jitter seconds.
+    latency: float = 0.05
+    latency_jitter: float = 0.0
+    # Fraction of requests answered with a 429 or 503 response, which clients are expected to retry.
+    error_rate: float = 0.0
+    # Fraction of HGVS strings that ClinGen cannot resolve.
+    unresolvable_rate: float = 0.02
+    # Fraction of allele IDs without any measurements in MaveDB.
+    unmeasured_rate: float = 0.3
+    score_set_count: int = 50
+    measurements_per_allele: int = 2
+    # Number of distinct ClinGen alleles. Whole-score-set tables list every allele's measurements, so they are only
+    # practical with a few thousand alleles.
+    allele_count: int = 10000000
+    # Bytes of padding added to each score set, to mimic large score set records.
+    score_set_padding: int = 20000
+
+
+def stable_hash(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def clingen_allele(hgvs: str, config: MockConfig) -> Any:
+    """
+    Generate the ClinGen allele that an HGVS string resolves to, or None if it is unresolvable.
+    """
+    h = stable_hash(hgvs)
+    if (h % 10000) < config.unresolvable_rate * 10000:
+        return None
+    allele: dict[str, Any] = {"@id": f"http://reg.genome.network/allele/CA{h % config.allele_count}"}
+    # Genomic variants have a MANE transcript, whose HGVS strings resolve to other alleles.
+    if ":g." in hgvs:
+        allele["transcriptAlleles"] = [
+            {
+                "MANE": {
+                    "maneStatus": "MANE Select",
+                    "nucleotide": {
+                        "RefSeq": {"hgvs": f"NM_{h % 1000:06d}.1:c.{h % 5000 + 1}A>G"}
+                    },
+                    "protein": {
+                        "RefSeq": {"hgvs": f"NP_{h % 1000:06d}.1:p.Ala{h % 1700 + 1}Thr"}
+                    },
+                }
+            }
+        ]
+    return allele
+
+
+def score_set_urn(index: int) -> str:
+    return f"urn:mavedb:{index:08d}-a-1"
+
+
+def score_set_index(urn: str) -> int | None:
+    try:
+        return int(urn.split(":")[2].split("-")[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def mapped_variant_measurements(clingen_allele_id: str, config: MockConfig) -> list[tuple[int, int, Any]]:
+    """
+    Generate an allele's variant effect measurements, each with the index of its score set and the ID of its mapped
+    variant. Measurements are in mapped variant ID order, which is score set order.
+    """
+    h = stable_hash(clingen_allele_id)
+    if (h % 10000) < config.unmeasured_rate * 10000:
+        return []
+    allele_number = int(clingen_allele_id[2:]) if clingen_allele_id[2:].isdigit() else h
+    measurements = []
+    for k in range(config.measurements_per_allele):
+        index = (h + k) % config.score_set_count
+        urn = score_set_urn(index)
+        score = ((h >> 8) % 4000) / 1000 - 2
+        variant_number = allele_number * config.measurements_per_allele + k
+        measurements.append(
+            (
+                index,
+                index * config.allele_count * config.measurements_per_allele + variant_number,
+                {
+                    "urn": f"{urn}#{variant_number}",
+                    "data": {
+                        "score_data": {"score": score, "sd": 0.1},
+                        "count_data": {"c_0": h % 500, "c_1": (h >> 4) % 500},
+                    },
+                    "scoreSet": {"urn": urn, "modificationDate": "2024-01-01"},
+                },
+            )
+        )
+    measurements.sort(key=lambda measurement: measurement[1])
+    return measurements
+
+
+def variant_effect_measurements(clingen_allele_id: str, config: MockConfig) -> list[Any]:
+    return [
+        measurement
+        for _, _, measurement in mapped_variant_measurements(clingen_allele_id, config)
+    ]
+
+
+def score_set_variants(index: int, config: MockConfig) -> list[tuple[int, str, Any]]:
+    """
+    Generate every variant of a score set, with its mapped variant ID and ClinGen allele ID, by enumerating all the
+    alleles.
+    """
+    variants = []
+    for allele_number in range(config.allele_count):
+        clingen_allele_id = f"CA{allele_number}"
+        for measurement_index, mapped_variant_id, measurement in mapped_variant_measurements(
+            clingen_allele_id, config
+        ):
+            if measurement_index == index:
+                variants.append((mapped_variant_id, clingen_allele_id, measurement))
+    return variants
+
+
+def score_set_table_csv(variants: list[tuple[int, str, Any]], data_key: str) -> str:
+    """
+    Write the scores or counts of a score set's variants as a MaveDB CSV export.
+    """
+    column_names = list(variants[0][2]["data"][data_key]) if variants else []
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(["accession", "hgvs_nt", "hgvs_splice", "hgvs_pro", *column_names])
+    for _, _, measurement in variants:
+        values = measurement["data"][data_key]
+        writer.writerow(
+            [measurement["urn"], "NA", "NA", "NA", *(values[name] for name in column_names)]
+        )
+    return output.getvalue()
+
+
+def score_set(urn: str, config: MockConfig) -> Any:
+    return {
+        "urn": urn,
+        "title": f"Deep mutational scan {urn}",
+        "shortDescription": "Synthetic score set for benchmarking.",
+        "publishedDate": "2024-01-01",
+        "modificationDate": "2024-01-01",
+        "primaryPublicationIdentifiers": [
+            {
+                "dbName": "PubMed",
+                "identifier": str(stable_hash(urn) % 40000000),
+                "authors": [{"name": "Author A", "primary": True}],
+                "publicationYear": 2024,
+                "publicationJournal": "Journal",
+            }
+        ],
+        "experiment": {
+            "urn": urn.rsplit("-", 1)[0],
+            "title": "Synthetic experiment",
+            "shortDescription": "Synthetic experiment for benchmarking.",
+            "keywords": [
+                {
+                    "keyword": {
+                        "key": "Variant Library Creation Method",
+                        "label": "Endogenous locus library method",
+                    }
+                },
+                {"keyword": {"key": "Delivery method", "label": "Electroporation"}},
+                {"keyword": {"key": "Phenotypic Assay Method", "label": "Cell fitness"}},
+            ],
+        },
+        "scoreCalibrations": [
+            {
+                "primary": True,
+                "researchUseOnly": False,
+                "threshold_sources": [{"dbName": "PubMed", "identifier": "1"}],
+                "functionalRanges": [
+                    {
+                        "label": "Abnormal",
+                        "classification": "abnormal",
+                        "range": [None, -1.0],
+                        "inclusiveUpperBound": True,
+                        "oddspaths_ratio": 20.0,
+                        "acmg_classification": {"criterion": "PS3", "evidence_strength": "strong"},
+                    },
+                    {
+                        "label": "Normal",
+                        "classification": "normal",
+                        "range": [-0.5, None],
+                        "inclusiveLowerBound": True,
+                        "oddspaths_ratio": 0.1,
+                        "acmg_classification": {"criterion": "BS3", "evidence_strength": "strong"},
+                    },
+                ],
+            }
+        ],
+        "padding": "x" * config.score_set_padding,
+    }
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send each response's headers and body together, without waiting for delayed acknowledgements, so that the
+    # mock adds no latency of its own.
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+    server: "MockApiServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, value: Any, status: int = 200):
+        self.send_body(json.dumps(value).encode("utf-8"), "application/json", status)
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.record(self.command, urlparse(self.path).path, len(body))
+
+    def handle_request(self, body: bytes):
+        config = self.server.config
+        time.sleep(config.latency + random.random() * config.latency_jitter)
+        if random.random() < config.error_rate:
+            self.server.record_error()
+            self.send_response(random.choice([429, 503]))
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        url = urlparse(self.path)
+        if self.server.api == "clingen":
+            if self.command == "GET" and url.path == "/allele":
+                allele = clingen_allele(parse_qs(url.query)["hgvs"][0], config)
+                if allele is None:
+                    return self.send_json({"errorType": "HgvsParsingError"}, 400)
+                return self.send_json(allele)
+            if self.command == "POST" and url.path == "/alleles":
+                return self.send_json(
+                    [
+                        clingen_allele(line, config)
+                        or {"errorType": "HgvsParsingError", "inputLine": line}
+                        for line in body.decode("utf-8").splitlines()
+                    ]
+                )
+        else:
+            if self.command == "GET" and url.path.startswith("/score-sets/"):
+                urn, _, resource = unquote(url.path[len("/score-sets/") :]).partition("/")
+                index = score_set_index(urn)
+                if not resource:
+                    return self.send_json(score_set(urn, config))
+                if index is not None and index < config.score_set_count:
+                    variants = self.server.score_set_variants(index)
+                    if resource == "scores":
+                        return self.send_body(
+                            score_set_table_csv(variants, "score_data").encode("utf-8"), "text/csv"
+                        )
+                    if resource == "counts":
+                        return self.send_body(
+                            score_set_table_csv(variants, "count_data").encode("utf-8"), "text/csv"
+                        )
+                    if resource == "mapped-variants":
+                        return self.send_json(
+                            [
+                                {
+                                    "id": mapped_variant_id,
+                                    "variantUrn": measurement["urn"],
+                                    "clingenAlleleId": clingen_allele_id,
+                                    "current": True,
+                                }
+                                for mapped_variant_id, clingen_allele_id, measurement in variants
+                            ]
+                        )
+            if (
+                self.command == "POST"
+                and url.path == "/variants/clingen-allele-id-lookups"
+            ):
+                clingen_allele_ids = json.loads(body)["clingenAlleleIds"]
+                return self.send_json(
+                    [
+                        {
+                            "clingenAlleleId": clingen_allele_id,
+                            "exactMatch": {
+                                "variantEffectMeasurements": variant_effect_measurements(
+                                    clingen_allele_id, config
+                                )
+                            },
+                        }
+                        for clingen_allele_id in clingen_allele_ids
+                    ]
+                )
+        self.send_json({"detail": "Not found"}, 404)
+
+    def do_GET(self):
+        self.handle_request(b"")
+
+    def do_POST(self):
+        self.handle_request(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+
+class MockApiServer(ThreadingHTTPServer):
+    """
+    A mock of one API ("clingen" or "mavedb"), which counts the requests it answers.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, api: str, config: MockConfig, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), MockApiHandler)
+        self.api = api
+        self.config = config
+        self._lock = threading.Lock()
+        self._score_set_variants: dict[int, list[tuple[int, str, Any]]] = {}
+        self.reset_stats()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def score_set_variants(self, index: int) -> list[tuple[int, str, Any]]:
+        # Score set tables are slow to generate, and each one is requested three times.
+        with self._lock:
+            variants = self._score_set_variants.get(index)
+        if variants is None:
+            variants = score_set_variants(index, self.config)
+            with self._lock:
+                self._score_set_variants[index] = variants
+        return variants
+
+    def record(self, method: str, path: str, size: int):
+        if path.startswith("/score-sets/"):
+            _, _, resource = path[len("/score-sets/") :].partition("/")
+            path = f"/score-sets/{{urn}}/{resource}" if resource else "/score-sets/{urn}"
+        endpoint = f"{method} {path}"
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.bytes_sent += size
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests: dict[str, int] = {}
+            self.errors = 0
+            self.bytes_sent = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "total_requests": sum(self.requests.values()) + self.errors,
+                "errors": self.errors,
+                "bytes_sent": self.bytes_sent,
+            }
+
+    def start(self) -> "MockApiServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1")
+@click.option("--clingen-port", type=int, default=8001)
+@click.option("--mavedb-port", type=int, default=8002)
+@click.option("--latency-ms", type=click.FloatRange(min=0), default=50.0)
+@click.option("--latency-jitter-ms", type=click.FloatRange(min=0), default=0.0)
+@click.option("--error-rate", type=click.FloatRange(min=0, max=1), default=0.0)
+@click.option("--score-set-count", type=click.IntRange(min=1), default=50)
+@click.option("--measurements-per-allele", type=click.IntRange(min=0), default=2)
+@click.option("--score-set-padding", type=click.IntRange(min=0), default=20000, help="In bytes.")
+@click.option(
+    "--allele-count",
+    type=click.IntRange(min=1),
+    default=10000000,
+    help="Number of distinct ClinGen alleles. Keep it small when score set tables are requested.",
+)
+def main(
+    host: str,
+    clingen_port: int,
+    mavedb_port: int,
+    latency_ms: float,
+    latency_jitter_ms: float,
+    error_rate: float,
+    score_set_count: int,
+    measurements_per_allele: int,
+    score_set_padding: int,
+    allele_count: int,
+):
+    """
+    Serve mock ClinGen and MaveDB APIs until interrupted.
+    """
+    config = MockConfig(
+        latency=latency_ms / 1000,
+        latency_jitter=latency_jitter_ms / 1000,
+        error_rate=error_rate,
+        score_set_count=score_set_count,
+        measurements_per_allele=measurements_per_allele,
+        score_set_padding=score_set_padding,
+        allele_count=allele_count,
+    )
+    clingen_server = MockApiServer("clingen", config, host, clingen_port).start()
+    mavedb_server = MockApiServer("mavedb", config, host, mavedb_port)
+    click.echo(f"ClinGen: {clingen_server.url}", err=True)
+    click.echo(f"MaveDB: {mavedb_server.url}", err=True)
+    try:
+        mavedb_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
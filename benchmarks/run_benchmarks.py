@@ -0,0 +1,191 @@
+"""
+Benchmark mavedb_lookup.py against local mock APIs.
+
+For each panel size, a synthetic panel is generated (once; panels are reused by later runs), the lookup is run in
+a separate process against mock ClinGen and MaveDB servers, and its throughput, request count, request latency and
+peak memory use are reported. Arguments after "--" are passed on to mavedb_lookup.py.
+"""
+
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Any
+
+import click
+
+from make_panel import write_panel
+from mock_servers import MockApiServer, MockConfig
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """
+    The p-th percentile of some values, by the nearest-rank method.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+def run_lookup(
+    panel_path: str, output_path: str, clingen_url: str, mavedb_url: str, lookup_args: list[str]
+) -> dict[str, Any]:
+    """
+    Run a lookup in a child process, and measure its duration, request latencies and peak memory use.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".json") as latency_file:
+        with open(f"{output_path}.log", mode="w") as log_file:
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [
+                    sys.executable,
+                    os.path.join(BENCHMARKS_DIR, "instrumented_main.py"),
+                    panel_path,
+                    output_path,
+                    "--clingen-url",
+                    clingen_url,
+                    "--mavedb-url",
+                    mavedb_url,
+                    *lookup_args,
+                ],
+                stderr=log_file,
+                env={**os.environ, "BENCHMARK_LATENCY_FILE": latency_file.name},
+            )
+            # Unlike Popen.wait, wait4 reports the resource usage of this child alone.
+            _, status, resource_usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            seconds = time.perf_counter() - start
+        if process.returncode != 0:
+            with open(f"{output_path}.log") as log_file:
+                raise click.ClickException(
+                    f"Lookup failed with exit code {process.returncode}:\n{log_file.read()}"
+                )
+        with open(latency_file.name) as latency_file_contents:
+            latencies = json.load(latency_file_contents)
+
+    # ru_maxrss is in kilobytes on Linux, but in bytes on macOS.
+    peak_rss_bytes = resource_usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return {
+        "seconds": seconds,
+        "latencies": latencies,
+        "peak_rss_bytes": peak_rss_bytes,
+    }
+
+
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.option("--sizes", default="1000,10000,100000", help="Comma-separated panel sizes.")
+@click.option("--data-dir", type=click.Path(file_okay=False), default=os.path.join(BENCHMARKS_DIR, "data"))
+@click.option("--seed", type=int, default=0)
+@click.option("--latency-ms", type=click.FloatRange(min=0), default=20.0)
+@click.option("--latency-jitter-ms", type=click.FloatRange(min=0), default=0.0)
+@click.option("--error-rate", type=click.FloatRange(min=0, max=1), default=0.0)
+@click.option("--score-set-count", type=click.IntRange(min=1), default=50)
+@click.option("--measurements-per-allele", type=click.IntRange(min=0), default=2)
+@click.option("--score-set-padding", type=click.IntRange(min=0), default=20000, help="In bytes.")
+@click.option(
+    "--allele-count",
+    type=click.IntRange(min=1),
+    default=10000000,
+    help="Number of distinct ClinGen alleles. Keep it small when score set tables are requested.",
+)
+@click.option("--json", "json_path", type=click.Path(dir_okay=False), help="Also write the results to this file.")
+@click.argument("lookup_args", nargs=-1, type=click.UNPROCESSED)
+def main(
+    sizes: str,
+    data_dir: str,
+    seed: int,
+    latency_ms: float,
+    latency_jitter_ms: float,
+    error_rate: float,
+    score_set_count: int,
+    measurements_per_allele: int,
+    score_set_padding: int,
+    allele_count: int,
+    json_path: str | None,
+    lookup_args: tuple[str, ...],
+):
+    config = MockConfig(
+        latency=latency_ms / 1000,
+        latency_jitter=latency_jitter_ms / 1000,
+        error_rate=error_rate,
+        score_set_count=score_set_count,
+        measurements_per_allele=measurements_per_allele,
+        score_set_padding=score_set_padding,
+        allele_count=allele_count,
+    )
+    clingen_server = MockApiServer("clingen", config).start()
+    mavedb_server = MockApiServer("mavedb", config).start()
+    os.makedirs(data_dir, exist_ok=True)
+
+    results = []
+    for size in [int(size) for size in sizes.split(",")]:
+        panel_path = os.path.join(data_dir, f"panel_{size}_{seed}.csv")
+        if not os.path.exists(panel_path):
+            write_panel(panel_path, size, seed)
+        clingen_server.reset_stats()
+        mavedb_server.reset_stats()
+
+        run = run_lookup(
+            panel_path,
+            os.path.join(data_dir, f"output_{size}.csv"),
+            clingen_server.url,
+            mavedb_server.url,
+            list(lookup_args),
+        )
+        clingen_stats = clingen_server.stats()
+        mavedb_stats = mavedb_server.stats()
+        requests = clingen_stats["total_requests"] + mavedb_stats["total_requests"]
+        p50 = percentile(run["latencies"], 50)
+        p99 = percentile(run["latencies"], 99)
+        result = {
+            "rows": size,
+            "seconds": run["seconds"],
+            "rows_per_second": size / run["seconds"],
+            "requests": requests,
+            "requests_per_row": requests / size,
+            "clingen_requests": clingen_stats["requests"],
+            "mavedb_requests": mavedb_stats["requests"],
+            "errors": clingen_stats["errors"] + mavedb_stats["errors"],
+            "latency_p50_ms": p50 * 1000 if p50 is not None else None,
+            "latency_p99_ms": p99 * 1000 if p99 is not None else None,
+            "peak_rss_mb": run["peak_rss_bytes"] / (1024 * 1024),
+        }
+        results.append(result)
+        click.echo(
+            f"{size:>7} rows: {result['rows_per_second']:9.1f} rows/s, "
+            f"{result['requests_per_row']:.3f} requests/row, "
+            f"p50 {result['latency_p50_ms'] or 0:.1f} ms, "
+            f"p99 {result['latency_p99_ms'] or 0:.1f} ms, "
+            f"peak RSS {result['peak_rss_mb']:.1f} MB"
+        )
+
+    clingen_server.shutdown()
+    mavedb_server.shutdown()
+
+    if json_path is not None:
+        with open(json_path, mode="w") as json_file:
+            json.dump(
+                {
+                    "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "python": platform.python_version(),
+                    "mock_config": asdict(config),
+                    "seed": seed,
+                    "lookup_args": list(lookup_args),
+                    "results": results,
+                },
+                json_file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import Metrics
+from response_cache import ResponseCache
+
+_MISSING = object()
+
+
+class ConnectionCountingAdapter(HTTPAdapter):
+    """
+    An HTTP adapter that counts the requests it sends and the connections it opens to send them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.requests_sent = 0
+        self.connections_opened = 0
+        self._stats_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        def counting_pool_class(pool_class):
+            class CountingConnection(pool_class.ConnectionCls):
+                def connect(self):
+                    with adapter._stats_lock:
+                        adapter.connections_opened += 1
+                    super().connect()
+
+            return type(
+                pool_class.__name__, (pool_class,), {"ConnectionCls": CountingConnection}
+            )
+
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: counting_pool_class(pool_class)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def send(self, request, *args, **kwargs):
+        with self._stats_lock:
+            self.requests_sent += 1
+        return super().send(request, *args, **kwargs)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a failed request.
+
+    Connection errors, timeouts and responses with a retry status are retried up to max_retries times. The delay
+    before each retry is drawn uniformly between zero and an exponentially growing cap ("full jitter"), unless the
+    response has a Retry-After header, which is honored instead. No delay is longer than backoff_max, even if
+    Retry-After asks for one, so that a worker never holds its request slot for hours.
+    """
+
+    max_retries: int = 5
+    backoff_base: float = 0.5
+    backoff_max: float = 60.0
+    retry_statuses: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+
+    def delay(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after:
+            retry_after_seconds = parse_retry_after(retry_after)
+            if retry_after_seconds is not None:
+                return min(retry_after_seconds, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+
+def parse_retry_after(retry_after: str) -> float | None:
+    """
+    Parse a Retry-After header, which holds either a number of seconds or an HTTP date.
+    """
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket rate limiter allowing rate requests per second on average, with bursts of up to
+    burst requests.
+    """
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.capacity = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._last_refill) * self.rate
+                )
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ApiClient:
+    """
+    Base class for API clients that share one pooled HTTP session.
+
+    The session's connection pool is thread-safe, so one client can be shared by several worker threads. At most
+    max_in_flight requests are sent to the API's host at once; further requests wait until one finishes.
+
+    Failed requests are retried according to retry_policy. If rate_limit is given, requests to the host are limited
+    to that many per second, including retries.
+
+    If a response cache is given, decoded responses are stored in it, keyed by the API's base URL, and reused by
+    later runs.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = 10,
+        keep_alive: bool = True,
+        max_in_flight: int = 8,
+        timeout: float | None = 30.0,
+        retry_policy: RetryPolicy | None = None,
+        rate_limit: float | None = None,
+        response_cache: ResponseCache | None = None,
+        metrics: Metrics | None = None,
+    ):
+        """
+        :param metrics: Where to record request and cache statistics. Several clients may share one Metrics object.
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+        self.response_cache = response_cache
+        self.metrics = metrics or Metrics()
+        self.max_in_flight = max_in_flight
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.adapter = ConnectionCountingAdapter(pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    def request(
+        self, method: str, url: str, stage: str = "request", **kwargs
+    ) -> requests.Response:
+        """
+        Send a request, retrying connection errors, timeouts and retryable statuses.
+
+        Once the retries are used up, the last response is returned, or the last exception is raised.
+
+        :param stage: The name under which the request's latency (including retries), retries and response size are
+            recorded in the client's metrics.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self._request_with_retries(method, url, stage, **kwargs)
+        except requests.RequestException:
+            self.metrics.observe(stage, time.perf_counter() - start, error=True)
+            raise
+        failed = response.status_code in self.retry_policy.retry_statuses
+        self.metrics.observe(stage, time.perf_counter() - start, error=failed)
+        if kwargs.get("stream"):
+            content_length = response.headers.get("Content-Length")
+            received_bytes = int(content_length) if content_length else 0
+        else:
+            received_bytes = len(response.content)
+        self.metrics.add(stage, "bytes_received", received_bytes)
+        return response
+
+    def _request_with_retries(
+        self, method: str, url: str, stage: str, **kwargs
+    ) -> requests.Response:
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                with self._in_flight:
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retry_policy.max_retries:
+                    raise
+                delay = self.retry_policy.delay(attempt)
+            else:
+                if (
+                    response.status_code not in self.retry_policy.retry_statuses
+                    or attempt >= self.retry_policy.max_retries
+                ):
+                    return response
+                delay = self.retry_policy.delay(
+                    attempt, response.headers.get("Retry-After")
+                )
+                # Release the discarded response's connection, which a streamed response would otherwise hold.
+                response.close()
+            self.metrics.add(stage, "retries")
+            time.sleep(delay)
+            attempt += 1
+
+    def cached(self, resource_type: str, key: str, fetch: Callable[[], Any]) -> Any:
+        if self.response_cache is None:
+            return fetch()
+        value = self.get_cached(resource_type, key, _MISSING)
+        if value is _MISSING:
+            value = fetch()
+            self.set_cached(resource_type, key, value)
+        return value
+
+    def get_cached(self, resource_type: str, key: str, default: Any = None) -> Any:
+        """
+        Get a value from the response cache, recording whether it was found in the client's metrics.
+        """
+        if self.response_cache is None:
+            return default
+        stage = f"response_cache.{resource_type}"
+        with self.metrics.time(stage):
+            value = self.response_cache.get(resource_type, self._cache_key(key), _MISSING)
+        self.metrics.add(stage, "misses" if value is _MISSING else "hits")
+        return default if value is _MISSING else value
+
+    def set_cached(self, resource_type: str, key: str, value: Any):
+        if self.response_cache is not None:
+            self.response_cache.set(resource_type, self._cache_key(key), value)
+
+    def _cache_key(self, key: str) -> str:
+        # A cache directory may be shared by clients of different servers, such as staging and production, whose
+        # responses must not be mixed up.
+        return f"{self.base_url.rstrip('/')} {key}"
+
+    def connection_stats(self) -> dict[str, int]:
+        """
+        Report how many requests were sent and how many connections were opened to send them.
+        """
+        with self.adapter._stats_lock:
+            requests_sent = self.adapter.requests_sent
+            connections_opened = self.adapter.connections_opened
+        return {
+            "requests": requests_sent,
+            "connections": connections_opened,
+            "reused": max(requests_sent - connections_opened, 0),
+        }
@@ -0,0 +1,142 @@
+import csv
+import datetime
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import click
+
+from api_client import RetryPolicy
+from clingen_client import ClingenClient, DEFAULT_CLINGEN_URL
+from mavedb_client import DEFAULT_MAVEDB_URL, MaveDBClient, ScoreSetRestrictedLookup
+from offline_index import OfflineIndex
+from response_cache import ResponseCache
+
+# Number of allele IDs whose measurements are fetched and stored at a time.
+MEASUREMENT_CHUNK_SIZE = 1000
+
+
+@click.command()
+@click.argument("index_path")
+@click.option("--score-set", "score_set_urns", multiple=True)
+@click.option("--score-sets-file", type=click.File("r"), help="A file listing one score set URN per line.")
+@click.option("--hgvs-input", type=click.File("r"), help="A CSV file of HGVS strings to resolve in ClinGen.")
+@click.option("--hgvs-column", default="hgvs")
+@click.option("--related-dna-variants", is_flag=True)
+@click.option("--related-protein-variants", is_flag=True)
+@click.option("--workers", "--concurrency", type=click.IntRange(min=1), default=1)
+@click.option("--clingen-url", default=DEFAULT_CLINGEN_URL)
+@click.option("--mavedb-url", default=DEFAULT_MAVEDB_URL)
+@click.option("--max-retries", type=click.IntRange(min=0), default=5)
+@click.option("--cache-dir", type=click.Path(file_okay=False))
+@click.option("--clingen-bulk", is_flag=True)
+def main(
+    index_path: str,
+    score_set_urns: tuple[str, ...],
+    score_sets_file,
+    hgvs_input,
+    hgvs_column: str,
+    related_dna_variants: bool,
+    related_protein_variants: bool,
+    workers: int,
+    clingen_url: str,
+    mavedb_url: str,
+    max_retries: int,
+    cache_dir: str | None,
+    clingen_bulk: bool,
+):
+    """
+    Build an offline index for mavedb_lookup.py's --offline-index option.
+
+    The index holds the given score sets, the measurements of every variant in them, and, if --hgvs-input is given,
+    the ClinGen alleles of the input's HGVS strings and of the MANE and related variants that lookups of them need.
+    Running this again with the same index path adds to the existing index.
+    """
+    urns = list(score_set_urns)
+    if score_sets_file is not None:
+        urns.extend(line.strip() for line in score_sets_file if line.strip())
+    urns = list(dict.fromkeys(urns))
+
+    response_cache = ResponseCache(cache_dir) if cache_dir is not None else None
+    retry_policy = RetryPolicy(max_retries=max_retries)
+    clingen_client = ClingenClient(
+        base_url=clingen_url,
+        # Every resolved allele is kept, so that all of them can be written to the index.
+        allele_cache_size=sys.maxsize,
+        retry_policy=retry_policy,
+        response_cache=response_cache,
+    )
+    mavedb_client = MaveDBClient(
+        base_url=mavedb_url, retry_policy=retry_policy, response_cache=response_cache
+    )
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    map_function = executor.map if executor else map
+    index = OfflineIndex(index_path, writable=True)
+
+    with executor or nullcontext():
+        # The score sets' mapped variants list their allele IDs. The allele IDs' measurements are then fetched
+        # through the allele ID lookup, so that the index holds the same records, in the same order, as online
+        # lookups return.
+        clingen_allele_ids: dict[str, None] = {}
+        for urn in urns:
+            score_set = mavedb_client.fetch_score_set(urn)
+            if score_set is None:
+                raise click.ClickException(f"Score set {urn} does not exist.")
+            index.add_score_set(urn, score_set)
+            table = mavedb_client.fetch_score_set_variant_table(urn)
+            if table is not None:
+                clingen_allele_ids.update(dict.fromkeys(table.rows_by_clingen_allele_id))
+            click.echo(
+                f"Indexed {urn} ({len(table) if table else 0} variants)", err=True
+            )
+
+        # Measurements are stored for all the score sets in the index, including any added by earlier runs.
+        score_set_lookup = ScoreSetRestrictedLookup(
+            mavedb_client, index.score_set_urns(), bulk_threshold=sys.maxsize
+        )
+        allele_id_list = list(clingen_allele_ids)
+        for start in range(0, len(allele_id_list), MEASUREMENT_CHUNK_SIZE):
+            measurements = score_set_lookup.fetch_variant_effect_measurements_batch(
+                allele_id_list[start : start + MEASUREMENT_CHUNK_SIZE],
+                executor=executor,
+            )
+            for clingen_allele_id, allele_measurements in measurements.items():
+                index.add_measurements(clingen_allele_id, allele_measurements)
+        click.echo(f"Looked up {len(allele_id_list)} allele IDs", err=True)
+
+        if hgvs_input is not None:
+            hgvs_strings = list(
+                dict.fromkeys(row[hgvs_column] for row in csv.DictReader(hgvs_input))
+            )
+            allele_sets = ["mane"]
+            if related_dna_variants:
+                allele_sets.append("related_dna")
+            if related_protein_variants:
+                allele_sets.append("related_protein")
+
+            def resolve(hgvs: str):
+                allele_ids = clingen_client.fetch_clingen_allele_ids(hgvs)
+                for allele_set in allele_sets:
+                    allele_ids.resolve(allele_set)
+
+            if clingen_bulk:
+                clingen_client.fetch_clingen_alleles_bulk(hgvs_strings, executor=executor)
+            list(map_function(resolve, hgvs_strings))
+            index.add_alleles(clingen_client.allele_cache.items())
+            click.echo(f"Resolved {len(hgvs_strings)} HGVS strings", err=True)
+
+    index.set_metadata("built_at", datetime.datetime.now(datetime.timezone.utc).isoformat())
+    index_stats = index.stats()
+    click.echo(
+        f"Index contains {index_stats['score_sets']} score sets, "
+        f"{index_stats['measurements']} measurements and "
+        f"{index_stats['alleles']} ClinGen alleles",
+        err=True,
+    )
+    index.close()
+    if response_cache is not None:
+        response_cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,216 @@
-from typing import Any
+import json
+import logging
+import threading
+from concurrent.futures import Executor
+from typing import Any, Iterable, Iterator
 from urllib.parse import quote
 
 import requests
 
+from api_client import _MISSING, ApiClient
+from memory_cache import LruCache
 
-class ClingenClient:
-    def __init__(self, base_url="https://reg.clinicalgenome.org"):
-        self.base_url = base_url
+DEFAULT_CLINGEN_URL = "https://reg.clinicalgenome.org"
+
+logger = logging.getLogger(__name__)
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """
+    Parse a JSON array incrementally, yielding each element as soon as it has been received in full.
+
+    :raises ValueError: If the input is not a JSON array, is malformed, or ends before the array is closed.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    # What comes next: "[" before the array, "first" (an element or "]") after it opens, "element" after a comma, or
+    # "separator" (a comma or "]") after an element.
+    expected = "["
+    for chunk in chunks:
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position >= len(buffer):
+                break
+            character = buffer[position]
+            if expected == "[":
+                if character != "[":
+                    raise ValueError("Expected a JSON array")
+                expected = "first"
+                position += 1
+                continue
+            if character == "]" and expected != "element":
+                return
+            if expected == "separator":
+                if character != ",":
+                    raise ValueError(f"Expected ',' or ']' in JSON array, found {character!r}")
+                expected = "element"
+                position += 1
+                continue
+            if character in ",]":
+                raise ValueError(f"Expected a JSON array element, found {character!r}")
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The element is incomplete; wait for more data.
+                break
+            if not isinstance(element, (dict, list, str)) and (
+                end == len(buffer) or buffer[end] not in " \t\r\n,]"
+            ):
+                # A bare value is only complete once a delimiter follows it. Otherwise it may continue in the next
+                # chunk: "-0." decodes as -0, and "1e" as 1.
+                break
+            position = end
+            expected = "separator"
+            yield element
+        buffer = buffer[position:]
+    raise ValueError("Incomplete JSON array")
+
+
+class ClingenClient(ApiClient):
+    def __init__(
+        self,
+        base_url=DEFAULT_CLINGEN_URL,
+        timeout=10.0,
+        allele_cache_size=100000,
+        **kwargs,
+    ):
+        """
+        :param kwargs: Connection, retry and caching options passed on to ApiClient.
+        """
+        super().__init__(base_url, timeout=timeout, **kwargs)
+        # Many input rows and MANE transcripts share HGVS strings, so resolve each one only once per run.
+        self.allele_cache = LruCache(allele_cache_size)
 
     def fetch_clingen_allele(self, hgvs: str) -> Any:
+        """
+        Resolve an HGVS string to its ClinGen allele.
+
+        :return: The allele, or None if ClinGen could not resolve the HGVS string.
+        :raises requests.RequestException: If ClinGen still failed after all retries. Unlike an unresolvable HGVS
+            string, such a failure says nothing about the allele, so it is not cached.
+        """
+        return self.allele_cache.get_or_fetch(
+            hgvs,
+            lambda: self.cached(
+                "allele", hgvs, lambda: self._fetch_clingen_allele_uncached(hgvs)
+            ),
+        )
+
+    def _fetch_clingen_allele_uncached(self, hgvs: str) -> Any:
         # resolve HGVS to a ClinGen Allele Registry ID, then query MaveDB by that ID
-        try:
-            response = requests.get(
-                f"{self.base_url}/allele?hgvs={quote(hgvs, safe='')}",
-                timeout=10,
-            )
-            response.raise_for_status()
-            clingen_data = response.json()
-            # print(json.dumps(clingen_data, indent=2))
-
-            # Support either object or list responses. If the response was a list, only look at the first element.
-            if isinstance(clingen_data, list):
-                allele = clingen_data[0] if len(clingen_data) > 0 else None
-            else:
-                allele = clingen_data
+        response = self.request(
+            "GET",
+            f"{self.base_url}/allele?hgvs={quote(hgvs, safe='')}",
+            stage="clingen.allele",
+        )
+        # ClinGen answers HGVS strings it cannot parse with 400, and those it cannot resolve with 404. These are final
+        # answers, so they are returned (and cached) as "no allele". Other client errors, such as authentication
+        # failures, say nothing about the HGVS string, so they are raised below and not cached.
+        if response.status_code in (400, 404):
+            return None
+        response.raise_for_status()
+        clingen_data = response.json()
+        # print(json.dumps(clingen_data, indent=2))
 
-        except requests.RequestException as e:
-            allele = None
+        # Support either object or list responses. If the response was a list, only look at the first element.
+        if isinstance(clingen_data, list):
+            allele = clingen_data[0] if len(clingen_data) > 0 else None
+        else:
+            allele = clingen_data
 
         return allele
 
+    def fetch_clingen_alleles_bulk(
+        self,
+        hgvs_strings: Iterable[str],
+        chunk_size: int = 1000,
+        executor: Executor | None = None,
+    ) -> dict[str, Any]:
+        """
+        Resolve many HGVS strings at once through the Allele Registry's bulk interface.
+
+        HGVS strings that have not been resolved yet are sent as newline-delimited lists of at most chunk_size
+        lines, and each response is parsed as it streams in. Resolved alleles are cached like those fetched by
+        fetch_clingen_allele. Entries that the bulk interface rejects are looked up individually, as are all the
+        entries of a chunk whose response is malformed or does not have one entry for each HGVS string sent.
+
+        :param executor: If given, chunks are sent concurrently using this executor.
+        :return: A dictionary mapping each HGVS string to its allele, or to None if it could not be resolved.
+        """
+        alleles: dict[str, Any] = {}
+        unresolved_hgvs = []
+        for hgvs in dict.fromkeys(hgvs_strings):
+            if hgvs in self.allele_cache:
+                alleles[hgvs] = self.fetch_clingen_allele(hgvs)
+            else:
+                unresolved_hgvs.append(hgvs)
+
+        chunks = [
+            unresolved_hgvs[start : start + chunk_size]
+            for start in range(0, len(unresolved_hgvs), chunk_size)
+        ]
+        map_function = executor.map if executor else map
+        for chunk_alleles in map_function(self._fetch_clingen_alleles_bulk_chunk, chunks):
+            alleles.update(chunk_alleles)
+        return alleles
+
+    def _fetch_clingen_alleles_bulk_chunk(self, hgvs_chunk: list[str]) -> dict[str, Any]:
+        alleles: dict[str, Any] = {}
+        if self.response_cache is not None:
+            for hgvs in hgvs_chunk:
+                # A cached None is an HGVS string that ClinGen could not resolve, which need not be sent again.
+                cached_allele = self.get_cached("allele", hgvs, _MISSING)
+                if cached_allele is not _MISSING:
+                    alleles[hgvs] = cached_allele
+                    self.allele_cache.put(hgvs, cached_allele)
+        hgvs_to_send = [hgvs for hgvs in hgvs_chunk if hgvs not in alleles]
+
+        if hgvs_to_send:
+            try:
+                response = self.request(
+                    "POST",
+                    f"{self.base_url}/alleles?file=hgvs",
+                    data="\n".join(hgvs_to_send).encode("utf-8"),
+                    headers={"Content-Type": "text/plain"},
+                    stream=True,
+                    stage="clingen.bulk",
+                )
+                # The response is streamed, so it must be closed to return its connection to the pool, even if it
+                # failed.
+                with response:
+                    response.raise_for_status()
+                    response.encoding = response.encoding or "utf-8"
+                    entries = list(
+                        iter_json_array(
+                            response.iter_content(chunk_size=65536, decode_unicode=True)
+                        )
+                    )
+                # Entries are returned in request order, so they can only be matched to HGVS strings if there is one
+                # for each.
+                if len(entries) != len(hgvs_to_send):
+                    raise ValueError(
+                        f"Received {len(entries)} entries for {len(hgvs_to_send)} HGVS strings"
+                    )
+                for hgvs, entry in zip(hgvs_to_send, entries):
+                    if not isinstance(entry, dict) or "errorType" in entry:
+                        continue
+                    alleles[hgvs] = entry
+                    self.allele_cache.put(hgvs, entry)
+                    self.set_cached("allele", hgvs, entry)
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(
+                    f"ClinGen bulk lookup failed, falling back to individual lookups: {e}"
+                )
+
+        # Look up rejected entries one at a time, and every entry if the bulk lookup failed.
+        for hgvs in hgvs_to_send:
+            if hgvs not in alleles:
+                alleles[hgvs] = self.fetch_clingen_allele(hgvs)
+        return alleles
+
     def fetch_clingen_allele_ids(self, hgvs: str):
         """
         A ClinGen allele resource has a (partial) structure like this example:
@@ -63,65 +244,13 @@ class ClingenClient:
         }
         ```
 
+        Only the exact allele is fetched here. MANE and related allele IDs are resolved the first time they are
+        requested from the returned object, since each of them costs additional ClinGen requests.
+
         :param self: Description
         :param hgvs: Description
         """
-        allele = self.fetch_clingen_allele(hgvs)
-
-        allele_ids = {
-            "exact": None,
-            "mane": [],
-            "related_protein": [],
-            "related_dna": [],
-        }
-        if allele:
-            exact_allele_id = self.get_clingen_allele_id(allele)
-            allele_ids["exact"] = exact_allele_id
-
-            transcript_alleles = allele.get("transcriptAlleles")
-            if exact_allele_id and transcript_alleles:
-                for transcript_allele in transcript_alleles:
-                    mane = transcript_allele.get("MANE")
-                    if mane:
-                        for sequence_type in ["nucleotide", "protein"]:
-                            for database in mane[sequence_type]:
-                                allele_set = "mane"
-                                if (
-                                    exact_allele_id.startswith("C")
-                                    and sequence_type == "protein"
-                                ):
-                                    allele_set = "related_protein"
-                                if (
-                                    exact_allele_id.startswith("P")
-                                    and sequence_type == "nucleotide"
-                                ):
-                                    allele_set = "related_dna"
-                                hgvs = mane[sequence_type][database]["hgvs"]
-                                related_allele_hgvs = self.fetch_clingen_allele(hgvs)
-                                if related_allele_hgvs:
-                                    related_allele_id = self.get_clingen_allele_id(
-                                        related_allele_hgvs
-                                    )
-                                    if related_allele_id:
-                                        allele_ids[allele_set].append(related_allele_id)
-        allele_ids["mane"] = list(set(allele_ids["mane"]))
-        allele_ids["related_dna"] = list(set(allele_ids["related_dna"]))
-        allele_ids["related_protein"] = list(set(allele_ids["related_protein"]))
-        allele_ids["mane"] = [
-            id for id in set(allele_ids["mane"]) if id != allele_ids["exact"]
-        ]
-        allele_ids["related_dna"] = [
-            id
-            for id in set(allele_ids["related_dna"])
-            if id != allele_ids["exact"] and not id in allele_ids["mane"]
-        ]
-        allele_ids["related_protein"] = [
-            id
-            for id in set(allele_ids["related_protein"])
-            if id != allele_ids["exact"] and not id in allele_ids["mane"]
-        ]
-
-        return allele_ids
+        return ClingenAlleleIds(self, hgvs, self.fetch_clingen_allele(hgvs))
 
     def get_clingen_allele_id(self, allele: Any):
         allele_id = allele.get("@id")
@@ -131,3 +260,88 @@ class ClingenClient:
                 return None
             return allele_id
         return None
+
+
+class ClingenAlleleIds:
+    """
+    The ClinGen allele IDs associated with an HGVS string.
+
+    Access by allele set name ("exact", "mane", "related_dna" or "related_protein") like a dictionary. The exact
+    allele ID is known up front; the other allele sets are resolved through ClinGen on first access and then kept.
+    """
+
+    def __init__(self, clingen_client: ClingenClient, hgvs: str, allele: Any):
+        self.clingen_client = clingen_client
+        self.hgvs = hgvs
+        self.exact = clingen_client.get_clingen_allele_id(allele) if allele else None
+        self._hgvs_by_allele_set: dict[str, list[str]] = {
+            "mane": [],
+            "related_dna": [],
+            "related_protein": [],
+        }
+        self._allele_ids: dict[str, list[str]] = {}
+        self._lock = threading.RLock()
+
+        transcript_alleles = allele.get("transcriptAlleles") if allele else None
+        if self.exact and transcript_alleles:
+            for transcript_allele in transcript_alleles:
+                mane = transcript_allele.get("MANE")
+                if mane:
+                    for sequence_type in ["nucleotide", "protein"]:
+                        for database in mane[sequence_type]:
+                            allele_set = "mane"
+                            if self.exact.startswith("C") and sequence_type == "protein":
+                                allele_set = "related_protein"
+                            if self.exact.startswith("P") and sequence_type == "nucleotide":
+                                allele_set = "related_dna"
+                            self._hgvs_by_allele_set[allele_set].append(
+                                mane[sequence_type][database]["hgvs"]
+                            )
+
+    def __getitem__(self, allele_set: str):
+        if allele_set == "exact":
+            return self.exact
+        return self.resolve(allele_set)
+
+    def unresolved_hgvs(self, allele_set: str) -> list[str]:
+        """
+        List the HGVS strings that still need to be resolved to resolve an allele set.
+        """
+        with self._lock:
+            if allele_set == "exact" or allele_set in self._allele_ids:
+                return []
+            hgvs_strings = list(self._hgvs_by_allele_set[allele_set])
+            if allele_set != "mane":
+                hgvs_strings += self.unresolved_hgvs("mane")
+            return [hgvs for hgvs in hgvs_strings if hgvs != self.hgvs]
+
+    def resolve(self, allele_set: str) -> list[str]:
+        """
+        Resolve one allele set to ClinGen allele IDs, fetching its alleles from ClinGen if this has not been done yet.
+
+        MANE allele IDs exclude the exact allele ID, and related allele IDs exclude both the exact and MANE allele
+        IDs. IDs are deduplicated in discovery order, so that output row order does not vary between runs.
+        """
+        with self._lock:
+            if allele_set not in self._allele_ids:
+                excluded_allele_ids = {self.exact}
+                if allele_set != "mane":
+                    excluded_allele_ids.update(self.resolve("mane"))
+                allele_ids = []
+                # An HGVS string identical to the requested one can only resolve to the exact allele.
+                for hgvs in dict.fromkeys(self._hgvs_by_allele_set[allele_set]):
+                    if hgvs == self.hgvs:
+                        continue
+                    related_allele = self.clingen_client.fetch_clingen_allele(hgvs)
+                    if related_allele:
+                        related_allele_id = self.clingen_client.get_clingen_allele_id(
+                            related_allele
+                        )
+                        if related_allele_id:
+                            allele_ids.append(related_allele_id)
+                self._allele_ids[allele_set] = [
+                    id
+                    for id in dict.fromkeys(allele_ids)
+                    if id not in excluded_allele_ids
+                ]
+            return self._allele_ids[allele_set]
@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+import os
+import threading
+from typing import Any, Callable, Iterable
+
+from run_journal import RunJournal
+
+STATE_FORMAT_VERSION = 1
+
+# Output columns that identify each result row's measurement, which an incremental run compares with the current
+# measurements.
+REQUIRED_COLUMNS = ["match_type", "variant_urn"]
+
+
+class RunState:
+    """
+    A sidecar file describing a finished lookup run, so that a later run can reuse its output: the options that
+    affect results, and the modification date of each score set that results were built from.
+    """
+
+    def __init__(self, options: dict[str, Any], score_set_modification_dates: dict[str, str | None]):
+        self.options = options
+        self.score_set_modification_dates = score_set_modification_dates
+
+    @staticmethod
+    def path_for_output(output_path: str) -> str:
+        return f"{output_path}.state.json"
+
+    @classmethod
+    def read(cls, path: str) -> "RunState":
+        with open(path) as state_file:
+            state = json.load(state_file)
+        if state.get("version") != STATE_FORMAT_VERSION:
+            raise ValueError(
+                f"{path} has state format version {state.get('version')}, but this version of mavedb_lookup "
+                f"reads version {STATE_FORMAT_VERSION}."
+            )
+        return cls(state["options"], state["score_set_modification_dates"])
+
+    def write(self, path: str):
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, mode="w") as state_file:
+            json.dump(
+                {
+                    "version": STATE_FORMAT_VERSION,
+                    "options": self.options,
+                    "score_set_modification_dates": self.score_set_modification_dates,
+                },
+                state_file,
+                indent=2,
+                sort_keys=True,
+            )
+        os.replace(temporary_path, path)
+
+
+def read_score_set_urns(output_path: str, output_format: str) -> set[str]:
+    """
+    Find the score sets of the result rows in an output file, from the rows' variant URNs.
+
+    :param output_format: "csv" or "jsonl".
+    """
+    with open(output_path, mode="r", newline="") as output_file:
+        if output_format == "csv":
+            rows: Iterable[dict[str, Any]] = csv.DictReader(output_file)
+        else:
+            rows = (json.loads(line) for line in output_file if line.strip())
+        # A variant URN is its score set's URN followed by "#" and the variant's number.
+        return {row["variant_urn"].split("#")[0] for row in rows if row.get("variant_urn")}
+
+
+class PreviousRun:
+    """
+    The output of an earlier run with the same options, whose result rows can be reused for HGVS strings whose
+    measurements have not changed.
+
+    An HGVS string's previous rows are reused if they describe the same measurements, in the same order, as the
+    current lookup found, and every score set they belong to has the same modification date as when the rows were
+    built. Otherwise its rows are built again.
+
+    Rows are located through the previous run's journal and read from the output file only when they are needed.
+    """
+
+    def __init__(self, output_path: str, output_format: str, state: RunState):
+        """
+        :param output_format: "csv" or "jsonl".
+        """
+        self.output_path = output_path
+        self.output_format = output_format
+        self.state = state
+        self.reused = 0
+        self.rebuilt = 0
+        self._lock = threading.Lock()
+        self._file = open(output_path, mode="rb")
+        self.fieldnames: list[str] | None = None
+        start = 0
+        if output_format == "csv":
+            header = self._file.readline()
+            self.fieldnames = next(csv.reader([header.decode("utf-8")]))
+            start = len(header)
+
+        # The byte range of each HGVS string's rows. Repeated HGVS strings have the same rows, so the first
+        # occurrence is kept.
+        self._row_ranges: dict[str, tuple[int, int]] = {}
+        for entry in RunJournal(RunJournal.path_for_output(output_path)).read():
+            self._row_ranges.setdefault(entry.hgvs, (start, entry.output_offset))
+            start = entry.output_offset
+
+    def __len__(self):
+        return len(self._row_ranges)
+
+    def rows(self, hgvs: str) -> list[dict[str, Any]] | None:
+        """
+        Read the previous run's result rows for an HGVS string, or None if the previous run did not look it up.
+        """
+        row_range = self._row_ranges.get(hgvs)
+        if row_range is None:
+            return None
+        start, end = row_range
+        with self._lock:
+            self._file.seek(start)
+            text = self._file.read(end - start).decode("utf-8")
+        if self.output_format == "csv":
+            return list(csv.DictReader(io.StringIO(text, newline=""), fieldnames=self.fieldnames))
+        return [json.loads(line) for line in text.splitlines()]
+
+    def score_set_unchanged(self, score_set_urn: str, modification_date: str | None) -> bool:
+        return (
+            modification_date is not None
+            and self.state.score_set_modification_dates.get(score_set_urn) == modification_date
+        )
+
+    def reusable_rows(
+        self,
+        hgvs: str,
+        result_measurements: list[tuple[str, str, str, str | None]],
+        get_modification_date: Callable[[str], str | None],
+    ) -> list[dict[str, Any]] | None:
+        """
+        Get the previous run's rows for an HGVS string, if they can be reused.
+
+        :param result_measurements: The match type, variant URN, score set URN and score set modification date of
+            each result row the current lookup would build, in order. The modification date may be None if the
+            measurement did not include it.
+        :param get_modification_date: Finds a score set's current modification date, for measurements that did not
+            include it.
+        :return: The rows to reuse, or None if the rows must be built again.
+        """
+        rows = self.rows(hgvs)
+        reusable = rows is not None and [
+            (row["match_type"], row["variant_urn"]) for row in rows
+        ] == [(match_type, variant_urn) for match_type, variant_urn, _, _ in result_measurements]
+        if reusable:
+            for score_set_urn, modification_date in dict(
+                (score_set_urn, modification_date)
+                for _, _, score_set_urn, modification_date in result_measurements
+            ).items():
+                if modification_date is None:
+                    modification_date = get_modification_date(score_set_urn)
+                if not self.score_set_unchanged(score_set_urn, modification_date):
+                    reusable = False
+                    break
+
+        with self._lock:
+            if reusable:
+                self.reused += 1
+            else:
+                self.rebuilt += 1
+        return rows if reusable else None
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,273 @@
+import csv
+import gzip
+import io
+import itertools
+import re
+import sys
+from typing import BinaryIO, cast, Iterable, Iterator
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# RefSeq accessions of the GRCh38 chromosomes, by VCF chromosome name (without any "chr" prefix).
+GRCH38_CHROMOSOME_ACCESSIONS = {
+    "1": "NC_000001.11",
+    "2": "NC_000002.12",
+    "3": "NC_000003.12",
+    "4": "NC_000004.12",
+    "5": "NC_000005.10",
+    "6": "NC_000006.12",
+    "7": "NC_000007.14",
+    "8": "NC_000008.11",
+    "9": "NC_000009.12",
+    "10": "NC_000010.11",
+    "11": "NC_000011.10",
+    "12": "NC_000012.12",
+    "13": "NC_000013.11",
+    "14": "NC_000014.9",
+    "15": "NC_000015.10",
+    "16": "NC_000016.10",
+    "17": "NC_000017.11",
+    "18": "NC_000018.10",
+    "19": "NC_000019.10",
+    "20": "NC_000020.11",
+    "21": "NC_000021.9",
+    "22": "NC_000022.11",
+    "X": "NC_000023.11",
+    "Y": "NC_000024.10",
+    "MT": "NC_012920.1",
+    "M": "NC_012920.1",
+}
+
+# Lengths of the GRCh38 chromosomes, by VCF chromosome name (without any "chr" prefix). Most chromosomes have
+# different lengths in other assemblies, so contig lengths in a VCF header reveal which assembly it is based on.
+GRCH38_CHROMOSOME_LENGTHS = {
+    "1": 248956422,
+    "2": 242193529,
+    "3": 198295559,
+    "4": 190214555,
+    "5": 181538259,
+    "6": 170805979,
+    "7": 159345973,
+    "8": 145138636,
+    "9": 138394717,
+    "10": 133797422,
+    "11": 135086622,
+    "12": 133275309,
+    "13": 114364328,
+    "14": 107043718,
+    "15": 101991189,
+    "16": 90338345,
+    "17": 83257441,
+    "18": 80373285,
+    "19": 58617616,
+    "20": 64444167,
+    "21": 46709983,
+    "22": 50818468,
+    "X": 156040895,
+    "Y": 57227415,
+    "MT": 16569,
+    "M": 16569,
+}
+
+# Names of GRCh38 and of other human assemblies, as found in VCF reference and contig headers.
+GRCH38_ASSEMBLY_PATTERN = re.compile(
+    r"grch38|hg38|hs38|assembly38|(?<![a-z0-9])b38(?![0-9])", re.IGNORECASE
+)
+OTHER_ASSEMBLY_PATTERN = re.compile(
+    r"grch3[67]|hg1[6-9]|ncbi3[4-6]|hs37|g1k_v37|assembly19|(?<![a-z0-9])b3[67](?![0-9])", re.IGNORECASE
+)
+
+
+def open_binary_input(binary_file: io.BufferedReader) -> BinaryIO:
+    """
+    Wrap a binary stream in a decompressor if it is gzip- or zstd-compressed, judging by its first bytes.
+    """
+    magic = binary_file.peek(4)[:4]
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=binary_file)
+    if magic.startswith(ZSTD_MAGIC):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                "Reading zstd-compressed input requires zstandard (pip install zstandard)."
+            )
+        return zstandard.ZstdDecompressor().stream_reader(binary_file)
+    return binary_file
+
+
+def _chromosome_name(chromosome: str) -> str:
+    return chromosome[3:] if chromosome.lower().startswith("chr") else chromosome
+
+
+def check_vcf_assembly(header_lines: Iterable[str]):
+    """
+    Check that a VCF header does not declare a reference assembly other than GRCh38, since records are described
+    on GRCh38 chromosomes.
+
+    The ##reference line and the assembly of each ##contig line are checked for names of other assemblies, and the
+    lengths of ##contig lines for chromosomes of another length than on GRCh38. A header that declares neither is
+    assumed to be based on GRCh38.
+
+    :raises ValueError: If the header declares another assembly.
+    """
+    for line in header_lines:
+        line = line.rstrip("\r\n")
+        if line.startswith("##reference="):
+            reference = line[len("##reference=") :]
+            if OTHER_ASSEMBLY_PATTERN.search(reference) and not GRCH38_ASSEMBLY_PATTERN.search(reference):
+                raise ValueError(
+                    f"The VCF input's reference is {reference}, but only GRCh38 VCF files are supported."
+                )
+        elif line.startswith("##contig=<"):
+            fields = {
+                name: value.strip('"')
+                for name, value in re.findall(r'(\w+)=("[^"]*"|[^,>]*)', line[len("##contig=<") :])
+            }
+            assembly = fields.get("assembly", "")
+            if OTHER_ASSEMBLY_PATTERN.search(assembly) and not GRCH38_ASSEMBLY_PATTERN.search(assembly):
+                raise ValueError(
+                    f"The VCF input's contigs are on {assembly}, but only GRCh38 VCF files are supported."
+                )
+            chromosome = _chromosome_name(fields.get("ID", ""))
+            length = fields.get("length", "")
+            if (
+                chromosome in GRCH38_CHROMOSOME_LENGTHS
+                and length.isdigit()
+                and int(length) != GRCH38_CHROMOSOME_LENGTHS[chromosome]
+            ):
+                raise ValueError(
+                    f"The VCF input's contig {fields['ID']} has length {length}, but is "
+                    f"{GRCH38_CHROMOSOME_LENGTHS[chromosome]} long on GRCh38; only GRCh38 VCF files are supported."
+                )
+
+
+def vcf_record_to_hgvs(chromosome: str, position: int, ref: str, alt: str) -> str | None:
+    """
+    Describe a VCF allele as a genomic HGVS string on GRCh38.
+
+    Bases shared by the reference and alternate alleles, such as the anchor base that VCF adds to insertions and
+    deletions, are trimmed first.
+
+    :return: The HGVS string, or None if the chromosome is not a GRCh38 chromosome, or the allele is symbolic,
+        missing or the same as the reference.
+    """
+    accession = GRCH38_CHROMOSOME_ACCESSIONS.get(_chromosome_name(chromosome))
+    ref = ref.upper()
+    alt = alt.upper()
+    if (
+        accession is None
+        or ref == alt
+        or not ref.isalpha()
+        or not alt.isalpha()
+    ):
+        return None
+
+    # Trim shared suffix, then shared prefix.
+    while ref and alt and ref[-1] == alt[-1]:
+        ref = ref[:-1]
+        alt = alt[:-1]
+    while ref and alt and ref[0] == alt[0]:
+        ref = ref[1:]
+        alt = alt[1:]
+        position += 1
+
+    start = position
+    end = position + len(ref) - 1
+    interval = f"{start}" if start == end else f"{start}_{end}"
+    if not alt:
+        description = f"{interval}del"
+    elif not ref:
+        # An insertion between the bases before and after the trimmed position.
+        description = f"{position - 1}_{position}ins{alt}"
+    elif len(ref) == 1 and len(alt) == 1:
+        description = f"{position}{ref}>{alt}"
+    else:
+        description = f"{interval}delins{alt}"
+    return f"{accession}:g.{description}"
+
+
+def iter_vcf_hgvs(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Read VCF records, yielding a genomic HGVS string for each alternate allele that can be described.
+    """
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        fields = line.rstrip("\r\n").split("\t", 5)
+        if len(fields) < 5:
+            continue
+        chromosome, position, _, ref, alts = fields[:5]
+        for alt in alts.split(","):
+            hgvs = vcf_record_to_hgvs(chromosome, int(position), ref, alt)
+            if hgvs is not None:
+                yield hgvs
+
+
+def read_hgvs(path: str, hgvs_column: str) -> Iterator[str]:
+    """
+    Read HGVS strings from an input file, one at a time.
+
+    The input is a CSV file with a column of HGVS strings, or a VCF file, whose alternate alleles are converted to
+    genomic HGVS strings. Either may be gzip- or zstd-compressed. The format and compression are detected from the
+    file's contents, and a path of "-" reads from standard input.
+
+    The input is decompressed and parsed as it is read, so only the part consumed so far is ever held in memory.
+    Close the returned generator to close the input file.
+
+    :raises ValueError: If the input is a VCF file based on an assembly other than GRCh38. A VCF file's header is
+        read and checked before this function returns.
+    """
+    binary_file = cast(
+        io.BufferedReader, sys.stdin.buffer if path == "-" else open(path, mode="rb")
+    )
+    try:
+        text_file = io.TextIOWrapper(
+            open_binary_input(binary_file), encoding="utf-8", newline=""
+        )
+    except BaseException:
+        if path != "-":
+            binary_file.close()
+        raise
+    try:
+        first_line = text_file.readline()
+        is_vcf = first_line.startswith(("##fileformat=VCF", "#CHROM"))
+        if is_vcf:
+            header_lines = []
+            while first_line.startswith("#"):
+                header_lines.append(first_line)
+                first_line = text_file.readline()
+            check_vcf_assembly(header_lines)
+    except BaseException:
+        _close_input(path, binary_file, text_file)
+        raise
+    return _iter_hgvs(path, binary_file, text_file, first_line, is_vcf, hgvs_column)
+
+
+def _iter_hgvs(
+    path: str,
+    binary_file: BinaryIO,
+    text_file: io.TextIOWrapper,
+    first_line: str,
+    is_vcf: bool,
+    hgvs_column: str,
+) -> Iterator[str]:
+    try:
+        lines = itertools.chain([first_line], text_file)
+        if is_vcf:
+            yield from iter_vcf_hgvs(lines)
+        else:
+            for row in csv.DictReader(lines):
+                yield row[hgvs_column]
+    finally:
+        _close_input(path, binary_file, text_file)
+
+
+def _close_input(path: str, binary_file: BinaryIO, text_file: io.TextIOWrapper):
+    if path == "-":
+        # Leave standard input open.
+        text_file.detach()
+    else:
+        text_file.close()
+        binary_file.close()
@@ -0,0 +1,414 @@
+import json
+import logging
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterable
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+from api_client import RetryPolicy
+from clingen_client import ClingenClient, DEFAULT_CLINGEN_URL
+from mavedb_client import DEFAULT_MAVEDB_URL, MaveDBClient, ScoreSetRestrictedLookup
+from mavedb_lookup import lookup_hgvs_batch, OUTPUT_COLUMNS
+from metrics import Metrics
+from offline_index import OfflineClingenClient, OfflineIndex, OfflineMaveDBClient
+from response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+# Lookup options that each request can set, overriding the service's defaults.
+REQUEST_OPTIONS = (
+    "related_dna_variants",
+    "related_protein_variants",
+    "always_include_related_variants",
+)
+
+
+class LookupService:
+    """
+    Answers lookups with long-lived clients, so that their caches stay warm from one request to the next.
+
+    The service is thread-safe: lookups from concurrent requests share the clients, their caches and the executor,
+    and lookups of the same HGVS string, allele or score set that are in flight at the same time are only sent
+    once.
+    """
+
+    def __init__(
+        self,
+        clingen_client: ClingenClient,
+        mavedb_client: MaveDBClient,
+        executor: ThreadPoolExecutor | None = None,
+        clingen_bulk: bool = False,
+        score_set_lookup: ScoreSetRestrictedLookup | None = None,
+        columns: list[str] | None = None,
+        max_batch_size: int = 1000,
+        **default_options: bool,
+    ):
+        """
+        :param columns: The result columns to return. If None, all columns are returned.
+        :param max_batch_size: The largest number of HGVS strings accepted in one batch request.
+        :param default_options: Defaults for the lookup options in REQUEST_OPTIONS.
+        """
+        self.clingen_client = clingen_client
+        self.mavedb_client = mavedb_client
+        self.executor = executor
+        self.clingen_bulk = clingen_bulk
+        self.score_set_lookup = score_set_lookup
+        self.columns = columns or OUTPUT_COLUMNS
+        self.max_batch_size = max_batch_size
+        self.default_options = {
+            option: default_options.get(option, False) for option in REQUEST_OPTIONS
+        }
+
+    @property
+    def metrics(self) -> Metrics:
+        return self.mavedb_client.metrics
+
+    def look_up(self, hgvs_strings: list[str], **options: bool) -> list[list[dict[str, Any]]]:
+        """
+        Look up HGVS strings, returning each one's results in the same order.
+
+        :param options: Lookup options from REQUEST_OPTIONS, overriding the service's defaults.
+        """
+        check_option_names(options)
+        if len(hgvs_strings) > self.max_batch_size:
+            raise ValueError(
+                f"Too many HGVS strings ({len(hgvs_strings)}); at most {self.max_batch_size} can be looked up at once."
+            )
+        options = {**self.default_options, **options}
+        columns = tuple(self.columns) if self.columns != OUTPUT_COLUMNS else None
+        results = lookup_hgvs_batch(
+            self.clingen_client,
+            self.mavedb_client,
+            hgvs_strings,
+            options["related_dna_variants"],
+            options["related_protein_variants"],
+            options["always_include_related_variants"],
+            executor=self.executor,
+            clingen_bulk=self.clingen_bulk,
+            score_set_lookup=self.score_set_lookup,
+            columns=columns,
+        )
+        return [
+            [
+                {column: row_columns.get(column) for column in self.columns}
+                for row_columns in (row.to_dict() for row in row_results)
+            ]
+            for row_results in results
+        ]
+
+    def metrics_text(self) -> str:
+        for name, cache in [
+            ("score_set", self.mavedb_client.score_set_cache),
+            ("score_set_profile", self.mavedb_client.score_set_profile_cache),
+            ("clingen_allele", self.clingen_client.allele_cache),
+            ("mavedb_lookup", self.mavedb_client.lookup_cache),
+        ]:
+            self.metrics.set_cache_stats(name, cache.stats())
+        if self.mavedb_client.response_cache is not None:
+            self.metrics.set_cache_stats("response", self.mavedb_client.response_cache.stats())
+        return self.metrics.prometheus_text()
+
+
+def check_option_names(options: Iterable[str]):
+    """
+    :raises ValueError: If any of the options is not one of REQUEST_OPTIONS.
+    """
+    unknown_options = set(options) - set(REQUEST_OPTIONS)
+    if unknown_options:
+        raise ValueError(f"Unknown options: {', '.join(sorted(unknown_options))}")
+
+
+def parse_option(value: Any) -> bool:
+    """
+    Parse a boolean lookup option from a query string or a JSON request body.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ["1", "true", "yes"]:
+        return True
+    if isinstance(value, str) and value.lower() in ["0", "false", "no"]:
+        return False
+    raise ValueError(f"Invalid option value {value!r}")
+
+
+def parse_options(values: dict[str, Any]) -> dict[str, bool]:
+    """
+    Parse lookup options from a query string or a JSON request body. Option names are checked before any values,
+    so that a misspelled option is reported as such rather than by its value.
+    """
+    check_option_names(values)
+    options = {}
+    for name, value in values.items():
+        try:
+            options[name] = parse_option(value)
+        except ValueError as e:
+            raise ValueError(f"{e} for {name}")
+    return options
+
+
+class LookupRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles the service's HTTP/JSON API:
+
+    - GET /lookup?hgvs=...: Look up one HGVS string. Returns {"hgvs": ..., "results": [...]}.
+    - POST /lookup, with a body of {"hgvs": [...]}: Look up a batch of HGVS strings. Returns
+      {"results": [{"hgvs": ..., "results": [...]}, ...]}, in the order of the request.
+    - GET /health: Returns {"status": "ok"}.
+    - GET /metrics: Returns the service's metrics in the Prometheus text format.
+
+    Lookup options (related_dna_variants, related_protein_variants and always_include_related_variants) can be given
+    as query parameters or as fields of the request body.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Send each response's headers and body together, without waiting for delayed acknowledgements, which would add
+    # tens of milliseconds to every answer from a warm cache.
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+    server: "LookupServer"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, value: Any, status: int = 200):
+        self.send_body(json.dumps(value).encode("utf-8"), "application/json", status)
+
+    def send_error_json(self, status: int, message: str):
+        self.send_json({"error": message}, status)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self.send_json({"status": "ok"})
+        if url.path == "/metrics":
+            return self.send_body(
+                self.server.service.metrics_text().encode("utf-8"),
+                "text/plain; version=0.0.4",
+            )
+        if url.path != "/lookup":
+            return self.send_error_json(404, f"Not found: {url.path}")
+
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        hgvs = query.pop("hgvs", None)
+        if not hgvs:
+            return self.send_error_json(400, "The hgvs query parameter is required.")
+        try:
+            options = parse_options(query)
+            (results,) = self.server.service.look_up([hgvs], **options)
+        except ValueError as e:
+            return self.send_error_json(400, str(e))
+        except Exception:
+            logger.exception(f"Lookup of {hgvs} failed")
+            return self.send_error_json(500, "Lookup failed.")
+        self.send_json({"hgvs": hgvs, "results": results})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if url.path != "/lookup":
+            return self.send_error_json(404, f"Not found: {url.path}")
+
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return self.send_error_json(400, "The request body is not valid JSON.")
+        if not isinstance(request, dict) or not isinstance(request.get("hgvs"), list):
+            return self.send_error_json(400, 'The request body must be an object with an "hgvs" list.')
+        hgvs_strings = request.pop("hgvs")
+        if not all(isinstance(hgvs, str) for hgvs in hgvs_strings):
+            return self.send_error_json(400, "HGVS strings must be strings.")
+        try:
+            options = parse_options(request)
+            results = self.server.service.look_up(hgvs_strings, **options)
+        except ValueError as e:
+            return self.send_error_json(400, str(e))
+        except Exception:
+            logger.exception(f"Lookup of a batch of {len(hgvs_strings)} HGVS strings failed")
+            return self.send_error_json(500, "Lookup failed.")
+        self.send_json(
+            {
+                "results": [
+                    {"hgvs": hgvs, "results": row_results}
+                    for hgvs, row_results in zip(hgvs_strings, results)
+                ]
+            }
+        )
+
+
+class LookupServer(ThreadingHTTPServer):
+    """
+    An HTTP server that answers each request in its own thread, using a shared LookupService.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, service: LookupService, host: str = "127.0.0.1", port: int = 8080):
+        super().__init__((host, port), LookupRequestHandler)
+        self.service = service
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "LookupServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", type=click.IntRange(min=0), default=8080)
+@click.option("--related-dna-variants", is_flag=True, help="Default for requests that do not set this option.")
+@click.option("--related-protein-variants", is_flag=True, help="Default for requests that do not set this option.")
+@click.option(
+    "--always-include-related-variants", is_flag=True, help="Default for requests that do not set this option."
+)
+@click.option("--max-batch-size", type=click.IntRange(min=1), default=1000)
+@click.option("--score-set-cache-size", type=click.IntRange(min=1), default=512)
+@click.option("--allele-cache-size", type=click.IntRange(min=1), default=100000)
+@click.option("--lookup-cache-size", type=click.IntRange(min=1), default=100000)
+@click.option("--lookup-batch-size", type=click.IntRange(min=1), default=100)
+@click.option("--pool-size", type=click.IntRange(min=1), default=10)
+@click.option("--workers", "--concurrency", type=click.IntRange(min=1), default=8)
+@click.option("--max-in-flight", type=click.IntRange(min=1), default=8)
+@click.option("--clingen-url", default=DEFAULT_CLINGEN_URL)
+@click.option("--mavedb-url", default=DEFAULT_MAVEDB_URL)
+@click.option("--clingen-timeout", type=click.FloatRange(min=0, min_open=True), default=10.0)
+@click.option("--mavedb-timeout", type=click.FloatRange(min=0, min_open=True), default=30.0)
+@click.option("--max-retries", type=click.IntRange(min=0), default=5)
+@click.option("--clingen-rate-limit", type=click.FloatRange(min=0, min_open=True), help="Requests per second.")
+@click.option("--mavedb-rate-limit", type=click.FloatRange(min=0, min_open=True), help="Requests per second.")
+@click.option("--cache-dir", type=click.Path(file_okay=False))
+@click.option("--clingen-bulk", is_flag=True)
+@click.option("--score-set", "score_set_urns", multiple=True)
+@click.option("--score-set-bulk-threshold", type=click.IntRange(min=0), default=1000)
+@click.option("--offline-index", type=click.Path(exists=True, dir_okay=False))
+@click.option("--columns", help="Comma-separated list of result columns.")
+def main(
+    host: str,
+    port: int,
+    related_dna_variants: bool,
+    related_protein_variants: bool,
+    always_include_related_variants: bool,
+    max_batch_size: int,
+    score_set_cache_size: int,
+    allele_cache_size: int,
+    lookup_cache_size: int,
+    lookup_batch_size: int,
+    pool_size: int,
+    workers: int,
+    max_in_flight: int,
+    clingen_url: str,
+    mavedb_url: str,
+    clingen_timeout: float,
+    mavedb_timeout: float,
+    max_retries: int,
+    clingen_rate_limit: float | None,
+    mavedb_rate_limit: float | None,
+    cache_dir: str | None,
+    clingen_bulk: bool,
+    score_set_urns: tuple[str, ...],
+    score_set_bulk_threshold: int,
+    offline_index: str | None,
+    columns: str | None,
+):
+    """
+    Serve MaveDB lookups over a local HTTP/JSON API until interrupted.
+    """
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    output_columns = None
+    if columns is not None:
+        output_columns = [column.strip() for column in columns.split(",") if column.strip()]
+        unknown_columns = [column for column in output_columns if column not in OUTPUT_COLUMNS]
+        if unknown_columns:
+            raise click.BadParameter(
+                f"Unknown columns: {', '.join(unknown_columns)}", param_hint="--columns"
+            )
+
+    response_cache = ResponseCache(cache_dir) if cache_dir is not None else None
+    metrics = Metrics()
+    retry_policy = RetryPolicy(max_retries=max_retries)
+    clingen_options = dict(
+        base_url=clingen_url,
+        allele_cache_size=allele_cache_size,
+        timeout=clingen_timeout,
+        pool_size=pool_size,
+        max_in_flight=max_in_flight,
+        retry_policy=retry_policy,
+        rate_limit=clingen_rate_limit,
+        response_cache=response_cache,
+        metrics=metrics,
+    )
+    mavedb_options = dict(
+        base_url=mavedb_url,
+        score_set_cache_size=score_set_cache_size,
+        lookup_cache_size=lookup_cache_size,
+        lookup_batch_size=lookup_batch_size,
+        timeout=mavedb_timeout,
+        pool_size=pool_size,
+        max_in_flight=max_in_flight,
+        retry_policy=retry_policy,
+        rate_limit=mavedb_rate_limit,
+        response_cache=response_cache,
+        metrics=metrics,
+    )
+    if offline_index is not None:
+        try:
+            index = OfflineIndex(offline_index)
+        except (ValueError, sqlite3.DatabaseError) as e:
+            raise click.ClickException(str(e))
+        clingen_client = OfflineClingenClient(index, **{**clingen_options, "response_cache": None})
+        mavedb_client = OfflineMaveDBClient(index, **{**mavedb_options, "response_cache": None})
+        score_set_bulk_threshold = sys.maxsize
+    else:
+        clingen_client = ClingenClient(**clingen_options)
+        mavedb_client = MaveDBClient(**mavedb_options)
+    score_set_lookup = (
+        ScoreSetRestrictedLookup(
+            mavedb_client, list(score_set_urns), bulk_threshold=score_set_bulk_threshold
+        )
+        if score_set_urns
+        else None
+    )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        service = LookupService(
+            clingen_client,
+            mavedb_client,
+            executor=executor,
+            clingen_bulk=clingen_bulk,
+            score_set_lookup=score_set_lookup,
+            columns=output_columns,
+            max_batch_size=max_batch_size,
+            related_dna_variants=related_dna_variants,
+            related_protein_variants=related_protein_variants,
+            always_include_related_variants=always_include_related_variants,
+        )
+        server = LookupServer(service, host, port)
+        click.echo(f"Serving lookups at {server.url}", err=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if response_cache is not None:
+                response_cache.close()
+
+
+if __name__ == "__main__":
+    main()
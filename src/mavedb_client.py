@@ -1,34 +1,405 @@
-import requests
+import csv
+import io
+import threading
+from concurrent.futures import Executor
+from typing import Any, cast
+
+from api_client import ApiClient
+from memory_cache import LruCache
+
+DEFAULT_MAVEDB_URL = "https://api.mavedb.org/api/v1"
+
+
+def parse_csv_value(value: str) -> Any:
+    """
+    Convert a value from a MaveDB CSV export back to the JSON value it represents. Integers, such as counts, stay
+    integers, as in the API's JSON.
+    """
+    if value in ("", "NA"):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class ScoreSetVariantTable:
+    """
+    All the variants of one score set, with their scores, counts and ClinGen allele IDs, stored column by column.
+
+    Rows are indexed by ClinGen allele ID, so that the measurements matching an allele can be found without asking
+    MaveDB. The measurement records returned have the same shape as those returned by allele ID lookups, and the
+    MaveDB ID of each variant's mapped variant is kept, so that measurements can be put in the order allele ID
+    lookups return them in.
+    """
+
+    # Columns of the score and count exports that identify variants rather than holding data.
+    VARIANT_COLUMNS = ("accession", "hgvs_nt", "hgvs_splice", "hgvs_pro")
+
+    def __init__(
+        self,
+        score_set_urn: str,
+        scores_csv: str,
+        counts_csv: str | None,
+        clingen_allele_ids_by_variant_urn: dict[str, str],
+        mapped_variant_ids_by_variant_urn: dict[str, int] | None = None,
+    ):
+        self.score_set_urn = score_set_urn
+        self.mapped_variant_ids_by_variant_urn = mapped_variant_ids_by_variant_urn or {}
+        self.variant_urns: list[str] = []
+        self.score_columns: dict[str, list[Any]] = {}
+        self.count_columns: dict[str, list[Any]] = {}
+        self.rows_by_clingen_allele_id: dict[str, list[int]] = {}
+
+        score_reader = csv.DictReader(io.StringIO(scores_csv))
+        score_column_names = [
+            name
+            for name in (score_reader.fieldnames or [])
+            if name not in self.VARIANT_COLUMNS
+        ]
+        self.score_columns = {name: [] for name in score_column_names}
+        for row_index, row in enumerate(score_reader):
+            variant_urn = row["accession"]
+            self.variant_urns.append(variant_urn)
+            for name in score_column_names:
+                self.score_columns[name].append(parse_csv_value(row[name]))
+            clingen_allele_id = clingen_allele_ids_by_variant_urn.get(variant_urn)
+            if clingen_allele_id:
+                self.rows_by_clingen_allele_id.setdefault(clingen_allele_id, []).append(
+                    row_index
+                )
+
+        if counts_csv:
+            count_reader = csv.DictReader(io.StringIO(counts_csv))
+            count_column_names = [
+                name
+                for name in (count_reader.fieldnames or [])
+                if name not in self.VARIANT_COLUMNS
+            ]
+            counts_by_variant_urn = {
+                row["accession"]: row for row in count_reader
+            }
+            self.count_columns = {
+                name: [
+                    parse_csv_value(counts_by_variant_urn[variant_urn][name])
+                    if variant_urn in counts_by_variant_urn
+                    else None
+                    for variant_urn in self.variant_urns
+                ]
+                for name in count_column_names
+            }
+
+    def __len__(self):
+        return len(self.variant_urns)
+
+    def measurements(self, clingen_allele_id: str) -> list[Any]:
+        return [
+            {
+                "urn": self.variant_urns[row_index],
+                "data": {
+                    "score_data": {
+                        name: values[row_index]
+                        for name, values in self.score_columns.items()
+                    },
+                    "count_data": {
+                        name: values[row_index]
+                        for name, values in self.count_columns.items()
+                    },
+                },
+                "scoreSet": {"urn": self.score_set_urn},
+            }
+            for row_index in self.rows_by_clingen_allele_id.get(clingen_allele_id, [])
+        ]
 
 
 # TODO: Use mavedb Python package with view models after https://github.com/VariantEffect/mavedb-api/issues/597.
-class MaveDBClient:
-    def __init__(self, base_url="https://api.mavedb.org/api/v1"):
-        self.base_url = base_url
+class MaveDBClient(ApiClient):
+    def __init__(
+        self,
+        base_url=DEFAULT_MAVEDB_URL,
+        score_set_cache_size=512,
+        score_set_variant_table_cache_size=16,
+        lookup_cache_size=100000,
+        lookup_batch_size=100,
+        **kwargs,
+    ):
+        """
+        :param kwargs: Connection, retry and caching options passed on to ApiClient.
+        """
+        super().__init__(base_url, **kwargs)
+        self.lookup_batch_size = lookup_batch_size
+        # Score sets are large and shared by many measurements, so fetch each one only once per run.
+        self.score_set_cache = LruCache(score_set_cache_size)
+        # Compiled per-score-set data derived from the score sets by callers, such as mavedb_lookup's profiles.
+        self.score_set_profile_cache = LruCache(score_set_cache_size)
+        # Whole-score-set variant tables are large, so only a few are kept.
+        self.score_set_variant_table_cache = LruCache(score_set_variant_table_cache_size)
+        # Lookup results by ClinGen allele ID, so that an allele ID shared by several batches is looked up once.
+        self.lookup_cache = LruCache(lookup_cache_size)
 
     def fetch_score_set(self, urn: str):
-        response = requests.get(f"{self.base_url}/score-sets/{urn}")
+        return self.score_set_cache.get_or_fetch(
+            urn,
+            lambda: self.cached(
+                "score_set", urn, lambda: self._fetch_score_set_uncached(urn)
+            ),
+        )
+
+    def _fetch_score_set_uncached(self, urn: str):
+        response = self.request(
+            "GET", f"{self.base_url}/score-sets/{urn}", stage="mavedb.score_set"
+        )
         if response.status_code == 404:
             return None
         response.raise_for_status()
         return response.json()
 
+    def fetch_score_set_variant_table(self, urn: str) -> ScoreSetVariantTable | None:
+        """
+        Download a score set's complete scores, counts and mapped variants, and join them into a local table.
+
+        :return: The score set's variant table, or None if the score set does not exist.
+        """
+        return self.score_set_variant_table_cache.get_or_fetch(
+            urn, lambda: self._fetch_score_set_variant_table_uncached(urn)
+        )
+
+    def _fetch_score_set_variant_table_uncached(self, urn: str):
+        response = self.request(
+            "GET",
+            f"{self.base_url}/score-sets/{urn}/scores",
+            stage="mavedb.score_set_table",
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        scores_csv = response.text
+
+        response = self.request(
+            "GET",
+            f"{self.base_url}/score-sets/{urn}/counts",
+            stage="mavedb.score_set_table",
+        )
+        counts_csv = None
+        if response.status_code != 404:
+            response.raise_for_status()
+            counts_csv = response.text
+
+        response = self.request(
+            "GET",
+            f"{self.base_url}/score-sets/{urn}/mapped-variants",
+            stage="mavedb.score_set_table",
+        )
+        mapped_variants = []
+        if response.status_code != 404:
+            response.raise_for_status()
+            mapped_variants = response.json()
+        if not isinstance(mapped_variants, list):
+            raise TypeError("Expected JSON response to be a list")
+        current_mapped_variants = [
+            mapped_variant
+            for mapped_variant in mapped_variants
+            if mapped_variant.get("variantUrn")
+            and mapped_variant.get("clingenAlleleId")
+            and mapped_variant.get("current", True)
+        ]
+        clingen_allele_ids_by_variant_urn = {
+            mapped_variant["variantUrn"]: mapped_variant["clingenAlleleId"]
+            for mapped_variant in current_mapped_variants
+        }
+        mapped_variant_ids_by_variant_urn = {
+            mapped_variant["variantUrn"]: mapped_variant["id"]
+            for mapped_variant in current_mapped_variants
+            if mapped_variant.get("id") is not None
+        }
+
+        return ScoreSetVariantTable(
+            urn,
+            scores_csv,
+            counts_csv,
+            clingen_allele_ids_by_variant_urn,
+            mapped_variant_ids_by_variant_urn,
+        )
+
     def fetch_variant_effect_measurements(self, clingen_allele_id: str):
-        response = requests.post(
+        return self.fetch_variant_effect_measurements_batch([clingen_allele_id])[
+            clingen_allele_id
+        ]
+
+    def fetch_variant_effect_measurements_batch(
+        self, clingen_allele_ids: list[str], executor: Executor | None = None
+    ):
+        """
+        Look up the variant effect measurements for several ClinGen allele IDs.
+
+        The IDs are deduplicated and sent to MaveDB in requests of at most lookup_batch_size IDs each. IDs whose
+        results are in the in-memory lookup cache or the response cache are not sent at all.
+
+        :param clingen_allele_ids: The ClinGen allele IDs to look up.
+        :param executor: If given, the requests are sent concurrently using this executor.
+        :return: A dictionary mapping each requested ClinGen allele ID to its list of variant effect measurements.
+        """
+        measurements: dict[str, list[Any]] = {}
+        uncached_clingen_allele_ids = []
+        for clingen_allele_id in dict.fromkeys(clingen_allele_ids):
+            cached_measurements = self.lookup_cache.get(clingen_allele_id)
+            if cached_measurements is None and self.response_cache:
+                cached_measurements = self.get_cached("lookup", clingen_allele_id)
+                if cached_measurements is not None:
+                    self.lookup_cache.put(clingen_allele_id, cached_measurements)
+            if cached_measurements is None:
+                uncached_clingen_allele_ids.append(clingen_allele_id)
+            else:
+                measurements[clingen_allele_id] = cached_measurements
+
+        batches = [
+            uncached_clingen_allele_ids[start : start + self.lookup_batch_size]
+            for start in range(
+                0, len(uncached_clingen_allele_ids), self.lookup_batch_size
+            )
+        ]
+        map_function = executor.map if executor else map
+        for batch_measurements in map_function(
+            self._fetch_variant_effect_measurements_batch, batches
+        ):
+            measurements.update(batch_measurements)
+            for clingen_allele_id, allele_measurements in batch_measurements.items():
+                self.lookup_cache.put(clingen_allele_id, allele_measurements)
+                self.set_cached("lookup", clingen_allele_id, allele_measurements)
+        return measurements
+
+    def _fetch_variant_effect_measurements_batch(self, clingen_allele_ids: list[str]):
+        response = self.request(
+            "POST",
             f"{self.base_url}/variants/clingen-allele-id-lookups",
-            json={"clingenAlleleIds": [clingen_allele_id]},
+            json={"clingenAlleleIds": clingen_allele_ids},
+            stage="mavedb.lookup",
         )
+        measurements: dict[str, list[Any]] = {
+            clingen_allele_id: [] for clingen_allele_id in clingen_allele_ids
+        }
         if response.status_code == 404:
-            return []
+            return measurements
         response.raise_for_status()
         variants = response.json()
         if not isinstance(variants, list):
             raise TypeError("Expected JSON response to be a list")
-        if not variants:
-            return []
-        first_variant = variants[0]
-        if not isinstance(first_variant, dict):
-            raise TypeError("Expected first array element to be an object")
-        return (first_variant.get("exactMatch", {}) or {}).get(
-            "variantEffectMeasurements", []
-        )
+        for index, variant in enumerate(variants):
+            if not isinstance(variant, dict):
+                raise TypeError("Expected array elements to be objects")
+            # Match response entries to allele IDs by their clingenAlleleId field, falling back to request order.
+            clingen_allele_id = variant.get("clingenAlleleId")
+            if clingen_allele_id is None:
+                if index >= len(clingen_allele_ids):
+                    raise ValueError("Received more lookup results than allele IDs")
+                clingen_allele_id = clingen_allele_ids[index]
+            measurements[clingen_allele_id] = (variant.get("exactMatch", {}) or {}).get(
+                "variantEffectMeasurements", []
+            ) or []
+        return measurements
+
+
+class ScoreSetRestrictedLookup:
+    """
+    Looks up variant effect measurements in a fixed set of score sets only.
+
+    Allele IDs are first looked up individually, and the results are filtered to the chosen score sets. Once
+    bulk_threshold allele IDs have been looked up, the score sets' complete variant tables are downloaded instead,
+    and all further allele IDs are answered from them without asking MaveDB. For a panel that covers much of a
+    score set, such as a saturation screen, a few whole-score-set downloads are far cheaper than per-allele lookups.
+
+    This has the same fetch_variant_effect_measurements_batch interface as MaveDBClient, so it can be used in its
+    place.
+    """
+
+    def __init__(
+        self,
+        mavedb_client: MaveDBClient,
+        score_set_urns: list[str],
+        bulk_threshold: int = 1000,
+    ):
+        """
+        :param bulk_threshold: The number of allele IDs to look up individually before switching to whole-score-set
+            tables. With 0, the tables are used from the start.
+        """
+        self.mavedb_client = mavedb_client
+        self.score_set_urns = list(dict.fromkeys(score_set_urns))
+        self.bulk_threshold = bulk_threshold
+        self.allele_ids_looked_up = 0
+        self._tables: list[ScoreSetVariantTable] | None = None
+        self._lock = threading.Lock()
+
+    def load_tables(self, executor: Executor | None = None) -> list[ScoreSetVariantTable]:
+        with self._lock:
+            if self._tables is None:
+                map_function = executor.map if executor else map
+                tables = list(
+                    map_function(
+                        self.mavedb_client.fetch_score_set_variant_table,
+                        self.score_set_urns,
+                    )
+                )
+                for urn, table in zip(self.score_set_urns, tables):
+                    if table is None:
+                        raise (Exception(f"Missing score set {urn}."))
+                self._tables = cast(list[ScoreSetVariantTable], tables)
+            return self._tables
+
+    def fetch_variant_effect_measurements_batch(
+        self, clingen_allele_ids: list[str], executor: Executor | None = None
+    ):
+        """
+        Look up the variant effect measurements in the chosen score sets for several ClinGen allele IDs.
+
+        :return: A dictionary mapping each requested ClinGen allele ID to its list of variant effect measurements.
+        """
+        clingen_allele_ids = list(dict.fromkeys(clingen_allele_ids))
+        # Concurrent callers, such as the requests of a lookup service, share the count of individual lookups.
+        with self._lock:
+            look_up_individually = (
+                self._tables is None
+                and self.allele_ids_looked_up + len(clingen_allele_ids) <= self.bulk_threshold
+            )
+            if look_up_individually:
+                self.allele_ids_looked_up += len(clingen_allele_ids)
+        if look_up_individually:
+            measurements = self.mavedb_client.fetch_variant_effect_measurements_batch(
+                clingen_allele_ids, executor=executor
+            )
+            return {
+                clingen_allele_id: [
+                    measurement
+                    for measurement in allele_measurements
+                    if (measurement.get("scoreSet") or {}).get("urn")
+                    in self.score_set_urns
+                ]
+                for clingen_allele_id, allele_measurements in measurements.items()
+            }
+
+        tables = self.load_tables(executor)
+
+        # MaveDB returns an allele's measurements in the order of its mapped variant records, whatever order the
+        # score sets were chosen in. Measurements without a mapped variant ID keep their table order, after the
+        # others.
+        def api_order(table: ScoreSetVariantTable, measurement: Any) -> tuple[bool, int]:
+            mapped_variant_id = table.mapped_variant_ids_by_variant_urn.get(measurement["urn"])
+            return (mapped_variant_id is None, mapped_variant_id or 0)
+
+        return {
+            clingen_allele_id: [
+                measurement
+                for _, measurement in sorted(
+                    (
+                        (api_order(table, measurement), measurement)
+                        for table in tables
+                        for measurement in table.measurements(clingen_allele_id)
+                    ),
+                    key=lambda ordered_measurement: ordered_measurement[0],
+                )
+            ]
+            for clingen_allele_id in clingen_allele_ids
+        }
@@ -1,11 +1,27 @@
-import csv
-import json
-from typing import Any, cast, NotRequired, TypedDict
+import itertools
+import os
+import sqlite3
+import sys
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import closing, nullcontext
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, cast, Iterable, Iterator, NamedTuple, NotRequired, TypedDict
 
 import click
 
-from clingen_client import ClingenClient
-from mavedb_client import MaveDBClient
+from api_client import RetryPolicy
+from clingen_client import ClingenAlleleIds, ClingenClient, DEFAULT_CLINGEN_URL
+from incremental import PreviousRun, read_score_set_urns, REQUIRED_COLUMNS, RunState
+from input_reader import read_hgvs
+from mavedb_client import DEFAULT_MAVEDB_URL, MaveDBClient, ScoreSetRestrictedLookup
+from metrics import Metrics, Profiler
+from pipeline import Pipeline
+from offline_index import OfflineClingenClient, OfflineIndex, OfflineMaveDBClient
+from response_cache import ResponseCache
+from result_writer import ArrowResultWriter, CsvResultWriter, JsonLinesResultWriter
+from run_journal import RunJournal
+from score_ranges import score_lies_in_range, ScoreRangeIndex
+from shards import Shard
 
 
 class Keyword(TypedDict):
@@ -23,6 +39,93 @@ class ExperimentKeyword(TypedDict):
     ]  # Additional details, e.g. for when the keyword is 'Other'
 
 
+OUTPUT_COLUMNS = [
+    "hgvs",
+    "clingen_allele_id",
+    "match_type",
+    "variant_urn",
+    "score",
+    "score_data",
+    "count_data",
+    "score_range_min",
+    "score_range_max",
+    "score_range_label",
+    "score_range_classification",
+    "odds_path",
+    "acmg_criterion",
+    "acmg_evidence_strength",
+    "variant_effect_measurement_source_db",
+    "variant_effect_measurement_source_identifier",
+    "variant_effect_measurement_source_first_author",
+    "variant_effect_measurement_source_publication_year",
+    "variant_effect_measurement_source_publication_journal",
+    "calibration_source_db",
+    "calibration_source_identifier",
+    "method_source_db",
+    "method_source_identifier",
+    "evidence_strength_source_db",
+    "evidence_strength_source_identifier",
+    "score_set_urn",
+    "score_set_title",
+    "score_set_short_description",
+    "score_set_published_date",
+    "experiment_urn",
+    "experiment_title",
+    "experiment_short_description",
+    "experiment_variant_library_creation_method_label",
+    "experiment_variant_library_creation_method_description",
+    "experiment_endogenous_locus_library_method_system_label",
+    "experiment_endogenous_locus_library_method_system_description",
+    "experiment_endogenous_locus_library_method_mechanism_label",
+    "experiment_endogenous_locus_library_method_mechanism_description",
+    "experiment_in_vitro_construct_library_method_system_label",
+    "experiment_in_vitro_construct_library_method_system_description",
+    "experiment_in_vitro_construct_library_method_mechanism_label",
+    "experiment_in_vitro_construct_library_method_mechanism_description",
+    "experiment_delivery_method_label",
+    "experiment_delivery_method_description",
+    "experiment_phenotypic_assay_dimensionality_label",
+    "experiment_phenotypic_assay_dimensionality_description",
+    "experiment_phenotypic_assay_method_label",
+    "experiment_phenotypic_assay_method_description",
+    "experiment_phentypic_assay_mechanism_label",
+    "experiment_phentypic_assay_mechanism_description",
+    "experiment_molecular_mechanism_assessed_label",
+    "experiment_molecular_mechanism_assessed_description",
+    "experiment_phenotypic_assay_model_system_label",
+    "experiment_phenotypic_assay_model_system_description",
+    "experiment_phenotypic_assay_profiling_strategy_label",
+    "experiment_phenotypic_assay_profiling_strategy_description",
+    "experiment_phenotypic_assay_sequencing_read_type_label",
+    "experiment_phenotypic_assay_sequencing_read_type_description",
+    "experiment_detects_nmd_variants",
+    "experiment_detects_splicing_variants",
+]
+
+# Column types for Parquet and Arrow output. Columns holding score-set-level data repeat the same few values in
+# many rows, so they are dictionary-encoded.
+OUTPUT_COLUMN_TYPES: dict[str, str] = {
+    **{column: "dictionary" for column in OUTPUT_COLUMNS},
+    "hgvs": "string",
+    "clingen_allele_id": "string",
+    "variant_urn": "string",
+    "score": "float",
+    "score_data": "map",
+    "count_data": "map",
+    "score_range_min": "float",
+    "score_range_max": "float",
+    "odds_path": "float",
+    "variant_effect_measurement_source_publication_year": "int",
+    "experiment_detects_nmd_variants": "bool",
+    "experiment_detects_splicing_variants": "bool",
+}
+
+OUTPUT_FORMATS = ["csv", "jsonl", "parquet", "arrow"]
+
+# Number of score sets fetched at once in the background when lookups run in a pipeline.
+SCORE_SET_PREFETCH_WORKERS = 4
+
+
 def can_detect_nmd_variants(
     score_set_urn: str,
     experiment_variant_library_creation_method: ExperimentKeyword | None,
@@ -72,587 +175,1399 @@ def find_keyword(experiment_keywords: list[ExperimentKeyword], key: str):
     )
 
 
-def score_lies_in_range(score: float, range: Any):
-    score_range = range.get("range", None)
-    if score_range is None:
-        return False
-    inclusive_lower_bound = cast(bool, range.get("inclusiveLowerBound", False))
-    inclusive_upper_bound = cast(bool, range.get("inclusiveUpperBound", False))
-    range_min = cast(float | None, score_range[0])
-    range_max = cast(float | None, score_range[1])
-    if inclusive_lower_bound:
-        if range_min is not None and score < range_min:
-            return False
-    else:
-        if range_min is not None and score <= range_min:
-            return False
-    if inclusive_upper_bound:
-        if range_max is not None and score > range_max:
-            return False
-    else:
-        if range_max is not None and score >= range_max:
-            return False
-    return True
+# Output column prefixes for the experiment's controlled keywords, with the keys identifying them in MaveDB.
+EXPERIMENT_KEYWORD_COLUMNS = [
+    ("experiment_variant_library_creation_method", "Variant Library Creation Method"),
+    (
+        "experiment_endogenous_locus_library_method_system",
+        "Endogenous Locus Library Method System",
+    ),
+    (
+        "experiment_endogenous_locus_library_method_mechanism",
+        "Endogenous Locus Library Method Mechanism",
+    ),
+    (
+        "experiment_in_vitro_construct_library_method_system",
+        "In Vitro Construct Library Method System",
+    ),
+    (
+        "experiment_in_vitro_construct_library_method_mechanism",
+        "In Vitro Construct Library Method Mechanism",
+    ),
+    ("experiment_delivery_method", "Delivery method"),
+    ("experiment_phenotypic_assay_dimensionality", "Phenotypic Assay Dimensionality"),
+    ("experiment_phenotypic_assay_method", "Phenotypic Assay Method"),
+    ("experiment_phentypic_assay_mechanism", "Phenotypic Assay Mechanism"),
+    ("experiment_molecular_mechanism_assessed", "Molecular Mechanism Assessed"),
+    ("experiment_phenotypic_assay_model_system", "Phenotypic Assay Model System"),
+    (
+        "experiment_phenotypic_assay_profiling_strategy",
+        "Phenotypic Assay Profiling Strategy",
+    ),
+    (
+        "experiment_phenotypic_assay_sequencing_read_type",
+        "Phenotypic Assay Sequencing Read Type",
+    ),
+]
 
+# Range and calibration columns for a score that does not lie in any range of the primary calibration.
+EMPTY_SCORE_RANGE_COLUMNS: dict[str, Any] = {
+    "score_range_label": None,
+    "score_range_classification": None,
+    "score_range_min": None,
+    "score_range_max": None,
+    "odds_path": None,
+    "acmg_criterion": None,
+    "acmg_evidence_strength": None,
+    "calibration_source_db": None,
+    "calibration_source_identifier": None,
+    "method_source_db": None,
+    "method_source_identifier": None,
+    "evidence_strength_source_db": None,
+    "evidence_strength_source_identifier": None,
+}
 
-def build_result_from_variant_effect_measurement(
-    mavedb_client: MaveDBClient,
-    variant_effect_measurement: Any,
-    original_hgvs: str,
-    clingen_allele_id: str,
-    match_type: str,
-):
-    variant_urn = cast(str, variant_effect_measurement.get("urn"))
-    score_data = variant_effect_measurement.get("data", {}).get("score_data", {})
-    count_data = variant_effect_measurement.get("data", {}).get("count_data", {})
-    score = cast(float | None, score_data.get("score", None))
-    score_set_urn = cast(str, variant_effect_measurement.get("scoreSet").get("urn"))
+# Output columns that hold a measurement's own data. All other columns are the same for every measurement in a
+# score set, or in a score range.
+MEASUREMENT_COLUMNS = OUTPUT_COLUMNS[:7]
 
-    score_set = mavedb_client.fetch_score_set(score_set_urn)
-    if score_set is None:
-        raise (Exception(f"Missing score set for variant {hgvs} (URN {variant_urn})."))
 
+@dataclass(frozen=True, slots=True)
+class ResultRow:
+    """
+    A result row: one variant effect measurement that matched an HGVS string.
+
+    A row only holds its measurement's own data. All of its other columns are the same for every measurement of
+    its score set whose score lies in the same range, so the row refers to a dictionary of them that the score
+    set's profile builds once and shares between those rows. The row is expanded to a dictionary of all its columns
+    only when it is written. Use get, or to_dict, to read any output column by name, as from a dictionary.
+    """
+
+    hgvs: str
+    clingen_allele_id: str
+    match_type: str
+    variant_urn: str
+    score: float
+    score_data: dict[str, Any]
+    count_data: dict[str, Any] | None
+    # The range, calibration, score set, publication and experiment columns, shared with other rows.
+    shared_columns: dict[str, Any]
+
+    def get(self, column: str, default: Any = None) -> Any:
+        if column in _MEASUREMENT_COLUMN_SET:
+            return getattr(self, column)
+        return self.shared_columns.get(column, default)
+
+    def __getitem__(self, column: str) -> Any:
+        value = self.get(column, _MISSING)
+        if value is _MISSING:
+            raise KeyError(column)
+        return value
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        The row's columns as a dictionary, in output column order.
+        """
+        return {
+            "hgvs": self.hgvs,
+            "clingen_allele_id": self.clingen_allele_id,
+            "match_type": self.match_type,
+            "variant_urn": self.variant_urn,
+            "score": self.score,
+            "score_data": self.score_data,
+            "count_data": self.count_data,
+            **self.shared_columns,
+        }
+
+    def with_hgvs(self, hgvs: str) -> "ResultRow":
+        """
+        The same row, for another HGVS string that resolved to the same allele.
+        """
+        return replace(self, hgvs=hgvs)
+
+
+_MEASUREMENT_COLUMN_SET = frozenset(MEASUREMENT_COLUMNS)
+_MISSING = object()
+
+# A row of output: a result row, or, in an incremental run, a dictionary of a row read from the previous output.
+OutputRow = ResultRow | dict[str, Any]
+
+# The number of scores from one score set above which ScoreSetProfile.classify_scores classifies them as an array.
+VECTORIZED_CLASSIFICATION_MIN_SCORES = 64
+
+
+@dataclass(frozen=True, slots=True)
+class ScoreSetProfile:
+    """
+    Score-set-level data shared by every measurement in a score set, compiled once per score set.
+
+    Building a result row from a profile only requires extracting the measurement's score and classifying it. The
+    rows of a score set share the columns that are not specific to their measurements, which the profile holds once
+    for each score range.
+    """
+
+    urn: str
+    # Score set, publication and experiment columns, which are the same for every measurement.
+    columns: dict[str, Any]
+    # The primary calibration's functional ranges, each with the shared columns of rows whose scores lie in it: the
+    # range and calibration columns, followed by the score set's columns.
+    functional_ranges: tuple[tuple[Any, dict[str, Any]], ...]
+    range_index: ScoreRangeIndex
+    # The shared columns of rows whose scores do not lie in any range.
+    no_range_columns: dict[str, Any]
+    modification_date: str | None = None
+
+    def classify_score(self, score: float) -> dict[str, Any]:
+        """
+        Get the shared columns of a result row with the given score.
+        """
+        range_index = self.range_index.classify(score)
+        if range_index is None:
+            return self.no_range_columns
+        return self.functional_ranges[range_index][1]
+
+    def classify_scores(self, scores: list[float]) -> list[dict[str, Any]]:
+        """
+        Classify many scores at once, with the same results as calling classify_score for each of them.
+
+        The vectorized index is only used for at least VECTORIZED_CLASSIFICATION_MIN_SCORES scores; for fewer, the
+        cost of converting to and from arrays outweighs the savings.
+        """
+        if len(scores) < VECTORIZED_CLASSIFICATION_MIN_SCORES:
+            return [self.classify_score(score) for score in scores]
+        return [
+            self.functional_ranges[range_index][1]
+            if range_index >= 0
+            else self.no_range_columns
+            for range_index in self.range_index.classify_many(scores).tolist()
+        ]
+
+
+def compile_score_set_profile(
+    score_set_urn: str, score_set: Any, columns: tuple[str, ...] | None = None
+) -> ScoreSetProfile:
+    """
+    :param columns: If given, the profile only holds these output columns, and no others are computed.
+    """
     experiment = score_set.get("experiment")
     if experiment is None:
-        raise (Exception(f"Missing experiment for variant {hgvs} (URN {variant_urn})."))
+        raise (Exception(f"Missing experiment for score set {score_set_urn}."))
 
     primary_publications = score_set.get("primaryPublicationIdentifiers", [])
-    primary_publication = primary_publications[0] if primary_publications else None
-    variant_effect_measurement_source_db = (
-        cast(str | None, primary_publication.get("dbName", None))
-        if primary_publication
-        else None
-    )
-    variant_effect_measurement_source_identifier = (
-        cast(str | None, primary_publication.get("identifier", None))
-        if primary_publication
-        else None
-    )
-    variant_effect_measurement_source_authors = (
-        primary_publication.get("authors", []) if primary_publication else []
-    )
+    primary_publication = primary_publications[0] if primary_publications else {}
     variant_effect_measurement_source_first_author = next(
         (
             author
-            for author in variant_effect_measurement_source_authors
+            for author in primary_publication.get("authors", [])
             if author.get("primary", False)
         ),
         None,
     )
-    variant_effect_measurement_source_first_author_name = (
-        cast(
-            str | None,
-            variant_effect_measurement_source_first_author.get("name", None),
-        )
-        if variant_effect_measurement_source_first_author
-        else None
-    )
-    variant_effect_measurement_source_publication_year = (
-        cast(int | None, primary_publication.get("publicationYear", None))
-        if primary_publication
-        else None
-    )
-    variant_effect_measurement_source_publication_journal = (
-        cast(
-            str | None,
-            primary_publication.get("publicationJournal", None),
+
+    # Find each keyword in a single pass. As in find_keyword, the first keyword with a given key wins.
+    experiment_keywords_by_key: dict[str, ExperimentKeyword] = {}
+    for experiment_keyword in experiment.get("keywords", []):
+        experiment_keywords_by_key.setdefault(
+            experiment_keyword.get("keyword", {}).get("key", None), experiment_keyword
         )
-        if primary_publication
-        else None
+    experiment_variant_library_creation_method = experiment_keywords_by_key.get(
+        "Variant Library Creation Method"
     )
 
-    experiment_keywords = experiment.get("keywords", [])
-    experiment_variant_library_creation_method = find_keyword(
-        experiment_keywords, "Variant Library Creation Method"
-    )
-    experiment_endogenous_locus_library_method_system = find_keyword(
-        experiment_keywords, "Endogenous Locus Library Method System"
-    )
-    experiment_endogenous_locus_library_method_mechanism = find_keyword(
-        experiment_keywords, "Endogenous Locus Library Method Mechanism"
-    )
-    experiment_in_vitro_construct_library_method_system = find_keyword(
-        experiment_keywords, "In Vitro Construct Library Method System"
-    )
-    experiment_in_vitro_construct_library_method_mechanism = find_keyword(
-        experiment_keywords,
-        "In Vitro Construct Library Method Mechanism",
-    )
-    experiment_delivery_method = find_keyword(experiment_keywords, "Delivery method")
-    experiment_phenotypic_assay_dimensionality = find_keyword(
-        experiment_keywords, "Phenotypic Assay Dimensionality"
-    )
-    experiment_phenotypic_assay_method = find_keyword(
-        experiment_keywords, "Phenotypic Assay Method"
-    )
-    experiment_phentypic_assay_mechanism = find_keyword(
-        experiment_keywords, "Phenotypic Assay Mechanism"
-    )
-    experiment_molecular_mechanism_assessed = find_keyword(
-        experiment_keywords, "Molecular Mechanism Assessed"
-    )
-    experiment_phenotypic_assay_model_system = find_keyword(
-        experiment_keywords, "Phenotypic Assay Model System"
+    score_set_columns: dict[str, Any] = {
+        # Source publication data
+        "variant_effect_measurement_source_db": primary_publication.get("dbName", None),
+        "variant_effect_measurement_source_identifier": primary_publication.get(
+            "identifier", None
+        ),
+        "variant_effect_measurement_source_first_author": (
+            variant_effect_measurement_source_first_author.get("name", None)
+            if variant_effect_measurement_source_first_author
+            else None
+        ),
+        "variant_effect_measurement_source_publication_year": primary_publication.get(
+            "publicationYear", None
+        ),
+        "variant_effect_measurement_source_publication_journal": primary_publication.get(
+            "publicationJournal", None
+        ),
+        # Score set and experiment metadata
+        "score_set_urn": score_set_urn,
+        "score_set_title": score_set.get("title", None),
+        "score_set_short_description": score_set.get("shortDescription", None),
+        "score_set_published_date": score_set.get("publishedDate", None),
+        "experiment_urn": experiment.get("urn", None),
+        "experiment_title": experiment.get("title", None),
+        "experiment_short_description": experiment.get("shortDescription", None),
+    }
+    # Controlled keywords
+    for column_prefix, key in EXPERIMENT_KEYWORD_COLUMNS:
+        if columns is not None and not (
+            f"{column_prefix}_label" in columns or f"{column_prefix}_description" in columns
+        ):
+            continue
+        experiment_keyword = experiment_keywords_by_key.get(key)
+        score_set_columns[f"{column_prefix}_label"] = (
+            experiment_keyword.get("keyword", {}).get("label", None)
+            if experiment_keyword
+            else None
+        )
+        score_set_columns[f"{column_prefix}_description"] = (
+            experiment_keyword.get("description", None) if experiment_keyword else None
+        )
+    score_set_columns["experiment_detects_nmd_variants"] = can_detect_nmd_variants(
+        score_set_urn, experiment_variant_library_creation_method
     )
-    experiment_phenotypic_assay_profiling_strategy = find_keyword(
-        experiment_keywords, "Phenotypic Assay Profiling Strategy"
+    score_set_columns["experiment_detects_splicing_variants"] = can_detect_splicing_variants(
+        score_set_urn, experiment_variant_library_creation_method
     )
-    experiment_phenotypic_assay_sequencing_read_type = find_keyword(
-        experiment_keywords, "Phenotypic Assay Sequencing Read Type"
+
+    primary_calibration = next(
+        (
+            calibration
+            for calibration in score_set.get("scoreCalibrations", [])
+            if calibration.get("primary", False)
+            and not calibration.get("researchUseOnly", False)
+        ),
+        None,
     )
+    functional_ranges: list[tuple[Any, dict[str, Any]]] = []
+    if primary_calibration:
+        calibration_sources = primary_calibration.get("threshold_sources", [])
+        calibration_source = calibration_sources[0] if calibration_sources else {}
+        method_sources = primary_calibration.get("method_sources", [])
+        method_source = method_sources[0] if method_sources else {}
+        evidence_strength_sources = primary_calibration.get("classification_sources", [])
+        classification_source = (
+            evidence_strength_sources[0] if evidence_strength_sources else {}
+        )
+        calibration_source_columns = {
+            "calibration_source_db": calibration_source.get("dbName", None),
+            "calibration_source_identifier": calibration_source.get("identifier", None),
+            "method_source_db": method_source.get("dbName", None),
+            "method_source_identifier": method_source.get("identifier", None),
+            "evidence_strength_source_db": classification_source.get("dbName", None),
+            "evidence_strength_source_identifier": classification_source.get(
+                "identifier", None
+            ),
+        }
+        for functional_range in primary_calibration.get("functionalRanges", []):
+            acmg_classification = functional_range.get("acmg_classification", {}) or {}
+            functional_ranges.append(
+                (
+                    functional_range,
+                    {
+                        "score_range_label": functional_range.get("label", None),
+                        "score_range_classification": functional_range.get(
+                            "classification", None
+                        ),
+                        "score_range_min": (functional_range.get("range") or [None, None])[0],
+                        "score_range_max": (functional_range.get("range") or [None, None])[1],
+                        "odds_path": functional_range.get("oddspaths_ratio", None),
+                        "acmg_criterion": acmg_classification.get("criterion", None),
+                        "acmg_evidence_strength": acmg_classification.get(
+                            "evidence_strength", None
+                        ),
+                        **calibration_source_columns,
+                    },
+                )
+            )
 
-    experiment_detects_nmd_variants = can_detect_nmd_variants(
-        score_set_urn, experiment_variant_library_creation_method
+    def project(all_columns: dict[str, Any]) -> dict[str, Any]:
+        if columns is None:
+            return all_columns
+        return {
+            column: value for column, value in all_columns.items() if column in columns
+        }
+
+    return ScoreSetProfile(
+        urn=score_set_urn,
+        columns=project(score_set_columns),
+        functional_ranges=tuple(
+            (functional_range, project({**range_columns, **score_set_columns}))
+            for functional_range, range_columns in functional_ranges
+        ),
+        range_index=ScoreRangeIndex(
+            [functional_range for functional_range, _ in functional_ranges]
+        ),
+        no_range_columns=project({**EMPTY_SCORE_RANGE_COLUMNS, **score_set_columns}),
+        modification_date=score_set.get("modificationDate"),
     )
-    experiment_detects_splicing_variants = can_detect_splicing_variants(
-        score_set_urn, experiment_variant_library_creation_method
+
+
+def get_score_set_profile(
+    mavedb_client: MaveDBClient,
+    score_set_urn: str,
+    columns: tuple[str, ...] | None = None,
+) -> ScoreSetProfile | None:
+    """
+    Get the compiled profile of a score set, fetching and compiling the score set if necessary.
+
+    :param columns: If given, the profile only holds these output columns.
+    :return: The score set's profile, or None if the score set does not exist.
+    """
+
+    def compile_profile():
+        score_set = mavedb_client.fetch_score_set(score_set_urn)
+        if score_set is None:
+            return None
+        return compile_score_set_profile(score_set_urn, score_set, columns)
+
+    return mavedb_client.score_set_profile_cache.get_or_fetch(
+        (score_set_urn, columns), compile_profile
     )
 
-    score_range_label: str | None = None
-    score_range_classification: str | None = None
-    score_range_min: float | None = None
-    score_range_max: float | None = None
-    odds_path: float | None = None
-    acmg_criterion: str | None = None
-    acmg_evidence_strength: str | None = None
-    calibration_source_db: str | None = None
-    calibration_source_identifier: str | None = None
-    method_source_db: str | None = None
-    method_source_identifier: str | None = None
-    evidence_strength_source_db: str | None = None
-    evidence_strength_source_identifier: str | None = None
+
+def build_result_from_variant_effect_measurement(
+    mavedb_client: MaveDBClient,
+    variant_effect_measurement: Any,
+    original_hgvs: str,
+    clingen_allele_id: str,
+    match_type: str,
+    columns: tuple[str, ...] | None = None,
+    shared_columns_by_score: dict[float, dict[str, Any]] | None = None,
+) -> ResultRow | None:
+    """
+    Build a result row from a variant effect measurement.
+
+    Score and count data are kept as dictionaries, which result writers encode as needed.
+
+    :param columns: If given, score-set-level columns other than these are not computed, and may be missing from
+        the result.
+    :param shared_columns_by_score: If given, the shared columns of rows of the measurement's score set, by score,
+        as classified in advance. Scores missing from it are classified here.
+    :return: The result row, or None if the measurement has no score.
+    """
+    variant_urn = cast(str, variant_effect_measurement.get("urn"))
+    score_data = variant_effect_measurement.get("data", {}).get("score_data", {})
+    count_data = variant_effect_measurement.get("data", {}).get("count_data", {})
+    score = cast(float | None, score_data.get("score", None))
+    score_set_urn = cast(str, variant_effect_measurement.get("scoreSet").get("urn"))
+
+    score_set_profile = get_score_set_profile(mavedb_client, score_set_urn, columns)
+    if score_set_profile is None:
+        raise (
+            Exception(
+                f"Missing score set for variant {original_hgvs} (URN {variant_urn})."
+            )
+        )
 
     if score is None:
         return None
-    else:
-        calibrations = score_set.get("scoreCalibrations", [])
-
-        primary_calibration = next(
-            (
-                calibration
-                for calibration in calibrations
-                if calibration.get("primary", False)
-                and not calibration.get("researchUseOnly", False)
-            ),
-            None,
-        )
 
-        if primary_calibration:
-            for range in primary_calibration.get("functionalRanges", []):
-                if score_lies_in_range(score, range):
-                    score_range_label = cast(str | None, range.get("label", None))
-                    score_range_classification = cast(
-                        str | None, range.get("classification", None)
-                    )
-                    score_range_min = cast(
-                        float | None,
-                        range.get("range", [None, None])[0],
-                    )
-                    score_range_max = cast(
-                        float | None,
-                        range.get("range", [None, None])[1],
-                    )
-                    odds_path = cast(
-                        float | None,
-                        range.get("oddspaths_ratio", None),
-                    )
-                    acmg_criterion = cast(
-                        str | None,
-                        range.get("acmg_classification", {}).get("criterion", None),
-                    )
-                    acmg_evidence_strength = cast(
-                        str | None,
-                        range.get("acmg_classification", {}).get(
-                            "evidence_strength", None
-                        ),
-                    )
-                    calibration_sources = primary_calibration.get(
-                        "threshold_sources", []
-                    )
-                    calibration_source = (
-                        calibration_sources[0] if calibration_sources else {}
-                    )
-                    calibration_source_db = calibration_source.get("dbName", None)
-                    calibration_source_identifier = calibration_source.get(
-                        "identifier", None
-                    )
-                    method_sources = primary_calibration.get("method_sources", [])
-                    method_source = method_sources[0] if method_sources else {}
-                    method_source_db = method_source.get("dbName", None)
-                    method_source_identifier = method_source.get("identifier", None)
-                    evidence_strength_sources = primary_calibration.get(
-                        "classification_sources", []
-                    )
-                    classification_source = (
-                        evidence_strength_sources[0]
-                        if evidence_strength_sources
-                        else {}
-                    )
-                    evidence_strength_source_db = classification_source.get(
-                        "dbName", None
-                    )
-                    evidence_strength_source_identifier = classification_source.get(
-                        "identifier", None
-                    )
-                    break
+    shared_columns = (
+        shared_columns_by_score.get(score) if shared_columns_by_score is not None else None
+    )
+    if shared_columns is None:
+        shared_columns = score_set_profile.classify_score(score)
 
-        return {
+    with mavedb_client.metrics.time("result.build"):
+        return ResultRow(
             # Variant identifiers
-            "hgvs": original_hgvs,
-            "clingen_allele_id": clingen_allele_id,
-            "match_type": match_type,
-            "variant_urn": variant_urn,
+            hgvs=original_hgvs,
+            clingen_allele_id=clingen_allele_id,
+            match_type=match_type,
+            variant_urn=variant_urn,
             # Variant effect measurement data
-            "score": score,
-            "score_data": json.dumps(score_data),
-            "count_data": json.dumps(count_data) if count_data else None,
-            # Calibration data
-            "score_range_label": score_range_label,
-            "score_range_classification": score_range_classification,
-            "score_range_min": score_range_min,
-            "score_range_max": score_range_max,
-            "odds_path": odds_path,
-            "acmg_criterion": acmg_criterion,
-            "acmg_evidence_strength": acmg_evidence_strength,
-            # Source publication data
-            "variant_effect_measurement_source_db": variant_effect_measurement_source_db,
-            "variant_effect_measurement_source_identifier": variant_effect_measurement_source_identifier,
-            "variant_effect_measurement_source_first_author": variant_effect_measurement_source_first_author_name,
-            "variant_effect_measurement_source_publication_year": variant_effect_measurement_source_publication_year,
-            "variant_effect_measurement_source_publication_journal": variant_effect_measurement_source_publication_journal,
-            # Calibration source data
-            "calibration_source_db": calibration_source_db,
-            "calibration_source_identifier": calibration_source_identifier,
-            "method_source_db": method_source_db,
-            "method_source_identifier": method_source_identifier,
-            "evidence_strength_source_db": evidence_strength_source_db,
-            "evidence_strength_source_identifier": evidence_strength_source_identifier,
-            # Score set and experiment metadata
-            "score_set_urn": score_set_urn,
-            "score_set_title": score_set.get("title", None),
-            "score_set_short_description": score_set.get("shortDescription", None),
-            "score_set_published_date": score_set.get("publishedDate", None),
-            "experiment_urn": experiment.get("urn", None),
-            "experiment_title": experiment.get("title", None),
-            "experiment_short_description": experiment.get("shortDescription", None),
-            # Controlled keywords
-            "experiment_variant_library_creation_method_label": experiment_variant_library_creation_method.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_variant_library_creation_method
-            else None,
-            "experiment_variant_library_creation_method_description": experiment_variant_library_creation_method.get(
-                "description", None
-            )
-            if experiment_variant_library_creation_method
-            else None,
-            "experiment_endogenous_locus_library_method_system_label": experiment_endogenous_locus_library_method_system.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_endogenous_locus_library_method_system
-            else None,
-            "experiment_endogenous_locus_library_method_system_description": experiment_endogenous_locus_library_method_system.get(
-                "description", None
-            )
-            if experiment_endogenous_locus_library_method_system
-            else None,
-            "experiment_endogenous_locus_library_method_mechanism_label": experiment_endogenous_locus_library_method_mechanism.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_endogenous_locus_library_method_mechanism
-            else None,
-            "experiment_endogenous_locus_library_method_mechanism_description": experiment_endogenous_locus_library_method_mechanism.get(
-                "description", None
-            )
-            if experiment_endogenous_locus_library_method_mechanism
-            else None,
-            "experiment_in_vitro_construct_library_method_system_label": experiment_in_vitro_construct_library_method_system.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_in_vitro_construct_library_method_system
-            else None,
-            "experiment_in_vitro_construct_library_method_system_description": experiment_in_vitro_construct_library_method_system.get(
-                "description", None
-            )
-            if experiment_in_vitro_construct_library_method_system
-            else None,
-            "experiment_in_vitro_construct_library_method_mechanism_label": experiment_in_vitro_construct_library_method_mechanism.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_in_vitro_construct_library_method_mechanism
-            else None,
-            "experiment_in_vitro_construct_library_method_mechanism_description": experiment_in_vitro_construct_library_method_mechanism.get(
-                "description", None
-            )
-            if experiment_in_vitro_construct_library_method_mechanism
-            else None,
-            "experiment_delivery_method_label": experiment_delivery_method.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_delivery_method
-            else None,
-            "experiment_delivery_method_description": experiment_delivery_method.get(
-                "description", None
+            score=score,
+            score_data=score_data,
+            count_data=count_data or None,
+            # Calibration, calibration source, source publication, score set and experiment data
+            shared_columns=shared_columns,
+        )
+
+
+@dataclass
+class LookupPass:
+    """
+    One pass of a batch lookup: the allele IDs of some match types for some HGVS strings, and their measurements.
+    """
+
+    match_types: list[str]
+    clingen_allele_ids_by_hgvs: dict[str, list[tuple[str, str]]]
+    # Each distinct (match type, allele ID) pair, with the first HGVS string that refers to it.
+    first_hgvs_by_allele: dict[tuple[str, str], str]
+    measurements_by_allele_id: dict[str, list[Any]] | None = None
+
+
+class HgvsBatchLookup:
+    """
+    The lookup of a batch of HGVS strings in MaveDB, in three stages that can run in a pipeline, each stage working
+    on a different batch:
+
+    1. resolve_alleles: Resolve the HGVS strings and their MANE transcripts to ClinGen allele IDs.
+    2. fetch_measurements: Fetch the alleles' variant effect measurements, and start fetching the score sets they
+       belong to in the background.
+    3. build_results: Build the result rows, and look up related variants if they are requested.
+
+    The batch is planned before any requests are sent. Repeated HGVS strings are looked up once, and the ClinGen
+    allele IDs of all the distinct HGVS strings are collected so that MaveDB can be queried with a few batched
+    requests rather than one request per allele ID. Result rows for an allele ID are built once and then shared by
+    every HGVS string that resolved to it.
+    """
+
+    def __init__(
+        self,
+        clingen_client: ClingenClient,
+        mavedb_client: MaveDBClient,
+        hgvs_batch: list[str],
+        related_dna_variants: bool,
+        related_protein_variants: bool,
+        always_include_related_variants: bool,
+        executor: Executor | None = None,
+        clingen_bulk: bool = False,
+        score_set_lookup: ScoreSetRestrictedLookup | None = None,
+        columns: tuple[str, ...] | None = None,
+        prefetch_executor: Executor | None = None,
+        previous_run: PreviousRun | None = None,
+    ):
+        """
+        :param executor: If given, ClinGen lookups, MaveDB requests and result building are run concurrently using
+            this executor. Results are returned in input order either way.
+        :param clingen_bulk: If true, HGVS strings are resolved through ClinGen's bulk interface before any
+            individual lookups.
+        :param score_set_lookup: If given, only measurements in this lookup's score sets are returned, and they are
+            looked up through it rather than directly in MaveDB.
+        :param columns: If given, only these output columns are computed.
+        :param prefetch_executor: If given, score sets are fetched using this executor as soon as measurements
+            refer to them, rather than when the first result row that needs them is built.
+        :param previous_run: If given, the previous run's result rows are reused for HGVS strings whose measurements
+            and score sets have not changed since, instead of being built again.
+        """
+        self.clingen_client = clingen_client
+        self.mavedb_client = mavedb_client
+        self.hgvs_batch = hgvs_batch
+        self.related_dna_variants = related_dna_variants
+        self.related_protein_variants = related_protein_variants
+        self.always_include_related_variants = always_include_related_variants
+        self.executor = executor
+        self.clingen_bulk = clingen_bulk
+        self.score_set_lookup = score_set_lookup
+        self.columns = columns
+        self.prefetch_executor = prefetch_executor
+        self.previous_run = previous_run
+        self.metrics = mavedb_client.metrics
+        self.map_function = executor.map if executor else map
+
+        self.unique_hgvs = list(dict.fromkeys(hgvs_batch))
+        self.allele_ids_by_hgvs: dict[str, ClingenAlleleIds] = {}
+        self.results_by_hgvs: dict[str, list[OutputRow]] = {
+            hgvs: [] for hgvs in self.unique_hgvs
+        }
+        self.found_match = {hgvs: False for hgvs in self.unique_hgvs}
+        self._first_pass: LookupPass | None = None
+
+    def resolve_alleles(self) -> "HgvsBatchLookup":
+        with self.metrics.time("lookup.resolve_alleles"):
+            if self.clingen_bulk:
+                self.clingen_client.fetch_clingen_alleles_bulk(
+                    self.unique_hgvs, executor=self.executor
+                )
+            self.allele_ids_by_hgvs = dict(
+                zip(
+                    self.unique_hgvs,
+                    self.map_function(
+                        self.clingen_client.fetch_clingen_allele_ids, self.unique_hgvs
+                    ),
+                )
             )
-            if experiment_delivery_method
-            else None,
-            "experiment_phenotypic_assay_dimensionality_label": experiment_phenotypic_assay_dimensionality.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_phenotypic_assay_dimensionality
-            else None,
-            "experiment_phenotypic_assay_dimensionality_description": experiment_phenotypic_assay_dimensionality.get(
-                "description", None
+        self._first_pass = self._plan_pass(["exact", "mane"], self.unique_hgvs)
+        return self
+
+    def fetch_measurements(self) -> "HgvsBatchLookup":
+        self._fetch_measurements(cast(LookupPass, self._first_pass))
+        return self
+
+    def build_results(self) -> list[list[OutputRow]]:
+        """
+        :return: For each HGVS string in the batch, a list of result rows.
+        """
+        lookup_passes = [cast(LookupPass, self._first_pass)]
+        self._first_pass = None
+        self._record_matches(lookup_passes[0])
+        # Whether related variants are needed only depends on which measurements have scores, so every pass's
+        # measurements are fetched before any rows are built.
+        for requested, match_type in [
+            (self.related_dna_variants, "related_dna"),
+            (self.related_protein_variants, "related_protein"),
+        ]:
+            if requested:
+                lookup_pass = self._plan_pass([match_type], self._hgvs_needing_related_variants())
+                self._fetch_measurements(lookup_pass)
+                self._record_matches(lookup_pass)
+                lookup_passes.append(lookup_pass)
+
+        reused_hgvs: set[str] = set()
+        if self.previous_run is not None:
+            for hgvs in self.unique_hgvs:
+                previous_rows = self.previous_run.reusable_rows(
+                    hgvs,
+                    self._result_measurements(hgvs, lookup_passes),
+                    self._get_modification_date,
+                )
+                if previous_rows is not None:
+                    self.results_by_hgvs[hgvs] = previous_rows
+                    reused_hgvs.add(hgvs)
+
+        for lookup_pass in lookup_passes:
+            self._build_results(lookup_pass, reused_hgvs)
+        return [self.results_by_hgvs[hgvs] for hgvs in self.hgvs_batch]
+
+    def _plan_pass(self, match_types: list[str], hgvs_to_look_up: list[str]) -> LookupPass:
+        allele_ids_by_hgvs = self.allele_ids_by_hgvs
+
+        # MANE and related allele sets are resolved lazily, so only the HGVS strings that reach this stage pay for
+        # them.
+        def resolve_allele_sets(hgvs: str):
+            for match_type in match_types:
+                allele_ids_by_hgvs[hgvs][match_type]
+
+        if self.clingen_bulk:
+            self.clingen_client.fetch_clingen_alleles_bulk(
+                [
+                    related_hgvs
+                    for hgvs in hgvs_to_look_up
+                    for match_type in match_types
+                    for related_hgvs in allele_ids_by_hgvs[hgvs].unresolved_hgvs(
+                        match_type
+                    )
+                ],
+                executor=self.executor,
             )
-            if experiment_phenotypic_assay_dimensionality
-            else None,
-            "experiment_phenotypic_assay_method_label": experiment_phenotypic_assay_method.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_phenotypic_assay_method
-            else None,
-            "experiment_phenotypic_assay_method_description": experiment_phenotypic_assay_method.get(
-                "description", None
+
+        with self.metrics.time("lookup.resolve_allele_sets"):
+            list(self.map_function(resolve_allele_sets, hgvs_to_look_up))
+
+        clingen_allele_ids_by_hgvs = {
+            hgvs: [
+                (match_type, clingen_allele_id)
+                for match_type in match_types
+                for clingen_allele_id in (
+                    [allele_ids_by_hgvs[hgvs]["exact"]]
+                    if match_type == "exact"
+                    else allele_ids_by_hgvs[hgvs][match_type]
+                )
+                if clingen_allele_id
+            ]
+            for hgvs in hgvs_to_look_up
+        }
+        first_hgvs_by_allele: dict[tuple[str, str], str] = {}
+        for hgvs, clingen_allele_ids in clingen_allele_ids_by_hgvs.items():
+            for allele in clingen_allele_ids:
+                first_hgvs_by_allele.setdefault(allele, hgvs)
+        return LookupPass(match_types, clingen_allele_ids_by_hgvs, first_hgvs_by_allele)
+
+    def _fetch_measurements(self, lookup_pass: LookupPass):
+        measurement_source = self.score_set_lookup or self.mavedb_client
+        with self.metrics.time("lookup.fetch_measurements"):
+            lookup_pass.measurements_by_allele_id = (
+                measurement_source.fetch_variant_effect_measurements_batch(
+                    [clingen_allele_id for _, clingen_allele_id in lookup_pass.first_hgvs_by_allele],
+                    executor=self.executor,
+                )
             )
-            if experiment_phenotypic_assay_method
-            else None,
-            "experiment_phentypic_assay_mechanism_label": experiment_phentypic_assay_mechanism.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_phentypic_assay_mechanism
-            else None,
-            "experiment_phentypic_assay_mechanism_description": experiment_phentypic_assay_mechanism.get(
-                "description", None
+
+        if self.prefetch_executor is not None:
+            modification_dates = dict(
+                (score_set.get("urn"), score_set.get("modificationDate"))
+                for allele_measurements in lookup_pass.measurements_by_allele_id.values()
+                for variant_effect_measurement in allele_measurements
+                for score_set in [variant_effect_measurement.get("scoreSet")]
             )
-            if experiment_phentypic_assay_mechanism
-            else None,
-            "experiment_molecular_mechanism_assessed_label": experiment_molecular_mechanism_assessed.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_molecular_mechanism_assessed
-            else None,
-            "experiment_molecular_mechanism_assessed_description": experiment_molecular_mechanism_assessed.get(
-                "description", None
+            for score_set_urn, modification_date in modification_dates.items():
+                # Rows from unchanged score sets are likely to be reused, without needing the score set.
+                if self.previous_run is not None and self.previous_run.score_set_unchanged(
+                    score_set_urn, modification_date
+                ):
+                    continue
+                if (score_set_urn, self.columns) not in self.mavedb_client.score_set_profile_cache:
+                    # Failures are not cached, so a score set that cannot be fetched now fails again, and is
+                    # reported, when a result row needs it.
+                    self.prefetch_executor.submit(
+                        get_score_set_profile, self.mavedb_client, score_set_urn, self.columns
+                    )
+
+    def _build_results(self, lookup_pass: LookupPass, reused_hgvs: set[str]):
+        measurements_by_allele_id = cast(dict[str, list[Any]], lookup_pass.measurements_by_allele_id)
+        first_hgvs_by_allele = lookup_pass.first_hgvs_by_allele
+        clingen_allele_ids_by_hgvs = {
+            hgvs: clingen_allele_ids
+            for hgvs, clingen_allele_ids in lookup_pass.clingen_allele_ids_by_hgvs.items()
+            if hgvs not in reused_hgvs
+        }
+        alleles_to_build = list(
+            dict.fromkeys(
+                allele
+                for clingen_allele_ids in clingen_allele_ids_by_hgvs.values()
+                for allele in clingen_allele_ids
             )
-            if experiment_molecular_mechanism_assessed
-            else None,
-            "experiment_phenotypic_assay_model_system_label": experiment_phenotypic_assay_model_system.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_phenotypic_assay_model_system
-            else None,
-            "experiment_phenotypic_assay_model_system_description": experiment_phenotypic_assay_model_system.get(
-                "description", None
+        )
+
+        shared_columns_by_score_set = self._classify_scores(
+            [
+                variant_effect_measurement
+                for _, clingen_allele_id in alleles_to_build
+                for variant_effect_measurement in measurements_by_allele_id[clingen_allele_id]
+            ]
+        )
+
+        def build_allele_results(allele: tuple[str, str]):
+            match_type, clingen_allele_id = allele
+            allele_results = []
+            for variant_effect_measurement in measurements_by_allele_id[
+                clingen_allele_id
+            ]:
+                result = build_result_from_variant_effect_measurement(
+                    self.mavedb_client,
+                    variant_effect_measurement,
+                    first_hgvs_by_allele[allele],
+                    clingen_allele_id,
+                    match_type,
+                    self.columns,
+                    shared_columns_by_score_set.get(
+                        variant_effect_measurement.get("scoreSet").get("urn")
+                    ),
+                )
+                if result:
+                    allele_results.append(result)
+            return allele_results
+
+        with self.metrics.time("lookup.build_results"):
+            results_by_allele = dict(
+                zip(
+                    alleles_to_build,
+                    self.map_function(build_allele_results, alleles_to_build),
+                )
             )
-            if experiment_phenotypic_assay_model_system
-            else None,
-            "experiment_phenotypic_assay_profiling_strategy_label": experiment_phenotypic_assay_profiling_strategy.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_phenotypic_assay_profiling_strategy
-            else None,
-            "experiment_phenotypic_assay_profiling_strategy_description": experiment_phenotypic_assay_profiling_strategy.get(
-                "description", None
+
+        for hgvs, clingen_allele_ids in clingen_allele_ids_by_hgvs.items():
+            for allele in clingen_allele_ids:
+                allele_results = results_by_allele[allele]
+                if allele_results:
+                    if first_hgvs_by_allele[allele] == hgvs:
+                        self.results_by_hgvs[hgvs].extend(allele_results)
+                    else:
+                        self.results_by_hgvs[hgvs].extend(
+                            result.with_hgvs(hgvs) for result in allele_results
+                        )
+
+    def _classify_scores(
+        self, variant_effect_measurements: list[Any]
+    ) -> dict[str, dict[float, dict[str, Any]]]:
+        """
+        Classify the scores of many measurements, one score set at a time, so that score sets with many measurements
+        in the batch are classified as arrays.
+
+        :return: For each score set whose profile could be found, the shared columns of its rows, by score.
+        """
+        scores_by_score_set: dict[str, dict[float, None]] = {}
+        for variant_effect_measurement in variant_effect_measurements:
+            score = variant_effect_measurement.get("data", {}).get("score_data", {}).get("score")
+            if score is not None:
+                score_set_urn = variant_effect_measurement.get("scoreSet").get("urn")
+                scores_by_score_set.setdefault(score_set_urn, {})[score] = None
+
+        def classify_score_set_scores(score_set_urn: str):
+            score_set_profile = get_score_set_profile(
+                self.mavedb_client, score_set_urn, self.columns
             )
-            if experiment_phenotypic_assay_profiling_strategy
-            else None,
-            "experiment_phenotypic_assay_sequencing_read_type_label": experiment_phenotypic_assay_sequencing_read_type.get(
-                "keyword", {}
-            ).get("label", None)
-            if experiment_phenotypic_assay_sequencing_read_type
-            else None,
-            "experiment_phenotypic_assay_sequencing_read_type_description": experiment_phenotypic_assay_sequencing_read_type.get(
-                "description", None
+            # Missing score sets are reported when the first of their rows is built.
+            if score_set_profile is None:
+                return None
+            scores = list(scores_by_score_set[score_set_urn])
+            with self.metrics.time("result.classify"):
+                return dict(zip(scores, score_set_profile.classify_scores(scores)))
+
+        score_set_urns = list(scores_by_score_set)
+        return {
+            score_set_urn: shared_columns_by_score
+            for score_set_urn, shared_columns_by_score in zip(
+                score_set_urns, self.map_function(classify_score_set_scores, score_set_urns)
             )
-            if experiment_phenotypic_assay_sequencing_read_type
-            else None,
-            "experiment_detects_nmd_variants": experiment_detects_nmd_variants,
-            "experiment_detects_splicing_variants": experiment_detects_splicing_variants,
+            if shared_columns_by_score is not None
         }
 
+    def _record_matches(self, lookup_pass: LookupPass):
+        """
+        Note which HGVS strings have a match, that is, a measurement with a score, in a pass.
+        """
+        measurements_by_allele_id = cast(dict[str, list[Any]], lookup_pass.measurements_by_allele_id)
+        for hgvs, clingen_allele_ids in lookup_pass.clingen_allele_ids_by_hgvs.items():
+            if any(
+                variant_effect_measurement.get("data", {}).get("score_data", {}).get("score") is not None
+                for _, clingen_allele_id in clingen_allele_ids
+                for variant_effect_measurement in measurements_by_allele_id[clingen_allele_id]
+            ):
+                self.found_match[hgvs] = True
+
+    def _result_measurements(
+        self, hgvs: str, lookup_passes: list[LookupPass]
+    ) -> list[tuple[str, str, str, str | None]]:
+        """
+        Describe the result rows an HGVS string would get: the match type, variant URN, score set URN and score set
+        modification date of each measurement with a score, in the order of the rows.
+        """
+        result_measurements = []
+        for lookup_pass in lookup_passes:
+            measurements_by_allele_id = cast(dict[str, list[Any]], lookup_pass.measurements_by_allele_id)
+            for match_type, clingen_allele_id in lookup_pass.clingen_allele_ids_by_hgvs.get(hgvs, []):
+                for variant_effect_measurement in measurements_by_allele_id[clingen_allele_id]:
+                    score_data = variant_effect_measurement.get("data", {}).get("score_data", {})
+                    if score_data.get("score") is None:
+                        continue
+                    score_set = variant_effect_measurement.get("scoreSet")
+                    result_measurements.append(
+                        (
+                            match_type,
+                            variant_effect_measurement.get("urn"),
+                            score_set.get("urn"),
+                            score_set.get("modificationDate"),
+                        )
+                    )
+        return result_measurements
+
+    def _get_modification_date(self, score_set_urn: str) -> str | None:
+        score_set_profile = get_score_set_profile(self.mavedb_client, score_set_urn, self.columns)
+        return score_set_profile.modification_date if score_set_profile else None
+
+    def _hgvs_needing_related_variants(self) -> list[str]:
+        return [
+            hgvs
+            for hgvs in self.unique_hgvs
+            if self.always_include_related_variants or not self.found_match[hgvs]
+        ]
+
+
+def lookup_hgvs_batch(
+    clingen_client: ClingenClient,
+    mavedb_client: MaveDBClient,
+    hgvs_batch: list[str],
+    related_dna_variants: bool,
+    related_protein_variants: bool,
+    always_include_related_variants: bool,
+    executor: Executor | None = None,
+    clingen_bulk: bool = False,
+    score_set_lookup: ScoreSetRestrictedLookup | None = None,
+    columns: tuple[str, ...] | None = None,
+) -> list[list[ResultRow]]:
+    """
+    Look up a batch of HGVS strings in MaveDB, running all the stages of an HgvsBatchLookup in turn.
+
+    :return: For each HGVS string in the batch, a list of result rows.
+    """
+    # Without a previous run, no rows are reused, so every row is a ResultRow.
+    return cast(
+        list[list[ResultRow]],
+        HgvsBatchLookup(
+            clingen_client,
+            mavedb_client,
+            hgvs_batch,
+            related_dna_variants,
+            related_protein_variants,
+            always_include_related_variants,
+            executor=executor,
+            clingen_bulk=clingen_bulk,
+            score_set_lookup=score_set_lookup,
+            columns=columns,
+        )
+        .resolve_alleles()
+        .fetch_measurements()
+        .build_results(),
+    )
+
+
+@dataclass
+class LookupOptions:
+    """
+    Options of a lookup run: which result rows are looked up, and how.
+    """
+
+    related_dna_variants: bool = False
+    related_protein_variants: bool = False
+    always_include_related_variants: bool = False
+    # If given, only these output columns are computed, and rows may lack the others.
+    columns: list[str] | None = None
+    # Input rows are looked up in batches of this many rows.
+    batch_size: int = 500
+    # The number of batches waiting between the stages of the pipeline. With 0, each batch is finished before the
+    # next one starts.
+    pipeline_depth: int = 2
+    # Resolve HGVS strings through ClinGen's bulk interface before any individual lookups.
+    clingen_bulk: bool = False
+    # If given, only measurements in these score sets are looked up.
+    score_set_urns: list[str] = field(default_factory=list)
+    # Score sets with at most this many variants are looked up allele by allele, rather than by fetching the whole
+    # score set.
+    score_set_bulk_threshold: int = 1000
+
+
+class InputRowResults(NamedTuple):
+    """
+    The result rows of one input row.
+    """
+
+    row_number: int
+    hgvs: str
+    rows: list[OutputRow]
+
+
+def lookup_input_rows(
+    numbered_hgvs: Iterable[tuple[int, str]],
+    clingen_client: ClingenClient,
+    mavedb_client: MaveDBClient,
+    options: LookupOptions | None = None,
+    executor: Executor | None = None,
+    previous_run: PreviousRun | None = None,
+    thread_initializer: Callable[[], None] | None = None,
+) -> Iterator[InputRowResults]:
+    """
+    Look up input rows in MaveDB, yielding each row's results in input order as soon as its batch is finished.
+
+    Input rows are read a batch at a time, as they are needed, and at most a few batches are in progress at once,
+    so memory use depends on the batch size rather than on the size of the input. Closing the iterator stops the
+    lookup.
+
+    :param numbered_hgvs: Each input row's number and HGVS string.
+    :param executor: If given, each batch's requests and result building are run concurrently using this executor.
+    :param previous_run: If given, the previous run's rows are reused for HGVS strings whose measurements and score
+        sets have not changed since. Reused rows are dictionaries of the values read from the previous output.
+    :param thread_initializer: If given, called at the start of each thread that the lookup starts.
+    """
+    options = options or LookupOptions()
+    columns = tuple(options.columns) if options.columns is not None else None
+    score_set_lookup = (
+        ScoreSetRestrictedLookup(
+            mavedb_client,
+            list(options.score_set_urns),
+            bulk_threshold=options.score_set_bulk_threshold,
+        )
+        if options.score_set_urns
+        else None
+    )
+    # With a pipeline, score sets are fetched in the background as soon as a batch's measurements refer to them.
+    prefetch_executor = (
+        ThreadPoolExecutor(max_workers=SCORE_SET_PREFETCH_WORKERS, initializer=thread_initializer)
+        if options.pipeline_depth > 0
+        else None
+    )
+
+    def input_batches() -> Iterator[list[tuple[int, str]]]:
+        batch: list[tuple[int, str]] = []
+        for row_number, hgvs in numbered_hgvs:
+            batch.append((row_number, hgvs))
+            if len(batch) >= options.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def resolve_batch(batch: list[tuple[int, str]]):
+        batch_lookup = HgvsBatchLookup(
+            clingen_client,
+            mavedb_client,
+            [hgvs for _, hgvs in batch],
+            options.related_dna_variants,
+            options.related_protein_variants,
+            options.always_include_related_variants,
+            executor=executor,
+            clingen_bulk=options.clingen_bulk,
+            score_set_lookup=score_set_lookup,
+            columns=columns,
+            prefetch_executor=prefetch_executor,
+            previous_run=previous_run,
+        )
+        return batch, batch_lookup.resolve_alleles()
+
+    def fetch_batch_measurements(resolved_batch: tuple[list[tuple[int, str]], HgvsBatchLookup]):
+        batch, batch_lookup = resolved_batch
+        return batch, batch_lookup.fetch_measurements()
+
+    def build_batch_results(resolved_batch: tuple[list[tuple[int, str]], HgvsBatchLookup]):
+        batch, batch_lookup = resolved_batch
+        return batch, batch_lookup.build_results()
+
+    with prefetch_executor or nullcontext():
+        # In a pipeline, each stage works on a different batch: while one batch's results are built and consumed,
+        # the next batch's measurements are fetched and the batch after that is resolved in ClinGen. Batches come
+        # out of the pipeline in input order.
+        if options.pipeline_depth > 0:
+            built_batches = Pipeline(
+                [
+                    ("resolve_alleles", resolve_batch),
+                    ("fetch_measurements", fetch_batch_measurements),
+                    ("build_results", build_batch_results),
+                ],
+                queue_size=options.pipeline_depth,
+                metrics=mavedb_client.metrics,
+                thread_initializer=thread_initializer,
+            ).run(input_batches())
+        else:
+            built_batches = (
+                build_batch_results(fetch_batch_measurements(resolve_batch(batch)))
+                for batch in input_batches()
+            )
+
+        # Closing the pipeline stops its threads before the prefetch executor is shut down.
+        with closing(built_batches):
+            for batch, batch_results in built_batches:
+                for (row_number, hgvs), rows in zip(batch, batch_results):
+                    yield InputRowResults(row_number, hgvs, rows)
+
+
+def lookup_variants(
+    hgvs_strings: Iterable[str],
+    options: LookupOptions | None = None,
+    clingen_client: ClingenClient | None = None,
+    mavedb_client: MaveDBClient | None = None,
+    executor: Executor | None = None,
+) -> Iterator[ResultRow]:
+    """
+    Look up HGVS strings in MaveDB, yielding their result rows lazily, in input order.
+
+    Clients can be shared by many lookups, including concurrent ones, so that the lookups share caches and
+    connections. Clients that are not given are created with default settings for this lookup.
+
+    :param executor: If given, each batch's requests and result building are run concurrently using this executor.
+    """
+    if mavedb_client is None:
+        mavedb_client = MaveDBClient(metrics=clingen_client.metrics if clingen_client else None)
+    if clingen_client is None:
+        clingen_client = ClingenClient(metrics=mavedb_client.metrics)
+    input_row_results = lookup_input_rows(
+        enumerate(hgvs_strings), clingen_client, mavedb_client, options, executor=executor
+    )
+    with closing(input_row_results):
+        for _, _, rows in input_row_results:
+            # Without a previous run, no rows are reused, so every row is a ResultRow.
+            yield from cast(list[ResultRow], rows)
+
+
+def parse_shard_option(context: click.Context, parameter: click.Parameter, value: str | None) -> Shard | None:
+    if value is None:
+        return None
+    try:
+        return Shard.parse(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
 
 @click.command()
-@click.argument("input_csv")
+@click.argument("input_file")
 @click.argument("output_csv")
 @click.option("--hgvs-column", default="hgvs")
 @click.option("--related-dna-variants", is_flag=True)
 @click.option("--related-protein-variants", is_flag=True)
 @click.option("--always-include-related-variants", is_flag=True)
-@click.option("--limit", type=int)
+@click.option("--limit", type=click.IntRange(min=0))
+@click.option(
+    "--shard",
+    callback=parse_shard_option,
+    help='Only look up the input rows in this shard, given as "i/N" to take the i-th of N shards.',
+)
+@click.option("--score-set-cache-size", type=click.IntRange(min=1), default=512)
+@click.option("--allele-cache-size", type=click.IntRange(min=1), default=100000)
+@click.option("--lookup-cache-size", type=click.IntRange(min=1), default=100000)
+@click.option("--batch-size", type=click.IntRange(min=1), default=500)
+@click.option("--pipeline-depth", type=click.IntRange(min=0), default=2)
+@click.option("--lookup-batch-size", type=click.IntRange(min=1), default=100)
+@click.option("--pool-size", type=click.IntRange(min=1), default=10)
+@click.option("--keep-alive/--no-keep-alive", default=True)
+@click.option("--workers", "--concurrency", type=click.IntRange(min=1), default=1)
+@click.option("--max-in-flight", type=click.IntRange(min=1), default=8)
+@click.option("--clingen-url", default=DEFAULT_CLINGEN_URL)
+@click.option("--mavedb-url", default=DEFAULT_MAVEDB_URL)
+@click.option("--clingen-timeout", type=click.FloatRange(min=0, min_open=True), default=10.0)
+@click.option("--mavedb-timeout", type=click.FloatRange(min=0, min_open=True), default=30.0)
+@click.option("--max-retries", type=click.IntRange(min=0), default=5)
+@click.option("--clingen-rate-limit", type=click.FloatRange(min=0, min_open=True), help="Requests per second.")
+@click.option("--mavedb-rate-limit", type=click.FloatRange(min=0, min_open=True), help="Requests per second.")
+@click.option("--cache-dir", type=click.Path(file_okay=False))
+@click.option("--cache-max-size", type=click.IntRange(min=1), help="In megabytes.")
+@click.option("--cache-ttl-alleles", type=click.IntRange(min=0), help="In seconds.")
+@click.option("--cache-ttl-lookups", type=click.IntRange(min=0), help="In seconds.")
+@click.option("--cache-ttl-score-sets", type=click.IntRange(min=0), help="In seconds.")
+@click.option("--clingen-bulk", is_flag=True)
+@click.option("--score-set", "score_set_urns", multiple=True)
+@click.option("--score-set-bulk-threshold", type=click.IntRange(min=0), default=1000)
+@click.option("--offline-index", type=click.Path(exists=True, dir_okay=False))
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+@click.option("--columns", help="Comma-separated list of output columns.")
+@click.option("--flush-interval", type=click.FloatRange(min=0), default=5.0)
+@click.option("--resume", is_flag=True)
+@click.option(
+    "--incremental-from",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Reuse unchanged results from the output of an earlier run with the same options.",
+)
+@click.option("--metrics-json", type=click.Path(dir_okay=False), help="Write run metrics to this JSON file.")
+@click.option(
+    "--metrics-prometheus",
+    type=click.Path(dir_okay=False),
+    help="Write run metrics to this file in the Prometheus text format.",
+)
+@click.option("--profile", "profile_path", type=click.Path(dir_okay=False), help="Write a cProfile profile here.")
 def main(
-    input_csv: str,
+    input_file: str,
     output_csv: str,
     hgvs_column: str,
     related_dna_variants: bool,
     related_protein_variants: bool,
     always_include_related_variants: bool,
     limit: int | None,
+    shard: Shard | None,
+    score_set_cache_size: int,
+    allele_cache_size: int,
+    lookup_cache_size: int,
+    batch_size: int,
+    pipeline_depth: int,
+    lookup_batch_size: int,
+    pool_size: int,
+    keep_alive: bool,
+    workers: int,
+    max_in_flight: int,
+    clingen_url: str,
+    mavedb_url: str,
+    clingen_timeout: float,
+    mavedb_timeout: float,
+    max_retries: int,
+    clingen_rate_limit: float | None,
+    mavedb_rate_limit: float | None,
+    cache_dir: str | None,
+    cache_max_size: int | None,
+    cache_ttl_alleles: int | None,
+    cache_ttl_lookups: int | None,
+    cache_ttl_score_sets: int | None,
+    clingen_bulk: bool,
+    score_set_urns: tuple[str, ...],
+    score_set_bulk_threshold: int,
+    offline_index: str | None,
+    output_format: str,
+    columns: str | None,
+    flush_interval: float,
+    resume: bool,
+    incremental_from: str | None,
+    metrics_json: str | None,
+    metrics_prometheus: str | None,
+    profile_path: str | None,
 ):
-    clingen_client = ClingenClient()
-    mavedb_client = MaveDBClient()
-    results: list[dict[str, Any]] = []
+    output_columns = OUTPUT_COLUMNS
+    if columns is not None:
+        output_columns = [column.strip() for column in columns.split(",") if column.strip()]
+        unknown_columns = [column for column in output_columns if column not in OUTPUT_COLUMNS]
+        if unknown_columns:
+            raise click.BadParameter(
+                f"Unknown columns: {', '.join(unknown_columns)}", param_hint="--columns"
+            )
+    binary_output = output_format in ["parquet", "arrow"]
+    if binary_output and resume:
+        raise click.BadParameter(
+            f"Runs writing {output_format} output cannot be resumed.", param_hint="--resume"
+        )
+
+    # The options that affect result rows, which an incremental run must share with the run it builds on.
+    run_options = {
+        "output_format": output_format,
+        "columns": output_columns,
+        "related_dna_variants": related_dna_variants,
+        "related_protein_variants": related_protein_variants,
+        "always_include_related_variants": always_include_related_variants,
+        "score_set_urns": sorted(set(score_set_urns)),
+    }
+    previous_run = None
+    if incremental_from is not None:
+        if binary_output:
+            raise click.BadParameter(
+                f"Runs writing {output_format} output cannot be incremental.",
+                param_hint="--incremental-from",
+            )
+        if resume:
+            raise click.BadParameter(
+                "Incremental runs cannot be resumed.", param_hint="--incremental-from"
+            )
+        if os.path.realpath(incremental_from) == os.path.realpath(output_csv):
+            raise click.BadParameter(
+                "The new output must be written to a different file.",
+                param_hint="--incremental-from",
+            )
+        missing_columns = [column for column in REQUIRED_COLUMNS if column not in output_columns]
+        if missing_columns:
+            raise click.BadParameter(
+                f"Incremental runs need the columns {', '.join(missing_columns)}.",
+                param_hint="--columns",
+            )
+        state_path = RunState.path_for_output(incremental_from)
+        try:
+            previous_state = RunState.read(state_path)
+        except FileNotFoundError:
+            raise click.ClickException(
+                f"{incremental_from} has no state file ({state_path}); only the output of a finished run can be "
+                "reused."
+            )
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        if previous_state.options != run_options:
+            raise click.ClickException(
+                f"{incremental_from} was written with different options, so its results cannot be reused."
+            )
+        previous_run = PreviousRun(incremental_from, output_format, previous_state)
 
-    with open(input_csv, mode="r") as infile:
-        reader = csv.DictReader(infile)
+    response_cache = None
+    if cache_dir is not None:
+        cache_ttls = {
+            resource_type: ttl
+            for resource_type, ttl in [
+                ("allele", cache_ttl_alleles),
+                ("lookup", cache_ttl_lookups),
+                ("score_set", cache_ttl_score_sets),
+            ]
+            if ttl is not None
+        }
+        response_cache = ResponseCache(
+            cache_dir,
+            ttls=cache_ttls,
+            max_size_bytes=cache_max_size * 1024 * 1024 if cache_max_size else None,
+        )
 
-        for row_number, row in enumerate(reader):
-            if limit is not None and row_number >= limit:
-                break
+    # One set of metrics is shared by both clients, so that the run summary covers every stage.
+    metrics = Metrics()
+    profiler = None
+    if profile_path is not None:
+        profiler = Profiler()
+        profiler.start_thread()
 
-            hgvs = row[hgvs_column]
+    retry_policy = RetryPolicy(max_retries=max_retries)
+    clingen_options = dict(
+        base_url=clingen_url,
+        allele_cache_size=allele_cache_size,
+        timeout=clingen_timeout,
+        pool_size=pool_size,
+        keep_alive=keep_alive,
+        max_in_flight=max_in_flight,
+        retry_policy=retry_policy,
+        rate_limit=clingen_rate_limit,
+        response_cache=response_cache,
+        metrics=metrics,
+    )
+    mavedb_options = dict(
+        base_url=mavedb_url,
+        score_set_cache_size=score_set_cache_size,
+        lookup_cache_size=lookup_cache_size,
+        lookup_batch_size=lookup_batch_size,
+        timeout=mavedb_timeout,
+        pool_size=pool_size,
+        keep_alive=keep_alive,
+        max_in_flight=max_in_flight,
+        retry_policy=retry_policy,
+        rate_limit=mavedb_rate_limit,
+        response_cache=response_cache,
+        metrics=metrics,
+    )
+    index = None
+    if offline_index is not None:
+        # Everything is served from the index, so no requests are sent.
+        try:
+            index = OfflineIndex(offline_index)
+        except (ValueError, sqlite3.DatabaseError) as e:
+            raise click.ClickException(str(e))
+        clingen_client = OfflineClingenClient(
+            index, **{**clingen_options, "response_cache": None}
+        )
+        mavedb_client = OfflineMaveDBClient(
+            index, **{**mavedb_options, "response_cache": None}
+        )
+        # Per-allele lookups in the index are as cheap as whole-score-set tables.
+        score_set_bulk_threshold = sys.maxsize
+    else:
+        clingen_client = ClingenClient(**clingen_options)
+        mavedb_client = MaveDBClient(**mavedb_options)
+    lookup_options = LookupOptions(
+        related_dna_variants=related_dna_variants,
+        related_protein_variants=related_protein_variants,
+        always_include_related_variants=always_include_related_variants,
+        columns=output_columns if columns is not None else None,
+        batch_size=batch_size,
+        pipeline_depth=pipeline_depth,
+        clingen_bulk=clingen_bulk,
+        score_set_urns=list(score_set_urns),
+        score_set_bulk_threshold=score_set_bulk_threshold,
+    )
+    thread_initializer = profiler.start_thread if profiler else None
+    executor = (
+        ThreadPoolExecutor(max_workers=workers, initializer=thread_initializer)
+        if workers > 1
+        else None
+    )
 
-            clingen_allele_ids = clingen_client.fetch_clingen_allele_ids(hgvs)
-            found_exact_match_or_mane_match = False
+    # Completed input rows are recorded in a journal next to the output file. With --resume, rows already in the
+    # journal are skipped and new results are appended to the existing output. Parquet and Arrow files are only
+    # valid once complete, so they have no journal.
+    journal = (
+        RunJournal(RunJournal.path_for_output(output_csv)) if not binary_output else None
+    )
+    completed_rows: dict[int, str] = {}
+    # The score sets of rows restored by --resume, or None if they are unknown because the output has no variant
+    # URNs.
+    restored_score_set_urns: set[str] | None = set()
+    if resume and journal is not None and os.path.exists(output_csv):
+        # Any output written after the last journaled row belongs to an unfinished batch, and is discarded.
+        journal_entries = journal.restore(output_csv)
+        if journal_entries:
+            completed_rows = {entry.row_number: entry.hgvs for entry in journal_entries}
+            restored_score_set_urns = None
+            click.echo(f"Resuming after {len(completed_rows)} completed rows", err=True)
+            # The restored rows were built in an earlier session, from score set versions that were never recorded.
+            if "variant_urn" in output_columns:
+                restored_score_set_urns = read_score_set_urns(output_csv, output_format)
+    if journal is not None and not completed_rows:
+        journal.open(append=False)
+    # A state file describes a finished run, so one left by an earlier run to the same output no longer applies.
+    if os.path.exists(RunState.path_for_output(output_csv)):
+        os.remove(RunState.path_for_output(output_csv))
 
-            # if not clingen_allele_ids:
-            #     print(f"Warning: No allele ID found for {hgvs}")
-            #     continue
+    try:
+        hgvs_strings = read_hgvs(input_file, hgvs_column)
+    except (ImportError, ValueError) as e:
+        raise click.ClickException(str(e))
 
-            clingen_allele_id = clingen_allele_ids["exact"]
-            if clingen_allele_id:
-                variant_effect_measurements = (
-                    mavedb_client.fetch_variant_effect_measurements(clingen_allele_id)
+    # Input is read lazily, and results are written as soon as each batch of input rows is finished, so memory use
+    # depends on the batch size rather than on the size of the input.
+    with (
+        closing(hgvs_strings),
+        (
+            open(output_csv, mode="wb")
+            if binary_output
+            else open(output_csv, mode="a" if completed_rows else "w", newline="")
+        ) as outfile,
+        executor or nullcontext(),
+    ):
+        if binary_output:
+            try:
+                writer = ArrowResultWriter(
+                    outfile, output_columns, OUTPUT_COLUMN_TYPES, file_format=output_format
                 )
-                # print(json.dumps(variant_effect_measurements, indent=2))
-                for variant_effect_measurement in variant_effect_measurements:
-                    result = build_result_from_variant_effect_measurement(
-                        mavedb_client,
-                        variant_effect_measurement,
-                        hgvs,
-                        clingen_allele_id,
-                        "exact",
-                    )
-                    if result:
-                        found_exact_match_or_mane_match = True
-                        results.append(result)
-
-            for clingen_allele_id in clingen_allele_ids["mane"]:
-                variant_effect_measurements = (
-                    mavedb_client.fetch_variant_effect_measurements(clingen_allele_id)
+            except ImportError:
+                raise click.ClickException(
+                    f"Writing {output_format} output requires pyarrow (pip install pyarrow)."
                 )
-                # print(json.dumps(variant_effect_measurements, indent=2))
-                for variant_effect_measurement in variant_effect_measurements:
-                    result = build_result_from_variant_effect_measurement(
-                        mavedb_client,
-                        variant_effect_measurement,
-                        hgvs,
-                        clingen_allele_id,
-                        "mane",
-                    )
-                    if result:
-                        found_exact_match_or_mane_match = True
-                        results.append(result)
+        else:
+            writer_class = (
+                JsonLinesResultWriter if output_format == "jsonl" else CsvResultWriter
+            )
+            writer = writer_class(
+                outfile, output_columns, flush_interval=flush_interval, journal=journal
+            )
+        if not completed_rows:
+            writer.write_header()
 
-            if related_dna_variants and (
-                always_include_related_variants or not found_exact_match_or_mane_match
-            ):
-                for clingen_allele_id in clingen_allele_ids["related_dna"]:
-                    variant_effect_measurements = (
-                        mavedb_client.fetch_variant_effect_measurements(
-                            clingen_allele_id
+        def numbered_input_rows() -> Iterator[tuple[int, str]]:
+            for row_number, hgvs in enumerate(itertools.islice(hgvs_strings, limit)):
+                # Row numbers count every input row, so that the outputs of all shards can be merged in input order.
+                if shard is not None and not shard.contains(hgvs):
+                    continue
+                if row_number in completed_rows:
+                    if completed_rows[row_number] != hgvs:
+                        raise click.ClickException(
+                            f"Input row {row_number} does not match the journal of the run being resumed "
+                            f"({hgvs} instead of {completed_rows[row_number]})."
                         )
-                    )
-                    # print(json.dumps(variant_effect_measurements, indent=2))
-                    for variant_effect_measurement in variant_effect_measurements:
-                        result = build_result_from_variant_effect_measurement(
-                            mavedb_client,
-                            variant_effect_measurement,
-                            hgvs,
-                            clingen_allele_id,
-                            "related_dna",
-                        )
-                        if result:
-                            found_exact_match_or_mane_match = True
-                            results.append(result)
+                    continue
+                yield row_number, hgvs
 
-            if related_protein_variants and (
-                always_include_related_variants or not found_exact_match_or_mane_match
-            ):
-                for clingen_allele_id in clingen_allele_ids["related_protein"]:
-                    variant_effect_measurements = (
-                        mavedb_client.fetch_variant_effect_measurements(
-                            clingen_allele_id
-                        )
-                    )
-                    # print(json.dumps(variant_effect_measurements, indent=2))
-                    for variant_effect_measurement in variant_effect_measurements:
-                        result = build_result_from_variant_effect_measurement(
-                            mavedb_client,
-                            variant_effect_measurement,
-                            hgvs,
-                            clingen_allele_id,
-                            "related_protein",
-                        )
-                        if result:
-                            found_exact_match_or_mane_match = True
-                            results.append(result)
-
-    with open(output_csv, mode="w", newline="") as outfile:
-        fieldnames = [
-            "hgvs",
-            "clingen_allele_id",
-            "match_type",
-            "variant_urn",
-            "score",
-            "score_data",
-            "count_data",
-            "score_range_min",
-            "score_range_max",
-            "score_range_label",
-            "score_range_classification",
-            "odds_path",
-            "acmg_criterion",
-            "acmg_evidence_strength",
-            "variant_effect_measurement_source_db",
-            "variant_effect_measurement_source_identifier",
-            "variant_effect_measurement_source_first_author",
-            "variant_effect_measurement_source_publication_year",
-            "variant_effect_measurement_source_publication_journal",
-            "calibration_source_db",
-            "calibration_source_identifier",
-            "method_source_db",
-            "method_source_identifier",
-            "evidence_strength_source_db",
-            "evidence_strength_source_identifier",
-            "score_set_urn",
-            "score_set_title",
-            "score_set_short_description",
-            "score_set_published_date",
-            "experiment_urn",
-            "experiment_title",
-            "experiment_short_description",
-            "experiment_variant_library_creation_method_label",
-            "experiment_variant_library_creation_method_description",
-            "experiment_endogenous_locus_library_method_system_label",
-            "experiment_endogenous_locus_library_method_system_description",
-            "experiment_endogenous_locus_library_method_mechanism_label",
-            "experiment_endogenous_locus_library_method_mechanism_description",
-            "experiment_in_vitro_construct_library_method_system_label",
-            "experiment_in_vitro_construct_library_method_system_description",
-            "experiment_in_vitro_construct_library_method_mechanism_label",
-            "experiment_in_vitro_construct_library_method_mechanism_description",
-            "experiment_delivery_method_label",
-            "experiment_delivery_method_description",
-            "experiment_phenotypic_assay_dimensionality_label",
-            "experiment_phenotypic_assay_dimensionality_description",
-            "experiment_phenotypic_assay_method_label",
-            "experiment_phenotypic_assay_method_description",
-            "experiment_phentypic_assay_mechanism_label",
-            "experiment_phentypic_assay_mechanism_description",
-            "experiment_molecular_mechanism_assessed_label",
-            "experiment_molecular_mechanism_assessed_description",
-            "experiment_phenotypic_assay_model_system_label",
-            "experiment_phenotypic_assay_model_system_description",
-            "experiment_phenotypic_assay_profiling_strategy_label",
-            "experiment_phenotypic_assay_profiling_strategy_description",
-            "experiment_phenotypic_assay_sequencing_read_type_label",
-            "experiment_phenotypic_assay_sequencing_read_type_description",
-            "experiment_detects_nmd_variants",
-            "experiment_detects_splicing_variants",
-        ]
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(results)
+        input_row_results = lookup_input_rows(
+            numbered_input_rows(),
+            clingen_client,
+            mavedb_client,
+            lookup_options,
+            executor=executor,
+            previous_run=previous_run,
+            thread_initializer=thread_initializer,
+        )
+        try:
+            # Closing the lookup stops its threads before the input is closed.
+            with closing(input_row_results):
+                for row_number, hgvs, rows in input_row_results:
+                    with metrics.time("output.write"):
+                        writer.write_rows(rows)
+                        writer.complete_input_row(row_number, hgvs)
+        finally:
+            writer.close()
+            if journal is not None:
+                journal.close()
+
+    # Record the score set versions the output was built from, so that a later run can reuse it with
+    # --incremental-from. Score sets that rows were reused from keep their previous versions. Score sets of rows
+    # restored by --resume are left out, since their versions at the time are unknown, so a later run rebuilds
+    # those rows; if the restored rows' score sets are unknown too, no state is recorded.
+    if journal is not None and restored_score_set_urns is not None:
+        score_set_modification_dates = (
+            dict(previous_run.state.score_set_modification_dates) if previous_run else {}
+        )
+        for _, score_set_profile in mavedb_client.score_set_profile_cache.items():
+            if score_set_profile is not None:
+                score_set_modification_dates[score_set_profile.urn] = score_set_profile.modification_date
+        for score_set_urn in restored_score_set_urns:
+            score_set_modification_dates.pop(score_set_urn, None)
+        RunState(run_options, score_set_modification_dates).write(
+            RunState.path_for_output(output_csv)
+        )
+    if previous_run is not None:
+        metrics.set_cache_stats(
+            "previous_run", {"hits": previous_run.reused, "misses": previous_run.rebuilt}
+        )
+        click.echo(
+            f"Reused the results of {previous_run.reused} HGVS strings from {incremental_from}, "
+            f"and looked up {previous_run.rebuilt} again",
+            err=True,
+        )
+        previous_run.close()
+
+    for metrics_name, name, cache in [
+        ("score_set", "Score set", mavedb_client.score_set_cache),
+        ("score_set_profile", "Score set profile", mavedb_client.score_set_profile_cache),
+        ("clingen_allele", "ClinGen allele", clingen_client.allele_cache),
+        ("mavedb_lookup", "MaveDB lookup", mavedb_client.lookup_cache),
+    ]:
+        cache_stats = cache.stats()
+        metrics.set_cache_stats(metrics_name, cache_stats)
+        click.echo(
+            f"{name} cache: {cache_stats['hits']} hits, "
+            f"{cache_stats['misses']} misses, "
+            f"{cache_stats['evictions']} evictions",
+            err=True,
+        )
+    for name, client in [("ClinGen", clingen_client), ("MaveDB", mavedb_client)]:
+        connection_stats = client.connection_stats()
+        click.echo(
+            f"{name} connections: {connection_stats['requests']} requests over "
+            f"{connection_stats['connections']} connections "
+            f"({connection_stats['reused']} reused)",
+            err=True,
+        )
+    if response_cache is not None:
+        response_cache_stats = response_cache.stats()
+        metrics.set_cache_stats("response", response_cache_stats)
+        click.echo(
+            f"Response cache: {response_cache_stats['hits']} hits, "
+            f"{response_cache_stats['misses']} misses, "
+            f"{response_cache_stats['entries']} entries "
+            f"({response_cache_stats['size'] / (1024 * 1024):.1f} MB)",
+            err=True,
+        )
+        response_cache.close()
+    for line in metrics.summary_lines():
+        click.echo(line, err=True)
+    if metrics_json is not None:
+        metrics.write_json(metrics_json)
+    if metrics_prometheus is not None:
+        metrics.write_prometheus(metrics_prometheus)
+    if profiler is not None:
+        profile_stats = profiler.stop(profile_path)
+        if profile_stats is not None:
+            click.echo(f"Profile written to {profile_path}. Top functions by cumulative time:", err=True)
+            profile_stats.stream = sys.stderr
+            profile_stats.sort_stats("cumulative").print_stats(15)
+    if index is not None:
+        index.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,24 @@
+import click
+
+from shards import merge_shard_outputs
+
+
+@click.command()
+@click.argument("output_file")
+@click.argument("shard_outputs", nargs=-1, required=True)
+def main(output_file: str, shard_outputs: tuple[str, ...]):
+    """
+    Merge the outputs of the shards of a mavedb_lookup.py run (run with --shard i/N) into OUTPUT_FILE, in input
+    order.
+
+    Each shard must have finished, and all shards must have been run with the same options, with CSV or JSON Lines
+    output.
+    """
+    try:
+        merge_shard_outputs(list(shard_outputs), output_file)
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import bisect
+import cProfile
+import json
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+# Cache statistics that count events. Other cache statistics, such as sizes, are gauges.
+CACHE_EVENTS = ("hits", "misses", "evictions")
+
+
+class StageStats:
+    """
+    Call count, errors, latency histogram and named counters (such as bytes received) of one stage.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.counters: dict[str, int] = {}
+
+    def observe(self, seconds: float, error: bool = False):
+        self.count += 1
+        self.seconds += seconds
+        if error:
+            self.errors += 1
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Estimate a latency quantile from the histogram, as the upper bound of the bucket containing it.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for upper_bound, bucket_count in zip(LATENCY_BUCKETS, self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return upper_bound
+        return math.inf
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "seconds": self.seconds,
+            "latency_p50_seconds": self.quantile(0.5),
+            "latency_p99_seconds": self.quantile(0.99),
+            "latency_buckets": {
+                str(upper_bound): bucket_count
+                for upper_bound, bucket_count in zip(LATENCY_BUCKETS, self.bucket_counts)
+            },
+            "counters": dict(self.counters),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe run instrumentation: timings and counters for each stage of a lookup run.
+
+    Stages are named with dotted names, such as "clingen.allele" for ClinGen allele requests or "result.build" for
+    building result rows. Cache statistics can be attached under a cache name for reporting.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._stages: dict[str, StageStats] = {}
+        self._caches: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, stage: str) -> StageStats:
+        stage_stats = self._stages.get(stage)
+        if stage_stats is None:
+            stage_stats = self._stages.setdefault(stage, StageStats())
+        return stage_stats
+
+    def observe(self, stage: str, seconds: float, error: bool = False):
+        with self._lock:
+            self._stage(stage).observe(seconds, error)
+
+    def add(self, stage: str, counter: str, amount: int = 1):
+        with self._lock:
+            counters = self._stage(stage).counters
+            counters[counter] = counters.get(counter, 0) + amount
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """
+        Time a block of code as one call of a stage. Exceptions raised by the block are counted as errors.
+        """
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, error)
+
+    def set_cache_stats(self, cache: str, cache_stats: dict[str, int]):
+        with self._lock:
+            self._caches[cache] = dict(cache_stats)
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "seconds": time.time() - self.started_at,
+                "stages": {
+                    stage: stage_stats.to_dict()
+                    for stage, stage_stats in sorted(self._stages.items())
+                },
+                "caches": {cache: dict(stats) for cache, stats in sorted(self._caches.items())},
+            }
+
+    def summary_lines(self) -> list[str]:
+        """
+        Describe each stage in one line, for the end-of-run summary.
+        """
+        lines = []
+        with self._lock:
+            for stage, stage_stats in sorted(self._stages.items()):
+                p50 = stage_stats.quantile(0.5)
+                p99 = stage_stats.quantile(0.99)
+                line = (
+                    f"{stage}: {stage_stats.count} calls, {stage_stats.seconds:.2f} s, "
+                    f"p50 <= {format_seconds(p50)}, p99 <= {format_seconds(p99)}"
+                )
+                if stage_stats.errors:
+                    line += f", {stage_stats.errors} errors"
+                for counter, value in sorted(stage_stats.counters.items()):
+                    line += f", {value} {counter.replace('_', ' ')}"
+                lines.append(line)
+        return lines
+
+    def write_json(self, path: str):
+        with open(path, mode="w") as json_file:
+            json.dump(self.to_dict(), json_file, indent=2)
+
+    def prometheus_text(self, prefix: str = "mavedb_lookup") -> str:
+        """
+        Describe the metrics in the Prometheus text exposition format.
+        """
+        metrics = self.to_dict()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent in each stage of the lookup run.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for stage, stage_stats in metrics["stages"].items():
+            cumulative = 0
+            for upper_bound, bucket_count in stage_stats["latency_buckets"].items():
+                cumulative += bucket_count
+                le = "+Inf" if upper_bound == "inf" else upper_bound
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {stage_stats["seconds"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {stage_stats["count"]}')
+        lines.append(f"# HELP {prefix}_stage_errors_total Failed calls of each stage.")
+        lines.append(f"# TYPE {prefix}_stage_errors_total counter")
+        for stage, stage_stats in metrics["stages"].items():
+            lines.append(f'{prefix}_stage_errors_total{{stage="{stage}"}} {stage_stats["errors"]}')
+        lines.append(f"# HELP {prefix}_stage_events_total Named counters of each stage, such as bytes received.")
+        lines.append(f"# TYPE {prefix}_stage_events_total counter")
+        for stage, stage_stats in metrics["stages"].items():
+            for counter, value in stage_stats["counters"].items():
+                lines.append(f'{prefix}_stage_events_total{{stage="{stage}",event="{counter}"}} {value}')
+        lines.append(f"# HELP {prefix}_cache_events_total Cache hits, misses and evictions.")
+        lines.append(f"# TYPE {prefix}_cache_events_total counter")
+        for cache, cache_stats in metrics["caches"].items():
+            for event, value in cache_stats.items():
+                if event in CACHE_EVENTS:
+                    lines.append(f'{prefix}_cache_events_total{{cache="{cache}",event="{event}"}} {value}')
+        lines.append(f"# HELP {prefix}_cache_size Number of entries in each cache, and size in bytes where known.")
+        lines.append(f"# TYPE {prefix}_cache_size gauge")
+        for cache, cache_stats in metrics["caches"].items():
+            for measure, value in cache_stats.items():
+                if measure not in CACHE_EVENTS:
+                    lines.append(f'{prefix}_cache_size{{cache="{cache}",measure="{measure}"}} {value}')
+        lines.append(f"# HELP {prefix}_run_seconds Duration of the lookup run.")
+        lines.append(f"# TYPE {prefix}_run_seconds gauge")
+        lines.append(f"{prefix}_run_seconds {metrics['seconds']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, prefix: str = "mavedb_lookup"):
+        """
+        Write the metrics in the Prometheus text format, for the node exporter's textfile collector.
+
+        The file is written under a temporary name and then renamed, so that the collector never reads a partly
+        written file.
+        """
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, mode="w") as prometheus_file:
+            prometheus_file.write(self.prometheus_text(prefix))
+        os.replace(temporary_path, path)
+
+
+def format_seconds(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    if math.isinf(seconds):
+        return "inf"
+    return f"{seconds * 1000:g} ms"
+
+
+class Profiler:
+    """
+    Profiles the main thread and any worker threads with cProfile, and combines their results.
+
+    Call start_thread in each thread to be profiled, including worker threads (for instance from a thread pool's
+    initializer).
+
+    From Python 3.12, cProfile is built on sys.monitoring, which allows only one active profiler in a process, and
+    that profiler sees every thread. There, the first call to start_thread starts the process's profiler, and later
+    calls do nothing.
+    """
+
+    def __init__(self):
+        self._profiles: list[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def start_thread(self):
+        with self._lock:
+            if self._profiles and sys.version_info >= (3, 12):
+                return
+            profile = cProfile.Profile()
+            self._profiles.append(profile)
+        profile.enable()
+
+    def stop(self, path: str) -> pstats.Stats | None:
+        """
+        Stop profiling, and write the combined statistics to a file that pstats or snakeviz can read.
+        """
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        for profile in profiles:
+            profile.disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        return stats
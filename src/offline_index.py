@@ -0,0 +1,223 @@
+import json
+import sqlite3
+import threading
+from concurrent.futures import Executor
+from typing import Any, Iterable
+
+from clingen_client import ClingenClient
+from mavedb_client import MaveDBClient
+
+# Increase this when the layout of the index changes.
+INDEX_FORMAT_VERSION = 1
+
+# How much of the index file SQLite may map into memory, in bytes.
+MMAP_SIZE = 1 << 40
+
+
+class OfflineIndex:
+    """
+    A local snapshot of MaveDB and ClinGen data, stored in a SQLite database.
+
+    The index maps ClinGen allele IDs to variant effect measurement records, and also holds the metadata of the
+    score sets those measurements belong to and the ClinGen alleles of the HGVS strings it was built for. Each
+    record is stored as a separate JSON value, so opening the index is immediate, and only the records a lookup
+    needs are ever decoded. When opened for reading, the database file is memory-mapped.
+    """
+
+    def __init__(self, path: str, writable: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        if writable:
+            self._connection = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None
+            )
+            self._create_tables()
+        else:
+            self._connection = sqlite3.connect(
+                f"file:{path}?mode=ro", uri=True, check_same_thread=False
+            )
+            self._connection.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            version = self.get_metadata("format_version")
+            if version != str(INDEX_FORMAT_VERSION):
+                raise ValueError(
+                    f"{path} is not an offline index, or was built by an incompatible version."
+                )
+
+    def _create_tables(self):
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS score_sets (urn TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS measurements (
+                clingen_allele_id TEXT NOT NULL,
+                score_set_urn TEXT NOT NULL,
+                value TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS measurements_clingen_allele_id ON measurements (clingen_allele_id);
+            CREATE TABLE IF NOT EXISTS alleles (hgvs TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self.set_metadata("format_version", str(INDEX_FORMAT_VERSION))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get_metadata(self, key: str) -> str | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM metadata WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_metadata(self, key: str, value: str):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?)", (key, value)
+            )
+
+    def get_score_set(self, urn: str) -> Any:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM score_sets WHERE urn = ?", (urn,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add_score_set(self, urn: str, score_set: Any):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO score_sets VALUES (?, ?)",
+                (urn, json.dumps(score_set)),
+            )
+
+    def score_set_urns(self) -> list[str]:
+        with self._lock:
+            return [
+                urn
+                for (urn,) in self._connection.execute("SELECT urn FROM score_sets ORDER BY urn")
+            ]
+
+    def get_measurements(self, clingen_allele_ids: list[str]) -> dict[str, list[Any]]:
+        """
+        Get the measurements of several ClinGen allele IDs. Allele IDs absent from the index have no measurements.
+        """
+        measurements: dict[str, list[Any]] = {
+            clingen_allele_id: [] for clingen_allele_id in clingen_allele_ids
+        }
+        if not clingen_allele_ids:
+            return measurements
+        placeholders = ", ".join("?" * len(clingen_allele_ids))
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT clingen_allele_id, value FROM measurements WHERE clingen_allele_id IN ({placeholders}) "
+                "ORDER BY rowid",
+                clingen_allele_ids,
+            ).fetchall()
+        for clingen_allele_id, value in rows:
+            measurements[clingen_allele_id].append(json.loads(value))
+        return measurements
+
+    def add_measurements(self, clingen_allele_id: str, measurements: list[Any]):
+        """
+        Store the measurements of a ClinGen allele ID, replacing any stored before.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.execute(
+                "DELETE FROM measurements WHERE clingen_allele_id = ?", (clingen_allele_id,)
+            )
+            self._connection.executemany(
+                "INSERT INTO measurements VALUES (?, ?, ?)",
+                [
+                    (
+                        clingen_allele_id,
+                        (measurement.get("scoreSet") or {}).get("urn"),
+                        json.dumps(measurement),
+                    )
+                    for measurement in measurements
+                ],
+            )
+            self._connection.execute("COMMIT")
+
+    def get_allele(self, hgvs: str) -> tuple[bool, Any]:
+        """
+        :return: Whether the index holds a ClinGen resolution of the HGVS string, and the allele it resolved to
+            (None if ClinGen could not resolve it).
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM alleles WHERE hgvs = ?", (hgvs,)
+            ).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0]) if row[0] is not None else None
+
+    def add_alleles(self, alleles: Iterable[tuple[str, Any]]):
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO alleles VALUES (?, ?)",
+                [
+                    (hgvs, json.dumps(allele) if allele is not None else None)
+                    for hgvs, allele in alleles
+                ],
+            )
+            self._connection.execute("COMMIT")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                table: self._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ["score_sets", "measurements", "alleles"]
+            }
+
+
+class OfflineClingenClient(ClingenClient):
+    """
+    A ClinGen client that resolves HGVS strings from an offline index instead of the Allele Registry.
+
+    HGVS strings that are not in the index are treated as unresolvable.
+    """
+
+    def __init__(self, index: OfflineIndex, **kwargs):
+        super().__init__(**kwargs)
+        self.index = index
+
+    def _fetch_clingen_allele_uncached(self, hgvs: str) -> Any:
+        with self.metrics.time("offline_index.allele"):
+            _, allele = self.index.get_allele(hgvs)
+        return allele
+
+    def fetch_clingen_alleles_bulk(
+        self,
+        hgvs_strings: Iterable[str],
+        chunk_size: int = 1000,
+        executor: Executor | None = None,
+    ) -> dict[str, Any]:
+        # Individual lookups in the index are as cheap as bulk lookups.
+        return {
+            hgvs: self.fetch_clingen_allele(hgvs) for hgvs in dict.fromkeys(hgvs_strings)
+        }
+
+
+class OfflineMaveDBClient(MaveDBClient):
+    """
+    A MaveDB client that serves score sets and allele ID lookups from an offline index instead of the MaveDB API.
+
+    Allele IDs that are not in the index have no measurements.
+    """
+
+    def __init__(self, index: OfflineIndex, **kwargs):
+        super().__init__(**kwargs)
+        self.index = index
+
+    def _fetch_score_set_uncached(self, urn: str):
+        with self.metrics.time("offline_index.score_set"):
+            return self.index.get_score_set(urn)
+
+    def _fetch_score_set_variant_table_uncached(self, urn: str):
+        raise (Exception("Whole-score-set tables are not available from an offline index."))
+
+    def _fetch_variant_effect_measurements_batch(self, clingen_allele_ids: list[str]):
+        with self.metrics.time("offline_index.lookup"):
+            return self.index.get_measurements(clingen_allele_ids)
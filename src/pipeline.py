@@ -0,0 +1,133 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator
+
+from metrics import Metrics
+
+# Marks the end of a pipeline's input.
+_END = object()
+
+# How often threads blocked on a full or empty queue check whether the pipeline is being stopped, in seconds.
+_POLL_INTERVAL = 0.1
+
+
+class _Failure:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+class Pipeline:
+    """
+    Runs items through a sequence of stages, each in its own thread, so that every stage works on a different item
+    at the same time.
+
+    Stages are linked by queues of at most queue_size items. A stage that gets ahead of the next one blocks until
+    the next one catches up, so the number of items in the pipeline is bounded. Each stage handles one item at a
+    time, so items come out in the order they went in.
+
+    If reading the input or any stage raises an exception, the pipeline stops and the exception is raised to the
+    consumer.
+    """
+
+    def __init__(
+        self,
+        stages: list[tuple[str, Callable[[Any], Any]]],
+        queue_size: int = 2,
+        metrics: Metrics | None = None,
+        thread_initializer: Callable[[], None] | None = None,
+    ):
+        """
+        :param stages: Each stage's name, for metrics, and the function it applies to each item.
+        :param metrics: If given, the time each stage spends waiting for its next item is recorded under
+            "pipeline.<name>.idle".
+        :param thread_initializer: If given, called at the start of each of the pipeline's threads.
+        """
+        if queue_size < 1:
+            raise ValueError("Queue size must be at least 1")
+        self.stages = stages
+        self.queue_size = queue_size
+        self.metrics = metrics or Metrics()
+        self.thread_initializer = thread_initializer
+
+    def run(self, items: Iterable[Any]) -> Iterator[Any]:
+        """
+        Run items through the pipeline, yielding the last stage's results in input order.
+        """
+        queues: list[queue.Queue] = [
+            queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)
+        ]
+        stopping = threading.Event()
+
+        def put(to_queue: queue.Queue, item: Any) -> bool:
+            while not stopping.is_set():
+                try:
+                    to_queue.put(item, timeout=_POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(from_queue: queue.Queue) -> Any:
+            while not stopping.is_set():
+                try:
+                    return from_queue.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+            return _END
+
+        def feed():
+            try:
+                if self.thread_initializer is not None:
+                    self.thread_initializer()
+                for item in items:
+                    if not put(queues[0], item):
+                        return
+            except BaseException as e:
+                put(queues[0], _Failure(e))
+                return
+            put(queues[0], _END)
+
+        def run_stage(name: str, function: Callable[[Any], Any], index: int):
+            if self.thread_initializer is not None:
+                try:
+                    self.thread_initializer()
+                except BaseException as e:
+                    # Stop the stages downstream, as if the stage had failed, so the consumer is not left waiting.
+                    put(queues[index + 1], _Failure(e))
+                    return
+            while True:
+                with self.metrics.time(f"pipeline.{name}.idle"):
+                    item = get(queues[index])
+                if item is _END or isinstance(item, _Failure):
+                    put(queues[index + 1], item)
+                    return
+                try:
+                    result = function(item)
+                except BaseException as e:
+                    put(queues[index + 1], _Failure(e))
+                    return
+                if not put(queues[index + 1], result):
+                    return
+
+        threads = [threading.Thread(target=feed, name="pipeline-input", daemon=True)] + [
+            threading.Thread(
+                target=run_stage, args=(name, function, index), name=f"pipeline-{name}", daemon=True
+            )
+            for index, (name, function) in enumerate(self.stages)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = get(queues[-1])
+                if item is _END:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.exception
+                yield item
+        finally:
+            # Stop every stage, and wait for them, so that nothing is still using the input or the clients when the
+            # consumer cleans up.
+            stopping.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,154 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable
+
+# Resource types stored in the cache, with their default time-to-live in seconds. Score sets and lookup results
+# change when MaveDB data are updated; ClinGen allele resolutions essentially never change.
+DEFAULT_TTLS: dict[str, float | None] = {
+    "allele": 90 * 24 * 60 * 60,
+    "lookup": 24 * 60 * 60,
+    "score_set": 7 * 24 * 60 * 60,
+}
+
+_MISSING = object()
+
+
+class ResponseCache:
+    """
+    A persistent cache of decoded API responses, stored as compressed JSON in a SQLite database.
+
+    Each resource type has its own time-to-live; expired entries are treated as missing. When the total size of
+    stored entries exceeds max_size_bytes, the least recently used entries are evicted. The database uses
+    write-ahead logging, so several processes can share one cache directory.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        ttls: dict[str, float | None] | None = None,
+        max_size_bytes: int | None = None,
+    ):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "responses.sqlite3")
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                resource_type TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (resource_type, key)
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self._total_size = self._stored_size()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get(self, resource_type: str, key: str, default: Any = None) -> Any:
+        value = self._get(resource_type, key)
+        return default if value is _MISSING else value
+
+    def _get(self, resource_type: str, key: str) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, stored_at FROM responses WHERE resource_type = ? AND key = ?",
+                (resource_type, key),
+            ).fetchone()
+            ttl = self.ttls.get(resource_type)
+            if row is not None and ttl is not None and now - row[1] > ttl:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE resource_type = ? AND key = ?",
+                    (resource_type, key),
+                )
+                row = None
+            if row is None:
+                self.misses += 1
+                return _MISSING
+            self._connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE resource_type = ? AND key = ?",
+                (now, resource_type, key),
+            )
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, resource_type: str, key: str, value: Any):
+        compressed_value = zlib.compress(json.dumps(value).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (resource_type, key, compressed_value, len(compressed_value), now, now),
+            )
+            self._total_size += len(compressed_value)
+            if self.max_size_bytes is not None and self._total_size > self.max_size_bytes:
+                self._evict(self.max_size_bytes)
+
+    def get_or_fetch(self, resource_type: str, key: str, fetch: Callable[[], Any]) -> Any:
+        value = self._get(resource_type, key)
+        if value is _MISSING:
+            value = fetch()
+            self.set(resource_type, key, value)
+        return value
+
+    def _stored_size(self) -> int:
+        (total_size,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        return total_size
+
+    def _evict(self, max_size_bytes: int):
+        # The running total is approximate (replaced entries and other processes are not tracked), so recount.
+        total_size = self._stored_size()
+        self._total_size = total_size
+        if total_size <= max_size_bytes:
+            return
+        # Evict down to 90% of the limit, so that eviction does not run again on every insertion.
+        excess = total_size - int(max_size_bytes * 0.9)
+        rows = self._connection.execute(
+            "SELECT resource_type, key, size FROM responses ORDER BY accessed_at"
+        )
+        evicted = []
+        for resource_type, key, size in rows:
+            if excess <= 0:
+                break
+            evicted.append((resource_type, key))
+            excess -= size
+        rows.close()
+        self._connection.executemany(
+            "DELETE FROM responses WHERE resource_type = ? AND key = ?", evicted
+        )
+        self._total_size = self._stored_size()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            (entries, total_size) = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "size": total_size,
+            }
@@ -0,0 +1,196 @@
+import csv
+import json
+import time
+from typing import Any, BinaryIO, Iterable, Protocol, TextIO
+
+from run_journal import JournalEntry, RunJournal
+
+
+class CompactRow(Protocol):
+    """
+    A result row that is not stored as a dictionary of output columns, but gets them by name in the same way, and
+    can be expanded to one.
+    """
+
+    def get(self, column: str, default: Any = None) -> Any: ...
+
+    def to_dict(self) -> dict[str, Any]: ...
+
+
+Row = dict[str, Any] | CompactRow
+
+
+def expand_row(row: Row) -> dict[str, Any]:
+    """
+    Get a result row's output columns as a dictionary.
+    """
+    return row if isinstance(row, dict) else row.to_dict()
+
+
+class CsvResultWriter:
+    """
+    Writes result rows to a CSV file as they are produced, instead of buffering the whole output in memory.
+
+    Only the columns in fieldnames are written, in that order. Nested values, such as score data, are written as
+    JSON strings.
+
+    The file is flushed at most every flush_interval seconds, so that the output on disk stays close to the
+    lookup's progress without flushing after every row.
+
+    If a journal is given, each completed input row is recorded in it once the row's results have been flushed.
+    """
+
+    def __init__(
+        self,
+        outfile: TextIO,
+        fieldnames: list[str],
+        flush_interval: float = 5.0,
+        journal: RunJournal | None = None,
+    ):
+        self.outfile = outfile
+        self.fieldnames = fieldnames
+        self.flush_interval = flush_interval
+        self.journal = journal
+        self.rows_written = 0
+        self._writer = csv.writer(outfile)
+        self._last_flush = time.monotonic()
+        self._pending_journal_entries: list[JournalEntry] = []
+
+    def write_header(self):
+        self._writer.writerow(self.fieldnames)
+
+    def write_rows(self, rows: Iterable[Row]):
+        for row in rows:
+            self._write_row(row)
+            self.rows_written += 1
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _write_row(self, row: Row):
+        # Compact rows are expanded once, rather than getting each column from them in turn.
+        self._writer.writerow(
+            [
+                json.dumps(value) if isinstance(value, dict) else value
+                for value in map(expand_row(row).get, self.fieldnames)
+            ]
+        )
+
+    def complete_input_row(self, row_number: int, hgvs: str):
+        """
+        Mark an input row as complete. Call this after writing all of the row's results.
+        """
+        if self.journal is not None:
+            self._pending_journal_entries.append(
+                JournalEntry(row_number, self.outfile.tell(), hgvs)
+            )
+
+    def flush(self):
+        self.outfile.flush()
+        if self.journal is not None and self._pending_journal_entries:
+            self.journal.record(self._pending_journal_entries)
+            self._pending_journal_entries = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+
+class JsonLinesResultWriter(CsvResultWriter):
+    """
+    Writes result rows to a JSON Lines file, one JSON object per row, with nested values kept as JSON objects.
+    """
+
+    def write_header(self):
+        pass
+
+    def _write_row(self, row: Row):
+        columns = expand_row(row)
+        self.outfile.write(json.dumps({name: columns.get(name) for name in self.fieldnames}))
+        self.outfile.write("\n")
+
+
+class ArrowResultWriter:
+    """
+    Writes result rows to a Parquet file or an Arrow IPC file, using pyarrow.
+
+    Rows are buffered and written in groups of row_group_size rows. Each column's type is given in column_types:
+
+    - "string", "float", "int" or "bool": A plain column of that type.
+    - "dictionary": A dictionary-encoded string column, for columns with many repeated values.
+    - "map": A map from strings to floats, for score and count data.
+
+    The file is only complete once the writer has been closed, so runs writing these formats cannot be resumed.
+    """
+
+    def __init__(
+        self,
+        outfile: BinaryIO,
+        fieldnames: list[str],
+        column_types: dict[str, str],
+        file_format: str = "parquet",
+        row_group_size: int = 65536,
+    ):
+        import pyarrow as pa
+
+        self._pa = pa
+        self.fieldnames = fieldnames
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        arrow_types = {
+            "string": pa.string(),
+            "float": pa.float64(),
+            "int": pa.int64(),
+            "bool": pa.bool_(),
+            "dictionary": pa.dictionary(pa.int32(), pa.string()),
+            "map": pa.map_(pa.string(), pa.float64()),
+        }
+        self.schema = pa.schema(
+            [(name, arrow_types[column_types[name]]) for name in fieldnames]
+        )
+        if file_format == "parquet":
+            import pyarrow.parquet
+
+            self._writer = pyarrow.parquet.ParquetWriter(outfile, self.schema)
+        elif file_format == "arrow":
+            import pyarrow.ipc
+
+            self._writer = pyarrow.ipc.new_file(outfile, self.schema)
+        else:
+            raise ValueError(f"Unknown file format {file_format}")
+        self._buffer: list[Row] = []
+
+    def write_header(self):
+        pass
+
+    def write_rows(self, rows: Iterable[Row]):
+        for row in rows:
+            self._buffer.append(row)
+            self.rows_written += 1
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    def complete_input_row(self, row_number: int, hgvs: str):
+        pass
+
+    def flush(self):
+        if not self._buffer:
+            return
+        batch = self._pa.record_batch(
+            [
+                self._pa.array(
+                    [
+                        list(value.items()) if isinstance(value, dict) else value
+                        for value in (row.get(field.name) for row in self._buffer)
+                    ],
+                    type=field.type,
+                )
+                for field in self.schema
+            ],
+            schema=self.schema,
+        )
+        self._writer.write(batch)
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
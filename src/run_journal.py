@@ -0,0 +1,80 @@
+import os
+from typing import NamedTuple
+
+
+class JournalEntry(NamedTuple):
+    row_number: int
+    output_offset: int
+    hgvs: str
+
+
+class RunJournal:
+    """
+    A sidecar file recording which input rows of a lookup run are complete.
+
+    Each line holds an input row number, the size of the output file once that row's results were written, and the
+    row's HGVS string. Entries are only appended after the output they describe has been flushed, so the journal
+    never claims more than what is on disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @staticmethod
+    def path_for_output(output_path: str) -> str:
+        return f"{output_path}.journal"
+
+    def read(self) -> list[JournalEntry]:
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, mode="r") as journal_file:
+            for line in journal_file:
+                # A run that was interrupted while writing may leave an incomplete last line.
+                if not line.endswith("\n"):
+                    break
+                fields = line.rstrip("\n").split("\t", 2)
+                if len(fields) != 3:
+                    break
+                entries.append(JournalEntry(int(fields[0]), int(fields[1]), fields[2]))
+        return entries
+
+    def restore(self, output_path: str) -> list[JournalEntry]:
+        """
+        Prepare to resume the run that wrote an output file: discard any output written after the last journaled
+        row, and open the journal to record further rows.
+
+        Entries beyond the end of the output file, which is shorter than the journal claims if it was cut short or
+        replaced since, are dropped, so that their rows are looked up again.
+
+        :return: The entries of the rows whose output was kept. If there are none, the journal is not opened.
+        """
+        output_size = os.path.getsize(output_path)
+        entries: list[JournalEntry] = []
+        for entry in self.read():
+            if entry.output_offset > output_size or (
+                entries and entry.output_offset < entries[-1].output_offset
+            ):
+                break
+            entries.append(entry)
+        if entries:
+            with open(output_path, mode="r+b") as output_file:
+                output_file.truncate(entries[-1].output_offset)
+            self.open(append=False)
+            self.record(entries)
+        return entries
+
+    def open(self, append: bool):
+        self._file = open(self.path, mode="a" if append else "w")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def record(self, entries: list[JournalEntry]):
+        assert self._file is not None
+        for entry in entries:
+            self._file.write(f"{entry.row_number}\t{entry.output_offset}\t{entry.hgvs}\n")
+        self._file.flush()
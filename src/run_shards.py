@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import nullcontext
+
+import click
+
+from shards import merge_shard_outputs, remove_run_output, Shard
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("input_file")
+@click.argument("output_file")
+@click.option("--shards", "shard_count", type=click.IntRange(min=1), default=os.cpu_count() or 1)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    help="Persistent cache shared by the shards. By default, a temporary cache is used for this run only.",
+)
+@click.option("--keep-shard-outputs", is_flag=True)
+@click.argument("lookup_args", nargs=-1, type=click.UNPROCESSED)
+def main(
+    input_file: str,
+    output_file: str,
+    shard_count: int,
+    cache_dir: str | None,
+    keep_shard_outputs: bool,
+    lookup_args: tuple[str, ...],
+):
+    """
+    Run mavedb_lookup.py in several processes, each looking up one shard of the input, and merge their outputs.
+
+    Arguments after "--" are passed on to each mavedb_lookup.py process. The processes share a persistent cache, so
+    score sets and alleles fetched by one are not fetched again by the others. Each shard's output is written next
+    to OUTPUT_FILE; if a shard fails, the shard outputs are kept, and running again with "-- --resume" resumes them.
+    """
+    if input_file == "-":
+        raise click.BadParameter("Standard input cannot be shared by several processes.", param_hint="INPUT_FILE")
+
+    shards = [Shard(index, shard_count) for index in range(1, shard_count + 1)]
+    shard_outputs = [shard.output_path(output_file) for shard in shards]
+    with (
+        tempfile.TemporaryDirectory(prefix="mavedb-lookup-cache-")
+        if cache_dir is None
+        else nullcontext(cache_dir)
+    ) as shared_cache_dir:
+        processes = []
+        try:
+            for shard, shard_output in zip(shards, shard_outputs):
+                with open(f"{shard_output}.log", mode="w") as log_file:
+                    processes.append(
+                        subprocess.Popen(
+                            [
+                                sys.executable,
+                                os.path.join(SRC_DIR, "mavedb_lookup.py"),
+                                input_file,
+                                shard_output,
+                                "--shard",
+                                str(shard),
+                                "--cache-dir",
+                                shared_cache_dir,
+                                *lookup_args,
+                            ],
+                            stderr=log_file,
+                        )
+                    )
+            failed_shards = [
+                (shard, shard_output)
+                for shard, shard_output, process in zip(shards, shard_outputs, processes)
+                if process.wait() != 0
+            ]
+        finally:
+            # If this process is interrupted, stop the shards too.
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+                    process.wait()
+
+    if failed_shards:
+        messages = []
+        for shard, shard_output in failed_shards:
+            with open(f"{shard_output}.log") as log_file:
+                messages.append(f"Shard {shard} failed:\n{log_file.read()}")
+        raise click.ClickException("\n".join(messages))
+
+    try:
+        merge_shard_outputs(shard_outputs, output_file)
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+    if not keep_shard_outputs:
+        for shard_output in shard_outputs:
+            remove_run_output(shard_output)
+            os.remove(f"{shard_output}.log")
+
+
+if __name__ == "__main__":
+    main()
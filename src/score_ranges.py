@@ -0,0 +1,130 @@
+import math
+from bisect import bisect_left
+from typing import Any, cast, Iterable, Sequence
+
+import numpy as np
+
+
+def score_lies_in_range(score: float, range: Any):
+    score_range = range.get("range", None)
+    if score_range is None:
+        return False
+    inclusive_lower_bound = cast(bool, range.get("inclusiveLowerBound", False))
+    inclusive_upper_bound = cast(bool, range.get("inclusiveUpperBound", False))
+    range_min = cast(float | None, score_range[0])
+    range_max = cast(float | None, score_range[1])
+    if inclusive_lower_bound:
+        if range_min is not None and score < range_min:
+            return False
+    else:
+        if range_min is not None and score <= range_min:
+            return False
+    if inclusive_upper_bound:
+        if range_max is not None and score > range_max:
+            return False
+    else:
+        if range_max is not None and score >= range_max:
+            return False
+    return True
+
+
+def _value_between(lower: float, upper: float) -> float:
+    """
+    Pick a value strictly between two boundaries, either of which may be infinite.
+    """
+    if math.isinf(lower) and math.isinf(upper):
+        return 0.0
+    if math.isinf(lower):
+        return upper - abs(upper) - 1
+    if math.isinf(upper):
+        return lower + abs(lower) + 1
+    return lower + (upper - lower) / 2
+
+
+class ScoreRangeIndex:
+    """
+    An index for classifying scores into a calibration's functional ranges.
+
+    The ranges' endpoints are sorted into a boundary array b_0 < ... < b_(k-1), which splits the number line into
+    2k + 1 segments: (-inf, b_0), [b_0], (b_0, b_1), [b_1], ..., [b_(k-1)], (b_(k-1), inf). Every score in a segment
+    lies in the same ranges, so the first range containing each segment is worked out once, with
+    score_lies_in_range. Classifying a score is then a binary search for its segment.
+
+    Results are identical to testing the ranges in order with score_lies_in_range, including at boundaries, for
+    open-ended (None) endpoints and for overlapping ranges.
+    """
+
+    def __init__(self, functional_ranges: Sequence[Any]):
+        self.functional_ranges = list(functional_ranges)
+        boundaries = sorted(
+            {
+                endpoint
+                for functional_range in self.functional_ranges
+                if functional_range.get("range", None) is not None
+                for endpoint in functional_range["range"]
+                if endpoint is not None
+            }
+        )
+        self.boundaries = boundaries
+        self._boundary_array = np.array(boundaries, dtype=float)
+
+        representatives: list[float] = []
+        for i, boundary in enumerate(boundaries):
+            lower = boundaries[i - 1] if i > 0 else -math.inf
+            representatives.append(_value_between(lower, boundary))
+            representatives.append(boundary)
+        representatives.append(
+            _value_between(boundaries[-1], math.inf) if boundaries else 0.0
+        )
+        # The index of the first range containing each segment, or -1 if no range contains it.
+        self._segment_ranges = [self._first_range(value) for value in representatives]
+        self._segment_range_array = np.array(self._segment_ranges, dtype=np.intp)
+        # NaN scores compare false with everything, so they get their own entry.
+        self._nan_range = self._first_range(math.nan)
+
+    def _first_range(self, score: float) -> int:
+        return next(
+            (
+                i
+                for i, functional_range in enumerate(self.functional_ranges)
+                if score_lies_in_range(score, functional_range)
+            ),
+            -1,
+        )
+
+    def classify(self, score: float) -> int | None:
+        """
+        Find the index of the first functional range containing a score.
+
+        :return: The index of the range in the calibration's list of functional ranges, or None if the score does
+            not lie in any range.
+        """
+        if score != score:
+            range_index = self._nan_range
+        else:
+            position = bisect_left(self.boundaries, score)
+            is_boundary = (
+                position < len(self.boundaries) and self.boundaries[position] == score
+            )
+            range_index = self._segment_ranges[2 * position + is_boundary]
+        return range_index if range_index >= 0 else None
+
+    def classify_many(self, scores: Iterable[float] | np.ndarray) -> np.ndarray:
+        """
+        Classify many scores at once.
+
+        :return: An integer array holding, for each score, the index of the first functional range containing it,
+            or -1 if it does not lie in any range.
+        """
+        score_array = np.asarray(scores, dtype=float)
+        positions = np.searchsorted(self._boundary_array, score_array, side="left")
+        if len(self.boundaries) > 0:
+            is_boundary = (positions < len(self.boundaries)) & (
+                self._boundary_array[np.minimum(positions, len(self.boundaries) - 1)]
+                == score_array
+            )
+        else:
+            is_boundary = np.zeros(score_array.shape, dtype=bool)
+        range_indices = self._segment_range_array[2 * positions + is_boundary]
+        range_indices[np.isnan(score_array)] = self._nan_range
+        return range_indices
@@ -0,0 +1,128 @@
+import os
+import zlib
+from typing import NamedTuple
+
+from incremental import RunState
+from run_journal import JournalEntry, RunJournal
+
+# Output formats whose shards can be merged. Merging relies on the journal, which only these formats have.
+MERGEABLE_FORMATS = ["csv", "jsonl"]
+
+
+class Shard(NamedTuple):
+    """
+    One of count slices of the input, numbered from 1.
+    """
+
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, text: str) -> "Shard":
+        """
+        Parse a shard given as "i/N", such as "2/8".
+        """
+        try:
+            index, count = (int(part) for part in text.split("/"))
+        except ValueError:
+            raise ValueError(f'Shards are given as "i/N", not "{text}".')
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"Shard {text} does not exist; shards are numbered from 1 to N.")
+        return cls(index, count)
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def contains(self, hgvs: str) -> bool:
+        # CRC-32 is the same in every process and on every machine, unlike Python's string hash. Repeated HGVS
+        # strings fall in the same shard, so each shard's caches see all of them.
+        return zlib.crc32(hgvs.encode("utf-8")) % self.count == self.index - 1
+
+    def output_path(self, output_path: str) -> str:
+        """
+        The output path of this shard, for a run whose merged output goes to output_path.
+        """
+        return f"{output_path}.shard-{self.index}-of-{self.count}"
+
+
+def merge_shard_outputs(shard_output_paths: list[str], output_path: str):
+    """
+    Merge the outputs of the shards of a run into one output, with each input row's results in input order.
+
+    Each shard's journal gives the input row number and output byte range of its rows, so rows are copied without
+    being parsed. The merged output gets its own journal and state file, so it can be resumed or used as the base
+    of an incremental run like the output of an unsharded run.
+
+    :raises ValueError: If a shard is unfinished, or the shards were run with different options or formats.
+    """
+    states = []
+    for shard_output_path in shard_output_paths:
+        state_path = RunState.path_for_output(shard_output_path)
+        if not os.path.exists(state_path):
+            raise ValueError(f"{shard_output_path} is not the output of a finished run.")
+        states.append(RunState.read(state_path))
+    if any(state.options != states[0].options for state in states):
+        raise ValueError("The shards were run with different options.")
+    output_format = states[0].options["output_format"]
+    if output_format not in MERGEABLE_FORMATS:
+        raise ValueError(f"Shards with {output_format} output cannot be merged.")
+
+    headers = []
+    row_ranges: list[tuple[int, int, int, int, str]] = []
+    for shard_number, shard_output_path in enumerate(shard_output_paths):
+        with open(shard_output_path, mode="rb") as shard_file:
+            header = shard_file.readline() if output_format == "csv" else b""
+        headers.append(header)
+        start = len(header)
+        for entry in RunJournal(RunJournal.path_for_output(shard_output_path)).read():
+            row_ranges.append((entry.row_number, shard_number, start, entry.output_offset, entry.hgvs))
+            start = entry.output_offset
+    if any(header != headers[0] for header in headers):
+        raise ValueError("The shards have different columns.")
+    row_ranges.sort()
+    for (row_number, _, _, _, _), (next_row_number, _, _, _, _) in zip(row_ranges, row_ranges[1:]):
+        if row_number == next_row_number:
+            raise ValueError(f"Input row {row_number} is in more than one shard.")
+
+    journal = RunJournal(RunJournal.path_for_output(output_path))
+    shard_files = [open(shard_output_path, mode="rb") for shard_output_path in shard_output_paths]
+    try:
+        with open(output_path, mode="wb") as outfile:
+            outfile.write(headers[0])
+            journal_entries = []
+            for row_number, shard_number, start, end, hgvs in row_ranges:
+                shard_file = shard_files[shard_number]
+                shard_file.seek(start)
+                outfile.write(shard_file.read(end - start))
+                journal_entries.append(JournalEntry(row_number, outfile.tell(), hgvs))
+        journal.open(append=False)
+        journal.record(journal_entries)
+        journal.close()
+    finally:
+        for shard_file in shard_files:
+            shard_file.close()
+
+    # A score set modified while the shards ran has no single version, so none is recorded and an incremental run
+    # builds its rows again.
+    score_set_modification_dates: dict[str, str | None] = {}
+    for state in states:
+        for score_set_urn, modification_date in state.score_set_modification_dates.items():
+            if score_set_modification_dates.get(score_set_urn, modification_date) != modification_date:
+                modification_date = None
+            score_set_modification_dates[score_set_urn] = modification_date
+    RunState(states[0].options, score_set_modification_dates).write(
+        RunState.path_for_output(output_path)
+    )
+
+
+def remove_run_output(output_path: str):
+    """
+    Remove a run's output file and its sidecar files.
+    """
+    for path in [
+        output_path,
+        RunJournal.path_for_output(output_path),
+        RunState.path_for_output(output_path),
+    ]:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,34 @@
+from email.utils import formatdate
+import time
+
+from api_client import ApiClient, RetryPolicy
+from response_cache import ResponseCache
+
+
+def test_delay_honors_retry_after():
+    assert RetryPolicy().delay(0, "3") == 3.0
+
+
+def test_delay_caps_retry_after():
+    retry_policy = RetryPolicy(backoff_max=60.0)
+    assert retry_policy.delay(0, "86400") == 60.0
+    assert retry_policy.delay(0, formatdate(time.time() + 86400, usegmt=True)) == 60.0
+
+
+def test_delay_ignores_invalid_retry_after():
+    retry_policy = RetryPolicy(backoff_base=0.5, backoff_max=60.0)
+    for attempt in range(10):
+        assert 0 <= retry_policy.delay(attempt, "soon") <= min(60.0, 0.5 * 2**attempt)
+
+
+def test_cache_entries_are_kept_apart_by_base_url(tmp_path):
+    response_cache = ResponseCache(str(tmp_path))
+    production = ApiClient("https://api.example.org", response_cache=response_cache)
+    staging = ApiClient("https://staging.example.org/", response_cache=response_cache)
+    production.set_cached("allele", "NM_000001.1:c.1A>G", {"@id": "CA1"})
+
+    assert production.cached("allele", "NM_000001.1:c.1A>G", lambda: None) == {"@id": "CA1"}
+    assert staging.get_cached("allele", "NM_000001.1:c.1A>G") is None
+    assert staging.cached("allele", "NM_000001.1:c.1A>G", lambda: {"@id": "CA2"}) == {"@id": "CA2"}
+    assert production.get_cached("allele", "NM_000001.1:c.1A>G") == {"@id": "CA1"}
+    response_cache.close()
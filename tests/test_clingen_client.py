@@ -0,0 +1,120 @@
+import io
+import json
+import random
+
+import pytest
+import requests
+
+from clingen_client import ClingenClient, iter_json_array
+
+DOCUMENT = (
+    '[ -0.5, 1e5,-12.25E-3 ,0,true,false,null, "a,]\\"b\\\\", "\\u00e9\\n", '
+    '{"errorType": "HgvsParsingError", "x": [1, -2.5e1]}, [ ], {} ,\n -3.0e+2 , 123456789 ]'
+)
+
+
+def parse(chunks: list[str]) -> list:
+    return list(iter_json_array(chunks))
+
+
+def test_parses_unsplit_array():
+    assert parse([DOCUMENT]) == json.loads(DOCUMENT)
+    assert parse(["[]"]) == []
+    assert parse([" [ ] "]) == []
+
+
+def test_parses_array_split_anywhere():
+    expected = json.loads(DOCUMENT)
+    # Every split into three chunks, which cuts numbers, strings, escapes and literals at every position.
+    for i in range(len(DOCUMENT) + 1):
+        for j in range(i, len(DOCUMENT) + 1):
+            assert parse([DOCUMENT[:i], DOCUMENT[i:j], DOCUMENT[j:]]) == expected
+    assert parse(list(DOCUMENT)) == expected
+    random_generator = random.Random(0)
+    for _ in range(1000):
+        cuts = sorted(random_generator.sample(range(1, len(DOCUMENT)), random_generator.randint(1, 20)))
+        starts = [0, *cuts]
+        ends = [*cuts, len(DOCUMENT)]
+        assert parse([DOCUMENT[start:end] for start, end in zip(starts, ends)]) == expected
+
+
+def test_parses_numbers_split_at_chunk_boundaries():
+    assert parse(["[-0.", "5]"]) == [-0.5]
+    assert parse(["[ -", "0.5]"]) == [-0.5]
+    assert parse(["[1e", "5, 2", "0]"]) == [1e5, 20]
+    assert parse(["[tr", "ue, nu", "ll]"]) == [True, None]
+
+
+def test_yields_elements_as_they_arrive():
+    elements = iter_json_array(iter(['[{"a": 1}, ', '{"b": 2}']))
+    assert next(elements) == {"a": 1}
+    assert next(elements) == {"b": 2}
+
+
+@pytest.mark.parametrize(
+    "document",
+    ["[1 2]", "[1,,2]", "[,1]", "[1,]", '["a" "b"]', "[{} {}]", '{"a": 1}', "1", "[1, x]", "[1.2.3]"],
+)
+def test_rejects_malformed_arrays(document):
+    with pytest.raises(ValueError):
+        parse([document])
+    with pytest.raises(ValueError):
+        parse(list(document))
+
+
+@pytest.mark.parametrize("document", ["", "[", "[1", "[1,", '[{"a": 1}', '["abc', "[1, 2 "])
+def test_rejects_truncated_streams(document):
+    with pytest.raises(ValueError, match="Incomplete"):
+        parse([document])
+    with pytest.raises(ValueError, match="Incomplete"):
+        parse(list(document))
+
+
+def bulk_client(response_body: str) -> tuple[ClingenClient, list[str]]:
+    """
+    Make a ClinGen client whose bulk requests get the given response, and which records individual lookups.
+    """
+    client = ClingenClient("http://clingen.test")
+    individually_looked_up: list[str] = []
+
+    def request(method, url, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(response_body.encode("utf-8"))
+        return response
+
+    def fetch_clingen_allele(hgvs):
+        individually_looked_up.append(hgvs)
+        return {"@id": f"http://reg.genome.network/allele/{hgvs}-single"}
+
+    client.request = request
+    client.fetch_clingen_allele = fetch_clingen_allele
+    return client, individually_looked_up
+
+
+def test_bulk_lookup_matches_entries_in_order():
+    client, individually_looked_up = bulk_client(
+        '[{"@id": "CA1"}, {"errorType": "HgvsParsingError"}, {"@id": "CA3"}]'
+    )
+    alleles = client.fetch_clingen_alleles_bulk(["h1", "h2", "h3"])
+    assert alleles["h1"] == {"@id": "CA1"}
+    assert alleles["h3"] == {"@id": "CA3"}
+    # Rejected entries are looked up individually.
+    assert individually_looked_up == ["h2"]
+
+
+@pytest.mark.parametrize(
+    "response_body",
+    [
+        # An entry is missing, so the entries after it would be matched to the wrong HGVS strings.
+        '[{"@id": "CA1"}, {"@id": "CA3"}]',
+        '[{"@id": "CA1"}, {"@id": "CA2"}, {"@id": "CA3"}, {}]',
+        '[{"@id": "CA1"}',
+    ],
+)
+def test_bulk_lookup_falls_back_if_entries_do_not_match(response_body):
+    client, individually_looked_up = bulk_client(response_body)
+    alleles = client.fetch_clingen_alleles_bulk(["h1", "h2", "h3"])
+    assert individually_looked_up == ["h1", "h2", "h3"]
+    assert alleles["h1"] == {"@id": "http://reg.genome.network/allele/h1-single"}
+    assert "h1" not in client.allele_cache
@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from incremental import PreviousRun, read_score_set_urns, RunState
+from result_writer import CsvResultWriter, JsonLinesResultWriter
+from test_run_journal import FIELDNAMES, result_rows, write_run
+
+INPUT_ROWS = [
+    (0, "NM_000001.1:c.1A>G", 2),
+    (1, "NM_000001.1:c.2C>T", 0),
+    (2, "NM_000001.1:c.3G>A", 1),
+    # A repeated HGVS string, whose rows are the same as its first occurrence's.
+    (3, "NM_000001.1:c.1A>G", 2),
+]
+SCORE_SET_URN = "urn:mavedb:00000001-a-1"
+WRITER_CLASSES = {"csv": CsvResultWriter, "jsonl": JsonLinesResultWriter}
+
+
+def previous_run(tmp_path, output_format: str, modification_date: str = "2024-01-01") -> PreviousRun:
+    output_path = str(tmp_path / f"output.{output_format}")
+    write_run(output_path, WRITER_CLASSES[output_format], INPUT_ROWS)
+    state = RunState({}, {f"urn:mavedb:00000001-a-{i}": modification_date for i in range(1, 3)})
+    return PreviousRun(output_path, output_format, state)
+
+
+def measurements(hgvs: str, count: int, modification_date: str | None = "2024-01-01") -> list[tuple]:
+    return [
+        (row["match_type"], row["variant_urn"], row["variant_urn"].split("#")[0], modification_date)
+        for row in result_rows(hgvs, count)
+    ]
+
+
+def as_written(row: dict, output_format: str) -> dict:
+    """
+    Get a result row as it reads back from an output file.
+    """
+    if output_format == "jsonl":
+        return row
+    return {
+        name: json.dumps(value) if isinstance(value, dict) else str(value) for name, value in row.items()
+    }
+
+
+@pytest.mark.parametrize("output_format", ["csv", "jsonl"])
+def test_rows(tmp_path, output_format):
+    run = previous_run(tmp_path, output_format)
+    assert len(run) == 3
+    for _, hgvs, count in INPUT_ROWS:
+        assert run.rows(hgvs) == [as_written(row, output_format) for row in result_rows(hgvs, count)]
+    assert run.rows("NM_000001.1:c.5A>G") is None
+    run.close()
+
+
+@pytest.mark.parametrize("output_format", ["csv", "jsonl"])
+def test_reusable_rows(tmp_path, output_format):
+    run = previous_run(tmp_path, output_format)
+    hgvs = "NM_000001.1:c.1A>G"
+    expected = [as_written(row, output_format) for row in result_rows(hgvs, 2)]
+    assert run.reusable_rows(hgvs, measurements(hgvs, 2), lambda urn: None) == expected
+    # Rows without results are reused too.
+    assert run.reusable_rows("NM_000001.1:c.2C>T", [], lambda urn: None) == []
+    # A modification date missing from the measurements is looked up.
+    assert (
+        run.reusable_rows(hgvs, measurements(hgvs, 2, modification_date=None), lambda urn: "2024-01-01")
+        == expected
+    )
+    assert (run.reused, run.rebuilt) == (3, 0)
+    run.close()
+
+
+@pytest.mark.parametrize("output_format", ["csv", "jsonl"])
+def test_rows_are_rebuilt_if_measurements_or_score_sets_changed(tmp_path, output_format):
+    run = previous_run(tmp_path, output_format)
+    hgvs = "NM_000001.1:c.1A>G"
+    current = measurements(hgvs, 2)
+    # A score set was modified.
+    assert run.reusable_rows(hgvs, measurements(hgvs, 2, "2024-02-01"), lambda urn: None) is None
+    assert run.reusable_rows(hgvs, measurements(hgvs, 2, None), lambda urn: None) is None
+    # A measurement was added, removed or reordered.
+    assert run.reusable_rows(hgvs, measurements(hgvs, 3), lambda urn: None) is None
+    assert run.reusable_rows(hgvs, current[:1], lambda urn: None) is None
+    assert run.reusable_rows(hgvs, current[::-1], lambda urn: None) is None
+    # The HGVS string was not looked up.
+    assert run.reusable_rows("NM_000001.1:c.5A>G", [], lambda urn: None) is None
+    assert (run.reused, run.rebuilt) == (0, 6)
+    run.close()
+
+
+@pytest.mark.parametrize("output_format", ["csv", "jsonl"])
+def test_read_score_set_urns(tmp_path, output_format):
+    output_path = str(tmp_path / f"output.{output_format}")
+    write_run(output_path, WRITER_CLASSES[output_format], INPUT_ROWS)
+    assert read_score_set_urns(output_path, output_format) == {SCORE_SET_URN, "urn:mavedb:00000001-a-2"}
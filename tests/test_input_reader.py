@@ -0,0 +1,118 @@
+import gzip
+import io
+import sys
+from contextlib import closing
+
+import pytest
+
+from input_reader import check_vcf_assembly, read_hgvs, vcf_record_to_hgvs
+
+VCF = (
+    "##fileformat=VCFv4.2\n"
+    "##reference=GRCh38\n"
+    "##contig=<ID=chr1,length=248956422,assembly=GRCh38>\n"
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+    "chr1\t100\t.\tA\tG,T\t.\tPASS\t.\n"
+    "chr1\t200\t.\tAC\tA\t.\tPASS\t.\n"
+    "chr1\t300\t.\tA\t<DEL>\t.\tPASS\t.\n"
+    "chrUn_KI270302v1\t10\t.\tA\tG\t.\tPASS\t.\n"
+)
+VCF_HGVS = [
+    "NC_000001.11:g.100A>G",
+    "NC_000001.11:g.100A>T",
+    "NC_000001.11:g.201del",
+]
+CSV = "id,hgvs\n1,NM_000001.1:c.1A>G\n2,NM_000001.1:c.2C>T\n"
+CSV_HGVS = ["NM_000001.1:c.1A>G", "NM_000001.1:c.2C>T"]
+
+
+@pytest.mark.parametrize(
+    "chromosome, position, ref, alt, hgvs",
+    [
+        ("1", 100, "A", "G", "NC_000001.11:g.100A>G"),
+        ("chrX", 5, "c", "t", "NC_000023.11:g.5C>T"),
+        # Insertions and deletions have an anchor base, which is trimmed.
+        ("chr2", 100, "A", "ACGT", "NC_000002.12:g.100_101insCGT"),
+        ("2", 100, "ACGT", "A", "NC_000002.12:g.101_103del"),
+        ("2", 100, "AC", "A", "NC_000002.12:g.101del"),
+        ("17", 100, "ACG", "TTA", "NC_000017.11:g.100_102delinsTTA"),
+        # Bases shared at either end are trimmed before choosing a description.
+        ("17", 100, "GACG", "GTTG", "NC_000017.11:g.101_102delinsTT"),
+        ("MT", 10, "A", "G", "NC_012920.1:g.10A>G"),
+    ],
+)
+def test_vcf_record_to_hgvs(chromosome, position, ref, alt, hgvs):
+    assert vcf_record_to_hgvs(chromosome, position, ref, alt) == hgvs
+
+
+@pytest.mark.parametrize(
+    "chromosome, ref, alt",
+    [("chrUn_KI270302v1", "A", "G"), ("1", "A", "<DEL>"), ("1", "A", "*"), ("1", "A", "A")],
+)
+def test_vcf_record_to_hgvs_skips_undescribable_alleles(chromosome, ref, alt):
+    assert vcf_record_to_hgvs(chromosome, 100, ref, alt) is None
+
+
+def read_all(path: str) -> list[str]:
+    with closing(read_hgvs(path, "hgvs")) as hgvs_strings:
+        return list(hgvs_strings)
+
+
+@pytest.mark.parametrize("text, hgvs", [(CSV, CSV_HGVS), (VCF, VCF_HGVS)])
+def test_read_hgvs_detects_compression(tmp_path, text, hgvs):
+    zstandard = pytest.importorskip("zstandard")
+    data = text.encode("utf-8")
+    for name, compressed_data in [
+        ("input", data),
+        ("input.gz", gzip.compress(data)),
+        ("input.zst", zstandard.ZstdCompressor().compress(data)),
+    ]:
+        # The format and compression are detected from the contents, so the file name gives no hint.
+        path = tmp_path / f"{name}.bin"
+        path.write_bytes(compressed_data)
+        assert read_all(str(path)) == hgvs
+
+
+def test_read_hgvs_from_stdin(monkeypatch):
+    stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(gzip.compress(CSV.encode("utf-8")))))
+    monkeypatch.setattr(sys, "stdin", stdin)
+    assert read_all("-") == CSV_HGVS
+    # Standard input is left open.
+    assert not stdin.buffer.closed
+
+
+def test_read_hgvs_is_lazy(tmp_path):
+    path = tmp_path / "input.csv"
+    path.write_text("hgvs\n" + "NM_000001.1:c.1A>G\n" * 100000)
+    with closing(read_hgvs(str(path), "hgvs")) as hgvs_strings:
+        assert next(hgvs_strings) == "NM_000001.1:c.1A>G"
+
+
+@pytest.mark.parametrize(
+    "header_line",
+    [
+        "##reference=file:///references/human_g1k_v37.fasta",
+        "##reference=hg19",
+        "##contig=<ID=1,length=249250621>",
+        "##contig=<ID=chr1,length=248956422,assembly=GRCh37>",
+        '##contig=<ID=chr1,assembly="b37">',
+    ],
+)
+def test_read_hgvs_rejects_other_assemblies(tmp_path, header_line):
+    path = tmp_path / "input.vcf"
+    path.write_text(VCF.replace("##reference=GRCh38\n", header_line + "\n"))
+    with pytest.raises(ValueError, match="only GRCh38"):
+        read_hgvs(str(path), "hgvs")
+
+
+@pytest.mark.parametrize(
+    "header_line",
+    [
+        "##reference=file:///references/Homo_sapiens_assembly38.fasta",
+        "##reference=file:///references/genome.fa",
+        "##contig=<ID=chrM,length=16569,assembly=hg38>",
+        "##contig=<ID=chr1_KI270706v1_random,length=175055>",
+    ],
+)
+def test_check_vcf_assembly_accepts_grch38(header_line):
+    check_vcf_assembly(["##fileformat=VCFv4.2\n", header_line + "\n"])
@@ -0,0 +1,22 @@
+import pytest
+
+from lookup_service import parse_options
+
+
+def test_parse_options():
+    assert parse_options({"related_dna_variants": "yes", "related_protein_variants": False}) == {
+        "related_dna_variants": True,
+        "related_protein_variants": False,
+    }
+
+
+def test_parse_options_reports_unknown_names_before_invalid_values():
+    with pytest.raises(ValueError, match="Unknown options: related_dna_variant$"):
+        parse_options({"related_dna_variant": "maybe"})
+    with pytest.raises(ValueError, match="Unknown options: related_dna_variant$"):
+        parse_options({"related_protein_variants": "maybe", "related_dna_variant": True})
+
+
+def test_parse_options_names_the_option_with_an_invalid_value():
+    with pytest.raises(ValueError, match="Invalid option value 'maybe' for related_dna_variants"):
+        parse_options({"related_dna_variants": "maybe"})
@@ -0,0 +1,137 @@
+import pytest
+
+from result_writer import CsvResultWriter, JsonLinesResultWriter
+from run_journal import JournalEntry, RunJournal
+
+FIELDNAMES = ["hgvs", "match_type", "variant_urn", "score"]
+INPUT_ROWS = [
+    (0, "NM_000001.1:c.1A>G", 2),
+    (1, "NM_000001.1:c.2C>T", 0),
+    (2, "NM_000001.1:c.3G>A", 1),
+    (3, "NM_000001.1:c.4T>C", 3),
+]
+
+
+def result_rows(hgvs: str, count: int) -> list[dict]:
+    return [
+        {
+            "hgvs": hgvs,
+            "match_type": "exact",
+            "variant_urn": f"urn:mavedb:00000001-a-{i + 1}#{len(hgvs) + i}",
+            "score": {"score": 0.5 * i, "sd": None} if i % 2 else -1.25,
+        }
+        for i in range(count)
+    ]
+
+
+def write_run(output_path: str, writer_class, input_rows, append: bool = False) -> RunJournal:
+    """
+    Write the results of some input rows, as a lookup run does, flushing after each input row.
+    """
+    journal = RunJournal(RunJournal.path_for_output(output_path))
+    journal.open(append=append)
+    with open(output_path, mode="a" if append else "w", newline="") as outfile:
+        writer = writer_class(outfile, FIELDNAMES, flush_interval=0.0, journal=journal)
+        if not append:
+            writer.write_header()
+        for row_number, hgvs, count in input_rows:
+            writer.write_rows(result_rows(hgvs, count))
+            writer.complete_input_row(row_number, hgvs)
+            writer.flush()
+        writer.close()
+    journal.close()
+    return journal
+
+
+def test_read_ignores_incomplete_last_line(tmp_path):
+    path = tmp_path / "output.csv.journal"
+    path.write_text("0\t100\tNM_000001.1:c.1A>G\n1\t250\tNM_000001.1:c.2C>T\n2\t3")
+    assert RunJournal(str(path)).read() == [
+        JournalEntry(0, 100, "NM_000001.1:c.1A>G"),
+        JournalEntry(1, 250, "NM_000001.1:c.2C>T"),
+    ]
+
+
+def test_read_missing_journal(tmp_path):
+    assert RunJournal(str(tmp_path / "output.csv.journal")).read() == []
+
+
+def test_journal_offsets_follow_each_input_row(tmp_path):
+    output_path = str(tmp_path / "output.csv")
+    journal = write_run(output_path, CsvResultWriter, INPUT_ROWS)
+    entries = journal.read()
+    assert [(entry.row_number, entry.hgvs) for entry in entries] == [
+        (row_number, hgvs) for row_number, hgvs, _ in INPUT_ROWS
+    ]
+    with open(output_path, mode="rb") as output_file:
+        output = output_file.read()
+    assert entries[-1].output_offset == len(output)
+    # An input row without results ends where the row before it did.
+    assert entries[1].output_offset == entries[0].output_offset
+    assert output[: entries[0].output_offset].count(b"\n") == 1 + 2
+
+
+@pytest.mark.parametrize("writer_class", [CsvResultWriter, JsonLinesResultWriter])
+def test_resume_after_truncated_final_line(tmp_path, writer_class):
+    uninterrupted_path = str(tmp_path / "uninterrupted")
+    write_run(uninterrupted_path, writer_class, INPUT_ROWS)
+    output_path = str(tmp_path / "output")
+    journal = write_run(output_path, writer_class, INPUT_ROWS[:2])
+    # The run was interrupted while writing the next batch, part way through a line of the output and of the
+    # journal.
+    with open(output_path, mode="a", newline="") as output_file:
+        output_file.write("NM_000001.1:c.3G>A,exact,urn:mava")
+    with open(journal.path, mode="a") as journal_file:
+        journal_file.write("2\t99")
+
+    entries = journal.restore(output_path)
+    journal.close()
+    assert [entry.row_number for entry in entries] == [0, 1]
+    assert journal.read() == entries
+    write_run(output_path, writer_class, INPUT_ROWS[2:], append=True)
+    with open(output_path, mode="rb") as output_file, open(uninterrupted_path, mode="rb") as uninterrupted_file:
+        assert output_file.read() == uninterrupted_file.read()
+    assert journal.read() == RunJournal(RunJournal.path_for_output(uninterrupted_path)).read()
+
+
+def test_resume_with_journal_behind_output(tmp_path):
+    output_path = str(tmp_path / "output.csv")
+    journal = write_run(output_path, CsvResultWriter, INPUT_ROWS)
+    entries = journal.read()
+    # Rows after the second were written and flushed, but the run stopped before they were journaled.
+    with open(journal.path, mode="w") as journal_file:
+        journal_file.writelines(f"{n}\t{offset}\t{hgvs}\n" for n, offset, hgvs in entries[:2])
+
+    assert journal.restore(output_path) == entries[:2]
+    journal.close()
+    with open(output_path, mode="rb") as output_file:
+        assert len(output_file.read()) == entries[1].output_offset
+
+
+def test_resume_with_journal_ahead_of_output(tmp_path):
+    output_path = str(tmp_path / "output.csv")
+    journal = write_run(output_path, CsvResultWriter, INPUT_ROWS)
+    entries = journal.read()
+    # The output was cut short after the journal was written, part way through the third row's results.
+    with open(output_path, mode="r+b") as output_file:
+        output_file.truncate(entries[2].output_offset - 5)
+
+    # The rows whose output is missing are dropped, rather than padding the output to the offsets they claim.
+    assert journal.restore(output_path) == entries[:2]
+    journal.close()
+    assert journal.read() == entries[:2]
+    with open(output_path, mode="rb") as output_file:
+        output = output_file.read()
+    assert len(output) == entries[1].output_offset
+    assert b"\0" not in output
+
+
+def test_resume_with_no_usable_entries(tmp_path):
+    output_path = tmp_path / "output.csv"
+    output_path.write_bytes(b"hgvs,match_type\r\n")
+    journal = RunJournal(RunJournal.path_for_output(str(output_path)))
+    with open(journal.path, mode="w") as journal_file:
+        journal_file.write("0\t1000\tNM_000001.1:c.1A>G\n")
+
+    assert journal.restore(str(output_path)) == []
+    assert output_path.read_bytes() == b"hgvs,match_type\r\n"
@@ -0,0 +1,126 @@
+import math
+
+import pytest
+
+from score_ranges import score_lies_in_range, ScoreRangeIndex
+
+
+def functional_range(
+    range_min: float | None,
+    range_max: float | None,
+    inclusive_lower_bound: bool = False,
+    inclusive_upper_bound: bool = False,
+):
+    return {
+        "range": [range_min, range_max],
+        "inclusiveLowerBound": inclusive_lower_bound,
+        "inclusiveUpperBound": inclusive_upper_bound,
+    }
+
+
+def first_range(score: float, functional_ranges: list) -> int | None:
+    return next(
+        (
+            i
+            for i, range in enumerate(functional_ranges)
+            if score_lies_in_range(score, range)
+        ),
+        None,
+    )
+
+
+CALIBRATIONS = {
+    "shared boundaries, inclusive and exclusive": [
+        functional_range(None, -1.0, inclusive_upper_bound=True),
+        functional_range(-1.0, 1.0),
+        functional_range(1.0, 2.0, inclusive_lower_bound=True, inclusive_upper_bound=True),
+        functional_range(2.0, 3.0, inclusive_lower_bound=True),
+    ],
+    "open endpoints": [
+        functional_range(None, 0.0),
+        functional_range(0.5, None, inclusive_lower_bound=True),
+        functional_range(None, None),
+    ],
+    "overlapping": [
+        functional_range(-2.0, 2.0, inclusive_lower_bound=True),
+        functional_range(-3.0, 0.0, inclusive_upper_bound=True),
+        functional_range(0.0, 5.0, inclusive_lower_bound=True, inclusive_upper_bound=True),
+        functional_range(1.0, 1.0, inclusive_lower_bound=True, inclusive_upper_bound=True),
+    ],
+    "gaps and missing ranges": [
+        functional_range(-1.0, -0.5),
+        {"range": None},
+        {},
+        functional_range(0.5, 1.0, inclusive_upper_bound=True),
+    ],
+    "infinite endpoints": [
+        functional_range(-math.inf, 0.0, inclusive_lower_bound=True),
+        functional_range(0.0, math.inf, inclusive_upper_bound=True),
+    ],
+    "no ranges": [],
+}
+
+SCORES = [
+    -math.inf,
+    -1e300,
+    -3.0,
+    -2.0,
+    -1.5,
+    -1.0,
+    -0.75,
+    -0.5,
+    -0.0,
+    0.0,
+    0.25,
+    0.5,
+    1.0,
+    1.5,
+    2.0,
+    2.5,
+    3.0,
+    5.0,
+    1e300,
+    math.inf,
+    math.nan,
+]
+
+
+@pytest.mark.parametrize("name", list(CALIBRATIONS))
+def test_classify_matches_score_lies_in_range(name):
+    functional_ranges = CALIBRATIONS[name]
+    index = ScoreRangeIndex(functional_ranges)
+    for score in SCORES:
+        assert index.classify(score) == first_range(score, functional_ranges), score
+
+
+@pytest.mark.parametrize("name", list(CALIBRATIONS))
+def test_classify_many_matches_score_lies_in_range(name):
+    functional_ranges = CALIBRATIONS[name]
+    index = ScoreRangeIndex(functional_ranges)
+    expected = [first_range(score, functional_ranges) for score in SCORES]
+    assert [
+        range_index if range_index >= 0 else None
+        for range_index in index.classify_many(SCORES).tolist()
+    ] == expected
+
+
+def test_classify_boundaries():
+    index = ScoreRangeIndex(CALIBRATIONS["shared boundaries, inclusive and exclusive"])
+    # -1.0 is the inclusive upper bound of the first range and the exclusive lower bound of the second.
+    assert index.classify(-1.0) == 0
+    assert index.classify(math.nextafter(-1.0, 0.0)) == 1
+    # 1.0 is the exclusive upper bound of the second range and the inclusive lower bound of the third.
+    assert index.classify(1.0) == 2
+    assert index.classify(math.nextafter(1.0, 0.0)) == 1
+    # 3.0 is the exclusive upper bound of the last range.
+    assert index.classify(3.0) is None
+    assert index.classify(math.nextafter(3.0, 0.0)) == 3
+
+
+def test_classify_nan_and_infinite_scores():
+    index = ScoreRangeIndex(CALIBRATIONS["open endpoints"])
+    # NaN fails every comparison, including those that would exclude it from a range, so it lies in the first range.
+    assert index.classify(math.nan) == 0
+    assert index.classify(-math.inf) == 0
+    assert index.classify(math.inf) == 1
+    assert index.classify_many([math.nan, -math.inf, math.inf]).tolist() == [0, 0, 1]